@@ -1,2 +1,2 @@
 
-__all__ = [ 'ribbon', 'maps', 'closedgraph', 'spider', 'pivotal', 'surface', 'knots', 'constellation' ]
+__all__ = [ 'ribbon', 'ribbonarray', 'maps', 'closedgraph', 'spider', 'pivotal', 'surface', 'packing', 'telemetry', 'knots', 'constellation', 'codec' ]
@@ -16,9 +16,17 @@ from collections import namedtuple
 
 Circle = namedtuple('Circle',['type','angle','boundary','halfedges'])
 
+# The cell structure of a closed graph. The first three entries are the
+# orbits, the next three map each half edge to the orbit containing it and
+# version is the version of the justgraph these were computed from.
+Cells = namedtuple('Cells',['vertices','edges','faces','vertex','edge','face',
+                            'euler','version'])
+
 from math import pi
+from array import array
 
 import spider # Only required for testing.
+import ribbon
 import surface
 import graphics
 
@@ -32,14 +40,20 @@ class ClosedGraph(object):
          EXAMPLES:
 
         >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> ClosedGraph(g.graph, g.outside, 'Tk')
+        Traceback (most recent call last):
+        ...
+        ValueError: Unknown geometry Tk
         """
 
         if set([a.e for a in g.he]) != set(g.he):
             raise ValueError, "e is not a bijection."
+        if not geometry in ['Euclidean','hyperbolic','spherical']:
+            raise ValueError, "Unknown geometry %s" % geometry
         if not bc in ['Dirichlet','Neumann','Cauchy']:
-            raise ValueError, boundary_condition
+            raise ValueError, "Unknown boundary condition %s" % bc
 
-        fc = g.get_orbits( lambda a: a.e.c )
+        fc = g.faces
         ot = set(outside)
         if not any( set(x) == ot for x in fc ):
             raise ValueError("Second argument is not a face.")
@@ -55,9 +69,10 @@ class ClosedGraph(object):
         self.name = name
         self.options = options
 
+        face = self.cells.face
         for a in self.faces:
             for x in a:
-                if x.e in a:
+                if face[x.e] is a:
                     print "There is a problem with a face."
                     return
        
@@ -69,139 +84,227 @@ class ClosedGraph(object):
         self.triangles = self.set_triangles()
 
     def set_circles(self):
-        if hasattr(self, 'circles'):
-            print "Why are you calling the function closedgraph.ClosedGraph.get_circles()?"
-
-        Fcircles = [ Circle('FC',2*pi,False,frozenset(x)) for x in self.faces ]
-        Fcircles.remove(Circle('FC',2*pi,False,frozenset(self.outside)))
-
-        if self.boundary_condition == 'Dirichlet':
-            if self.geometry == 'hyperbolic':
-                boundary = self.outside + [ a.e for a in self.outside ]
-                inside = [ a for a in self.graph.he if not a in boundary ]
-
-                vertices = self.graph.vertices
-                in_vertices = [ x for x in vertices if set(x).issubset(inside) ]
-                out_vertices = [ x for x in vertices if not x in in_vertices ]
-                if len(vertices) != len(out_vertices) + len(in_vertices):
-                    raise RuntimeError
-
-                corners = [ x for x in out_vertices if len(x) == 2 ]
-                #bd_vertices = [ x for x in out_vertices if len(x) == 3 ]
-                bd_vertices = [ x for x in out_vertices if not x in corners ]
-                C = len(corners)
-                B = len(bd_vertices)
-                if len(out_vertices) != C + B:
-                    raise RuntimeError
-
-                CRcircles = [ Circle('CR', (1-2.0/C)*pi,False, frozenset(x)) for x in corners ]
-                BVcircles = [ Circle('BV',pi,False,frozenset(x)) for x in bd_vertices ]
-                IVcircles = [ Circle('IV',2*pi,False,frozenset(x)) for x in in_vertices ]
-                Vcircles  = CRcircles + BVcircles + IVcircles
-
-                edges = self.edges
-                bd_edges = [ x for x in edges if set(x).issubset(boundary) ]
-                BEcircles = [ Circle('BE',pi,False,frozenset(x)) for x in bd_edges ]
-                in_edges = [ x for x in edges if not set(x).issubset(boundary) ]
-                IEcircles = [ Circle('IE',2*pi,False,frozenset(x)) for x in in_edges ]
-                Ecircles = BEcircles + IEcircles
-
-            else:
-                raise NotImplementedError, 'Only hyperbolic geometry has been implemented.'
+        """Constructs the vertex, edge and face circles.
 
-        elif self.boundary_condition == 'Neumann':
-            boundary = self.outside + [ a.e for a in self.outside ]
-            inside = [ a for a in self.graph.he if not a in boundary ]
+        The circles are numbered in the order Vcircles + Ecircles + Fcircles
+        and the number of the circle of each vertex, edge and face is kept
+        for set_triangles(). Each half edge is visited a bounded number of
+        times.
 
-            vertices = self.graph.vertices
-            in_vertices = [ x for x in vertices if set(x).issubset(inside) ]
-            out_vertices = [ x for x in vertices if not x in in_vertices ]
-            if len(vertices) != len(out_vertices) + len(in_vertices):
-                raise RuntimeError
+        EXAMPLES:
 
-            corners = [ x for x in out_vertices if len(x) == 2 ]
-            #bd_vertices = [ x for x in out_vertices if len(x) == 3 ]
-            bd_vertices = [ x for x in out_vertices if not x in corners ]
-            C = len(corners)
-            B = len(bd_vertices)
-            if len(out_vertices) != C + B:
-                raise RuntimeError
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> [ len(x) for x in g.set_circles() ]
+        [15, 20, 6]
+        >>> sorted(set( c.type for c in g.Vcircles ))
+        ['BV', 'CR', 'IV']
 
-            CRcircles = [ Circle('CR', (1-2.0/C)*pi,False, frozenset(x)) for x in corners ]
-            BVcircles = [ Circle('BV',pi,False,frozenset(x)) for x in bd_vertices ]
-            IVcircles = [ Circle('IV',2*pi,False,frozenset(x)) for x in in_vertices ]
-            Vcircles  = CRcircles + BVcircles + IVcircles
+        """
+        if hasattr(self, 'circles'):
+            print "Why are you calling the function closedgraph.ClosedGraph.get_circles()?"
 
-            edges = self.edges
-            bd_edges = [ x for x in edges if set(x).issubset(boundary) ]
-            BEcircles = [ Circle('BE',pi,False,frozenset(x)) for x in bd_edges ]
-            in_edges = [ x for x in edges if not set(x).issubset(boundary) ]
-            IEcircles = [ Circle('IE',2*pi,False,frozenset(x)) for x in in_edges ]
-            Ecircles = BEcircles + IEcircles
+        g = self.graph
+        pv, pe, pf = [ g.orbits(x) for x in ('vertices','edges','faces') ]
 
-        elif self.boundary_condition == 'Cauchy':
-            print "These boundary conditions have not been implemented."
+        if self.geometry == 'spherical':
+            # The outside face is kept so the triangles cover the sphere.
+            V = [ ('IV',2*pi,False,i) for i in xrange(len(pv)) ]
+            E = [ ('IE',2*pi,False,i) for i in xrange(len(pe)) ]
+            F = [ ('FC',2*pi,False,i) for i in xrange(len(pf)) ]
 
         else:
-            raise RuntimeError, "This can't happen."
-
+            if self.boundary_condition == 'Dirichlet':
+                if self.geometry != 'hyperbolic':
+                    raise NotImplementedError, 'Only hyperbolic geometry has been implemented.'
+                # The boundary circles have fixed radii.
+                fixed = True
+            elif self.boundary_condition == 'Neumann':
+                fixed = False
+            elif self.boundary_condition == 'Cauchy':
+                raise NotImplementedError, "These boundary conditions have not been implemented."
+            else:
+                raise RuntimeError, "This can't happen."
+
+            boundary = set(self.outside)
+            boundary.update( a.e for a in self.outside )
+            out_vertices = set( pv.index[a] for a in boundary )
+            # An edge is on the boundary if both its half edges are.
+            count = dict()
+            for a in boundary:
+                i = pe.index[a]
+                count[i] = count.get(i,0) + 1
+            bd_edges = set( i for i in count if count[i] == len(pe[i]) )
+
+            corners = [ i for i in xrange(len(pv)) if i in out_vertices and len(pv[i]) == 2 ]
+            C = len(corners)
+            V = [ ('CR',(1-2.0/C)*pi,fixed,i) for i in corners ]\
+                + [ ('BV',pi,fixed,i) for i in xrange(len(pv))
+                    if i in out_vertices and len(pv[i]) != 2 ]\
+                + [ ('IV',2*pi,False,i) for i in xrange(len(pv))
+                    if not i in out_vertices ]
+            E = [ ('BE',pi,fixed,i) for i in xrange(len(pe)) if i in bd_edges ]\
+                + [ ('IE',2*pi,False,i) for i in xrange(len(pe)) if not i in bd_edges ]
+            outside = pf.index[self.outside[0]]
+            F = [ ('FC',2*pi,False,i) for i in xrange(len(pf)) if i != outside ]
+
+        # The number of the circle of each orbit; the outside face has none.
+        numbers = []
+        offset = 0
+        for X, p in ((V,pv), (E,pe), (F,pf)):
+            n = [None] * len(p)
+            for k, x in enumerate(X):
+                n[x[3]] = offset + k
+            offset += len(X)
+            numbers.append(n)
+        self._numbers = numbers
+
+        Vcircles = [ Circle(t,angle,b,frozenset(pv[i])) for t, angle, b, i in V ]
+        Ecircles = [ Circle(t,angle,b,frozenset(pe[i])) for t, angle, b, i in E ]
+        Fcircles = [ Circle(t,angle,b,frozenset(pf[i])) for t, angle, b, i in F ]
         return Vcircles, Ecircles, Fcircles
 
     def set_triangles(self):
+        """Constructs the triangles from the circle numbers recorded by
+        set_circles(). There are two triangles for each half edge which
+        is not in the outside face.
+
+        The circle numbers are also kept in self.tri, an integer array
+        with three entries for each triangle, which is used by the array
+        implementations in packing.py.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> len(g.triangles) == len(g.tri)/3 == 2*(len(g.graph.he) - len(g.outside))
+        True
+
+        """
         if hasattr(self, 'triangles'):
             print "Why are you calling the function closedgraph.ClosedGraph.get_triangles()?"
 
-        DV = dict()
-        for x in self.Vcircles:
-            for a in x.halfedges:
-                DV[a] = x
+        g = self.graph
+        vi, ei, fi = [ g.orbits(x).index for x in ('vertices','edges','faces') ]
+        vn, en, fn = self._numbers
 
-        DE = dict()
-        for x in self.Ecircles:
-            for a in x.halfedges:
-                DE[a] = x
+        inner = [ a for a in g.he if fn[fi[a]] != None ]
+        tri = array('i')
+        for a in inner:
+            tri.extend(( vn[vi[a]], en[ei[a]], fn[fi[a]] ))
+        for a in inner:
+            tri.extend(( vn[vi[a.e]], en[ei[a.e]], fn[fi[a]] ))
+        self.tri = tri
 
-        DF = dict()
-        for x in self.Fcircles:
-            for a in x.halfedges:
-                DF[a] = x
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        T = len(inner)
+        return [ (circles[tri[3*k]], circles[tri[3*k+1]], circles[tri[3*k+2]], k < T)
+                 for k in xrange(2*T) ]
 
-        if set(DV.keys()) != set(DE.keys()):
-            raise RuntimeError
-        #if set(DE.keys()) != set(DF.keys()).union(set(outside)):
-            #raise RuntimeError
 
-        return [(DV[a],DE[a],DF[a],True,) for a in DF]\
-                   + [(DV[a.e],DE[a.e],DF[a],False,) for a in DF]
+    @property
+    def cells(self):
+        """The cached cell structure of the closed graph.
+
+        This is computed once and recomputed only if the graph has been
+        modified by stitch() or normal() or invalidate() has been called.
+
+        EXAMPLES:
 
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> g.cells is g.cells
+        True
+        >>> a = g.outside[0]
+        >>> g.cells.face[a] == g.cells.face[g.outside[1]]
+        True
+        >>> g.cells.euler
+        2
+
+        """
+        c = getattr(self, '_cells', None)
+        if c == None or c.version != self.graph.version:
+            g = self.graph
+            orbits = [ g.orbits(x) for x in ('vertices','edges','faces') ]
+            lookups = [ dict( (a,p.orbits[i]) for a, i in p.index.iteritems() )
+                        for p in orbits ]
+            V, E, F = [ p.orbits for p in orbits ]
+            c = Cells(V, E, F, lookups[0], lookups[1], lookups[2],
+                      len(V) - len(E) + len(F), g.version)
+            self._cells = c
+        return c
+
+    def invalidate(self):
+        """Discards the cached cell structure.
+
+        Call this after modifying the half edges of the graph directly.
+        """
+        self.graph.touch()
+        self._cells = None
 
     @property
     def vertices(self):
-        return self.graph.get_orbits( lambda a: a.c )
+        return self.cells.vertices
 
     @property
     def edges(self):
-        return self.graph.get_orbits( lambda a: a.e )
+        return self.cells.edges
 
     @property
     def faces(self):
-        return self.graph.get_orbits( lambda a: a.e.c )
+        return self.cells.faces
 
     @property
     def genus(self):
-        chi = len(self.vertices) - len(self.edges) + len(self.faces)
+        chi = self.cells.euler
         if chi % 2 != 0:
             raise RuntimeError
         return 1 + chi/2
 
+    def subdivision(self):
+        """The medial subdivision of a closed graph.
+
+        OUTPUT: A closed graph and the map of half edges returned by
+        justgraph.subdivision()
+
+        The outside face of the subdivision is the face in the middle of
+        the outside face. The corners of the outside face are lost so this
+        is not useful with Neumann boundary conditions.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> h, inc = g.subdivision()
+        >>> len(h.outside) == len(g.outside)
+        True
+
+        """
+        g, inc = self.graph.subdivision()
+        # The half edge inc[a].e.c.c is in the middle face of the face of a.
+        outside = [ inc[a].e.c.c for a in self.outside ]
+        h = ClosedGraph(g, outside, self.geometry, self.boundary_condition,
+                        self.name, self.options)
+        return h, inc
+
+    def canonical(self):
+        """A hashable certificate for the closed graph. Two closed graphs
+        have the same certificate if and only if there is an isomorphism
+        of the graphs which maps the outside face to the outside face and
+        they have the same geometry and boundary conditions.
+
+        EXAMPLE:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> h = spider.RibbonGraph.polygon(5).closure()
+        >>> g.canonical() == h.canonical()
+        True
+
+        """
+        code = min( ribbon.canonical(self.graph, [a]) for a in self.outside )
+        return (self.geometry, self.boundary_condition, code)
+
     def anytadpole(self):
         """This checks if there is a tadpole which will cause problems when it
         comes to the drawing."""
-        faces = self.faces
-        for f in faces:
-            if any( a.e in f for a in f):
-                return True
-        return False
+        face = self.cells.face
+        return any( face[a.e] is face[a] for a in self.graph.he )
 
     def __latex__(self,options):
         surface.SurfaceComplex(self).show('Tikz','stdout')
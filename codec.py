@@ -0,0 +1,305 @@
+#*****************************************************************************
+#       Copyright (C) 2013 Bruce Westbury Bruce.Westbury@warwick.ac.uk
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#                  http://www.gnu.org/licenses/
+#*****************************************************************************
+
+"""
+Reading and writing codes for link diagrams.
+
+There are three codes:
+
+- 'DT': Dowker-Thistlewaite codes, see knots.DT
+- 'PD': planar diagram codes, a list of 4-tuples
+- 'braid': braid words, a list of non-zero integers
+
+The parsers accept the notations of KnotInfo and the Knot Atlas. Only
+the integers and the brackets are read so "[4, 6, 2]", "{4,6,2}" and
+"DTCode[4, 6, 2]" are the same. The writers use the notation of KnotInfo.
+All of these take time linear in the length of the code.
+
+The chirality is that of LinkDiagram.from_DT so the codes of the Knot
+Atlas give the mirror images of the knots listed there.
+A component with no crossings is left out of the DT and PD codes, and
+only a connected diagram has a braid word.
+
+EXAMPLES:
+
+>>> g = decode("[4, 6, 2]", 'DT')
+>>> encode(g, 'DT')
+'[4, 6, 2]'
+
+>>> g = decode("PD[X[1, 5, 2, 4], X[3, 1, 4, 6], X[5, 3, 6, 2]]", 'PD')
+>>> g.jones_polynomial()
+t + t^3 - t^4
+
+>>> g = decode("{1,1}", 'braid')
+>>> encode(g, 'DT')
+'[{4}, {2}]'
+
+"""
+
+import csv
+import re
+
+from knots import LinkDiagram, DT
+
+__all__ = [ 'read_DT', 'read_PD', 'read_braid', 'write_DT', 'write_PD',
+            'write_braid', 'decode', 'encode', 'read_table' ]
+
+_token = re.compile(r'-?\d+|[\[\]{}()]')
+
+def _parse(text):
+    """Parses the integers and brackets in a string as nested lists.
+
+    EXAMPLE:
+
+    >>> _parse("PD[X[1, 5, 2, 4], X[3, 1, 4, 6]]")
+    [[[1, 5, 2, 4], [3, 1, 4, 6]]]
+
+    """
+    stack = [[]]
+    for t in _token.findall(text):
+        if t in '[{(':
+            stack.append([])
+        elif t in ']})':
+            if len(stack) == 1:
+                raise ValueError("Unbalanced brackets in %r" % text)
+            x = stack.pop()
+            stack[-1].append(x)
+        else:
+            stack[-1].append(int(t))
+    if len(stack) != 1:
+        raise ValueError("Unbalanced brackets in %r" % text)
+    return stack[0]
+
+def _unwrap(x):
+    """Removes the brackets around a single list."""
+    while len(x) == 1 and isinstance(x[0], list):
+        x = x[0]
+    return x
+
+def read_DT(text):
+    """Reads a Dowker-Thistlewaite code.
+
+    OUTPUT: An instance of DT.
+
+    EXAMPLES:
+
+    >>> read_DT("[4, 6, 2]").code
+    [4, 6, 2]
+
+    >>> read_DT("[{6, 8}, {2, 4}]").code
+    [[6, 8], [2, 4]]
+
+    """
+    return DT(_unwrap(_parse(text)))
+
+def read_PD(text):
+    """Reads a planar diagram code.
+
+    OUTPUT: A list of 4-tuples.
+
+    EXAMPLE:
+
+    >>> read_PD("[[1,5,2,4],[3,1,4,6],[5,3,6,2]]")
+    [(1, 5, 2, 4), (3, 1, 4, 6), (5, 3, 6, 2)]
+
+    """
+    output = []
+    stack = [_parse(text)]
+    while stack:
+        x = stack.pop()
+        if all( isinstance(k, list) for k in x ):
+            stack.extend(reversed(x))
+        elif len(x) == 4 and not any( isinstance(k, list) for k in x ):
+            output.append(tuple(x))
+        else:
+            raise ValueError("Not a planar diagram code: %r" % text)
+    return output
+
+def read_braid(text):
+    """Reads a braid word.
+
+    The Knot Atlas gives the number of strands first, as in "BR[3,{1,1}]",
+    and this is ignored.
+
+    OUTPUT: A list of non-zero integers.
+
+    EXAMPLES:
+
+    >>> read_braid("{1,-2,1,-2}")
+    [1, -2, 1, -2]
+
+    >>> read_braid("BR[3, {-1, 2, -1, 2}]")
+    [-1, 2, -1, 2]
+
+    """
+    x = _unwrap(_parse(text))
+    lists = [ k for k in x if isinstance(k, list) ]
+    if len(lists) == 1:
+        x = lists[0]
+    elif lists:
+        raise ValueError("Not a braid word: %r" % text)
+    if not x or 0 in x or any( isinstance(k, list) for k in x ):
+        raise ValueError("Not a braid word: %r" % text)
+    return x
+
+def write_DT(code):
+    """Writes a Dowker-Thistlewaite code.
+
+    INPUT: An instance of DT or a list.
+
+    EXAMPLES:
+
+    >>> write_DT(DT([4,6,2]))
+    '[4, 6, 2]'
+
+    >>> write_DT([[6, 8], [2, 4]])
+    '[{6, 8}, {2, 4}]'
+
+    """
+    if isinstance(code, DT):
+        code = code.code
+    if any( isinstance(x, list) for x in code ):
+        return '[' + ', '.join( '{' + ', '.join(map(str, x)) + '}'
+                                for x in code ) + ']'
+    return '[' + ', '.join(map(str, code)) + ']'
+
+def write_PD(pd):
+    """Writes a planar diagram code.
+
+    EXAMPLE:
+
+    >>> write_PD([(1, 5, 2, 4), (3, 1, 4, 6), (5, 3, 6, 2)])
+    '[[1,5,2,4],[3,1,4,6],[5,3,6,2]]'
+
+    """
+    return '[' + ','.join( '[' + ','.join(map(str, x)) + ']'
+                           for x in pd ) + ']'
+
+def write_braid(word):
+    """Writes a braid word.
+
+    EXAMPLE:
+
+    >>> write_braid([1, -2, 1, -2])
+    '{1,-2,1,-2}'
+
+    """
+    return '{' + ','.join(map(str, word)) + '}'
+
+_decoders = {
+    'DT': lambda text: LinkDiagram.from_DT(read_DT(text)),
+    'PD': lambda text: LinkDiagram.from_PlanarDiagram(read_PD(text)),
+    'braid': lambda text: LinkDiagram.from_braid(read_braid(text))
+    }
+
+_encoders = {
+    'DT': lambda g: write_DT(g.DT_code),
+    'PD': lambda g: write_PD(g.planar_diagram),
+    'braid': lambda g: write_braid(g.braid_word)
+    }
+
+def decode(text, kind):
+    """Constructs a link diagram from a code.
+
+    INPUT: A string and one of 'DT', 'PD' or 'braid'.
+
+    OUTPUT: An instance of LinkDiagram.
+
+    A link given by a DT code must go through 'PD' or 'braid' since
+    LinkDiagram.from_DT only constructs knots.
+    """
+    if not kind in _decoders:
+        raise ValueError("Unknown code %r" % kind)
+    return _decoders[kind](text)
+
+def encode(g, kind):
+    """Writes a code for a link diagram.
+
+    INPUT: An instance of LinkDiagram and one of 'DT', 'PD' or 'braid'.
+
+    EXAMPLE:
+
+    >>> g = LinkDiagram.from_braid([1,1,1])
+    >>> decode(encode(g, 'PD'), 'PD').jones_polynomial()
+    t + t^3 - t^4
+
+    """
+    if not kind in _encoders:
+        raise ValueError("Unknown code %r" % kind)
+    return _encoders[kind](g)
+
+def read_table(source, kind, column=None, name=0, delimiter=None):
+    """Reads a table of codes one row at a time.
+
+    INPUT:
+
+    - source: a file name or an iterable of lines
+    - kind: one of 'DT', 'PD' or 'braid'
+    - column: None for lines of the form "name code", otherwise the
+      column of the code in a CSV file
+    - name: the column of the name in a CSV file
+    - delimiter: the delimiter of a CSV file, the default is ','
+
+    A column given by a string is looked up in the header row.
+    In a text file blank lines and lines starting with '#' are skipped.
+    Rows with an empty code, such as the unknot, are skipped.
+
+    OUTPUT: A generator of pairs (name, diagram). Only one row is held
+    in memory at a time so this can be used on large tables.
+
+    EXAMPLES:
+
+    >>> from StringIO import StringIO
+    >>> f = StringIO("# name DT\\n3_1 [4, 6, 2]\\n\\n4_1 [4, 6, 8, 2]\\n")
+    >>> [ (k, g.no_components) for k, g in read_table(f, 'DT') ]
+    [('3_1', 1), ('4_1', 1)]
+
+    >>> f = StringIO('name,braid\\nL2a1,"{1,1}"\\n')
+    >>> [ (k, g.no_components) for k, g in read_table(f, 'braid', 'braid', 'name') ]
+    [('L2a1', 2)]
+
+    """
+    if isinstance(source, basestring):
+        f = open(source, 'rb')
+        try:
+            for x in read_table(f, kind, column, name, delimiter):
+                yield x
+        finally:
+            f.close()
+        return
+
+    if not kind in _decoders:
+        raise ValueError("Unknown code %r" % kind)
+    decoder = _decoders[kind]
+
+    if column == None:
+        for line in source:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            x = line.split(None, 1)
+            if len(x) == 2:
+                yield x[0], decoder(x[1])
+        return
+
+    rows = csv.reader(source, delimiter=delimiter or ',')
+    if isinstance(column, basestring) or isinstance(name, basestring):
+        header = [ x.strip() for x in next(rows) ]
+        if isinstance(column, basestring):
+            column = header.index(column)
+        if isinstance(name, basestring):
+            name = header.index(name)
+    for row in rows:
+        if len(row) <= column or not row[column].strip():
+            continue
+        yield row[name], decoder(row[column])
+
+# This is to run the tests in the examples.
+# http://docs.python.org/library/doctest.html
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
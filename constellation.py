@@ -58,7 +58,6 @@ from collections import namedtuple
 
 Circle = namedtuple('Circle',['type','points'])
 
-from math import pi, sin, cos, acos
 from cmath import rect
 
 def get_orbits(perm):
@@ -303,6 +302,7 @@ class HyperMap(object):
             flags[(i,'FE',)].decorations = ribbon.Features('neither','green',True)
             flags[(i,'EF',)].decorations = ribbon.Features('neither','green',True)
             
+        self.flags = flags
         g = ribbon.justgraph(set(flags.values()))
 
         a = self.faces[0]
@@ -374,51 +374,43 @@ class HyperMap(object):
             name = name)
 
     def layout(self):
-        """This makes the following assumptions:
+        """Packs the triangulation of the sphere given by the hypermap
+        and lays it out in the plane by stereographic projection.
+
+        This makes the following assumptions:
          * The hypermap is connected
          * The hypermap has genus zero
-         * The permutation phi is a complete cycle
+
+        The triangulation is the closed graph of self.map() in spherical
+        geometry, so each black vertex, white vertex and face is a circle.
+        This sets self.surface to the SurfaceComplex, self.radius to the
+        spherical radii of the circles in Bcircles, Wcircles and Fcircles
+        and self.centre to their centres after stereographic projection.
+
+        EXAMPLES:
+
+        >>> h = interval(4); h.layout()
+        >>> len(h.centre) == len(h.Bcircles + h.Wcircles + h.Fcircles)
+        True
+
         """
-        print "Using constellation.layout()."
-        
         self.get_triangles()
 
+        g = self.map()[0]
+        # In spherical geometry any face can be taken as the outside.
+        out = list( g.get_orbits( lambda a: a.e.c )[0] )
+        sc = SurfaceComplex(closedgraph.ClosedGraph(g, out, 'spherical'))
+        sc.layout()
+        sc.index()
+
+        labels = { 'BV':'VE', 'WV':'EV', 'FC':'FE' }
         circles = self.Bcircles + self.Wcircles + self.Fcircles
-        radius = dict( (c,1) for c in circles )
-
-        # Dictionary for number of neighbours
-        nb = dict( (c,len([ t for t in self.triangles if c in t ])) for c in circles )
-
-        # Dictionary for number used for correction.
-        fc = dict( ( c, 1-1/sin(pi/nb[c]) ) for c in circles )
-
-        angle = {}
-
-        packing = False
-        count = 0
-        while not packing:
-            packing = True
-            count += 1
-            for c in circles:
-                angle[c] = 0.0
-
-            for t in self.triangles:
-                u = [ radius[t[i]] for i in range(3) ]
-                a = [ u[i-2]+u[i-1] for i in range(3) ]
-                # see Stephenson p. 57 for spherical formulae
-                for i in range(3):
-                    num = cos(a[i])-cos(a[i-1])*cos(a[i-2])
-                    den = sin(a[i-1])*sin(a[i-2])
-                    angle[t[i]] += acos( num/den )
-
-            for c in circles:
-                s = sin( angle[c]/(2*nb[c]) )
-                r = radius[c] * fc[c] * s / (s-1)
-                if abs(r-radius[c]) > HyperMap.error:
-                    packing = False
-                radius[c] = r
-
-        self.radius = radius
+        D = dict( (c,sc.vertex_circle[self.flags[(min(c.points),labels[c.type],)]]) \
+                  for c in circles )
+
+        self.surface = sc
+        self.radius = dict( (c,sc.radius[D[c]]) for c in circles )
+        self.centre = dict( (c,sc.centre[D[c]]) for c in circles )
 
 def star(n):
     """Constructs the hypermap corresponding to the star with n points."""
@@ -110,8 +110,7 @@ class Graphics():
         circles = g.Vcircles + g.Ecircles + g.Fcircles
 
         for c in circles:
-            z = g.centre[c]
-            r = g.radius[c]
+            z, r = g.euclidean_circle(c)
             x = g.transform(z)
             scale = g.transform(1)[0]-g.transform(0)[0]
             self.circle(x[0], x[1], r*scale, 'yellow')
@@ -119,18 +118,17 @@ class Graphics():
     def draw_medial(self, g):
         """Draws a filled polygon in each face."""
 
+        g.index()
         for c in g.Fcircles:
             if len(c.halfedges) > 2:
                 p = []
                 for a in c.halfedges:
-                    x = [ cr for cr in g.Ecircles if  a in cr.halfedges ]
-                    p.append(g.transform(g.centre[x[0]]))
+                    p.append(g.transform(g.centre[g.edge_circle[a]]))
                 self.polygon(p, 'purple')
             elif  len(c.halfedges) == 2:
-                x0 = [ cr for cr in g.Ecircles if  list(c.halfedges)[0] in cr.halfedges ]
-                x1 = [ cr for cr in g.Ecircles if  list(c.halfedges)[1] in cr.halfedges ]
-                z0 = g.transform(g.centre[x0[0]])
-                z1 = g.transform(g.centre[x1[0]])
+                x0, x1 = [ g.edge_circle[a] for a in c.halfedges ]
+                z0 = g.transform(g.centre[x0])
+                z1 = g.transform(g.centre[x1])
                 self.line(z0[0], z0[1], z1[0], z1[1], 'purple', False)
 
     def draw_triangles(self, g):
@@ -152,8 +150,7 @@ class Graphics():
             return (z*z.conjugate()).real
 
         for tri in g.triangles:
-            p = [ g.centre[tri[i]] for i in range(3) ]
-            r = [ g.radius[tri[i]] for i in range(3) ]
+            p, r = zip(*[ g.euclidean_circle(tri[i]) for i in range(3) ])
             M11 = p[1].real-p[0].real
             M12 = p[1].imag-p[0].imag
             M21 = p[2].real-p[1].real
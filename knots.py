@@ -35,20 +35,26 @@ import ribbon
 import pivotal
 import closedgraph
 
-from itertools import product
+from itertools import product, count
+from fractions import gcd, Fraction
+from collections import namedtuple
+from heapq import heappush, heappop
 
 in_over = ribbon.Features('head','blue',True)
 in_under = ribbon.Features('head','blue',False)
 out_over = ribbon.Features('tail','blue',True)
 out_under = ribbon.Features('tail','blue',False)
 
+LinkIndex = namedtuple('LinkIndex',['arcs','arc','circles','circle',
+                                    'crossings','crossing','version'])
+
 class LinkDiagram(closedgraph.ClosedGraph):
 
     def __init__(self,g,outside):
         if set([a.e for a in g.he]) != set(g.he):
             raise ValueError("e is not a bijection.")
 
-        fc = g.get_orbits( lambda a: a.e.c )
+        fc = g.faces
         ot = set(outside)
         if not any( set(x) == ot for x in fc ):
             raise ValueError("Second argument is not a face.")
@@ -141,6 +147,8 @@ class LinkDiagram(closedgraph.ClosedGraph):
             http://katlas.org/wiki/DT_%28Dowker-Thistlethwaite%29_Codes
         """
 
+        if DT.is_link:
+            raise NotImplementedError("Only knots can be constructed from a DT code, use from_PlanarDiagram()")
         emb = DT.orientation
 
         m = 2 * len(emb)
@@ -191,14 +199,54 @@ class LinkDiagram(closedgraph.ClosedGraph):
 
         """
 
-        b = pivotal.braid(word)
-
-        g = b.graph
-        for u, v in zip( b.domain, b.codomain ):
-            g.stitch(u,v)
-        g.normal()
-
-        u = b.domain[0]
+        if not word or 0 in word:
+            raise ValueError("Not a valid braid word")
+
+        # The crossings are made directly, as in pivotal.Artin_generator,
+        # and joined along the strands so this is linear in the word.
+        n = max( map(abs, word) ) + 1
+        first = [None] * n
+        last = [None] * n
+        he = []
+        for k in word:
+            p = abs(k)
+            x = [ ribbon.halfedge() for i in range(4) ]
+            for i in range(4):
+                x[i-1].c = x[i]
+            if k > 0:
+                x[0].decorations = in_over
+                x[1].decorations = in_under
+                x[2].decorations = out_over
+                x[3].decorations = out_under
+            else:
+                x[0].decorations = in_under
+                x[1].decorations = in_over
+                x[2].decorations = out_under
+                x[3].decorations = out_over
+            for q, a, b in ((p-1, x[0], x[3]), (p, x[1], x[2])):
+                if last[q] == None:
+                    first[q] = a
+                else:
+                    last[q].e = a
+                    a.e = last[q]
+                last[q] = b
+            he.extend(x)
+
+        for q in xrange(n):
+            if last[q] == None:
+                # A strand with no crossings is a loop with one vertex.
+                a = ribbon.halfedge(in_over)
+                b = ribbon.halfedge(out_over)
+                a.c = b; b.c = a
+                a.IsI = True; b.IsI = True
+                first[q] = a
+                last[q] = b
+                he.extend([a, b])
+            last[q].e = first[q]
+            first[q].e = last[q]
+
+        g = ribbon.justgraph(he, True)
+        u = first[0]
         outside = [u]
         s = u.e.c
         while s != u:
@@ -238,35 +286,71 @@ class LinkDiagram(closedgraph.ClosedGraph):
         """
         if not all([ len(x) == 4 for x in PD ]):
             raise ValueError("Not a valid planar diagram code")
-        for i in range(2*len(PD)):
-            p = [ x for x in PD if i+1 in x ]
-            if len(p) != 2:
-                raise ValueError("Not a valid planar diagram code")
+        PD = [ tuple(x) for x in PD ]
+
+        # The two places where each label occurs.
+        ends = dict()
+        for i, x in enumerate(PD):
+            for j, k in enumerate(x):
+                ends.setdefault(k, []).append( (i, j) )
+        if len(ends) != 2*len(PD) or any( len(p) != 2 for p in ends.itervalues() ):
+            raise ValueError("Not a valid planar diagram code")
 
-        D = dict()
-        he = set()
-        for x in PD:
-            a = [ ribbon.halfedge() for i in range(4) ]
-            for i in range(4):
-                a[i-1].c = a[i]
-            D[tuple(x)] = a
-            he = he.union(set(a))
-
-        for i in range(2*len(PD)):
-            p = [ x for x in PD if i+1 in x ]
-            a0 = D[tuple(p[0])][p[0].index(i+1)]
-            a1 = D[tuple(p[1])][p[1].index(i+1)]
+        def other(i, j):
+            p = ends[PD[i][j]]
+            return p[1] if p[0] == (i, j) else p[0]
+
+        # The position of the incoming over edge of each crossing. This
+        # is known if an over edge has its other end under. Otherwise it
+        # is followed along the over strand or, if there is none, taken
+        # from the labels as in the Knot Atlas.
+        into = [None] * len(PD)
+        for i in xrange(len(PD)):
+            for j in (1, 3):
+                q = other(i, j)[1]
+                if q == 0:
+                    into[i] = 4 - j
+                elif q == 2:
+                    into[i] = j
+        queue = [ i for i in xrange(len(PD)) if into[i] != None ]
+        for i in xrange(len(PD)):
+            if into[i] == None:
+                j, l = PD[i][1], PD[i][3]
+                into[i] = 1 if l - j == 1 or j - l > 1 else 3
+                queue.append(i)
+            while queue:
+                k = queue.pop()
+                for j, arrives in ( (4 - into[k], True), (into[k], False) ):
+                    m, q = other(k, j)
+                    if q in (1, 3) and into[m] == None:
+                        into[m] = q if arrives else 4 - q
+                        queue.append(m)
+
+        a = [ [ ribbon.halfedge() for i in range(4) ] for x in PD ]
+        for i, x in enumerate(PD):
+            y = a[i]
+            for j in range(4):
+                y[j-1].c = y[j]
+            y[0].decorations = in_under
+            y[2].decorations = out_under
+            y[into[i]].decorations = in_over
+            y[4 - into[i]].decorations = out_over
+
+        for p, q in ends.itervalues():
+            a0 = a[p[0]][p[1]]
+            a1 = a[q[0]][q[1]]
             a0.e = a1
             a1.e = a0
 
-        g = ribbon.justgraph(he)
+        g = ribbon.justgraph( [ h for y in a for h in y ] )
         outside = g.get_orbits( lambda a: a.e.c )[0]
         return LinkDiagram(g,outside)
 
     @property
     def _components(self):
-        m = lambda a: a.e.c.c
-        return self.graph.get_orbits(m)
+        # A vertex with two half edges is on a loop with no crossings.
+        m = lambda a: a.e.c if a.e.c.c == a.e else a.e.c.c
+        return self.graph.orbits('components', m).orbits
 
     # Could draw components in different colours.
     @property
@@ -284,11 +368,90 @@ class LinkDiagram(closedgraph.ClosedGraph):
 
         return len(self._components)/2
 
+    def _loops(self):
+        """The number of components which have no crossings."""
+        C = self.index.crossing
+        return len([ x for x in self._components
+                     if not any( a in C for a in x ) ])/2
+
+    def _passes(self):
+        """The passes through the crossings, labelled as for DT codes.
+
+        OUTPUT: A pair. The first is a list with a list for each component
+        of the incoming half edges met in turn along the component. The
+        second is a dictionary from these half edges to their labels.
+
+        Each component meets a component already labelled, when it can,
+        and it starts so that at each crossing one label is odd and the
+        other is even.
+        """
+        pair = dict()
+        for (a, b, c, d, sign) in self.index.crossings:
+            h = b if b.decorations.directed == 'head' else d
+            pair[a] = h
+            pair[h] = a
+
+        components = []
+        component = dict()
+        for h in pair:
+            if not h in component:
+                x = []
+                s = h
+                while True:
+                    component[s] = len(components)
+                    x.append(s)
+                    s = s.c.c.e
+                    if s == h:
+                        break
+                components.append(x)
+
+        # Take the components in an order in which each one meets one
+        # of the previous components, if the diagram is connected.
+        order = []
+        seen = set()
+        for k in xrange(len(components)):
+            if k in seen:
+                continue
+            seen.add(k)
+            queue = [k]
+            while queue:
+                m = queue.pop(0)
+                order.append(m)
+                for h in components[m]:
+                    l = component[pair[h]]
+                    if not l in seen:
+                        seen.add(l)
+                        queue.append(l)
+
+        output = []
+        label = dict()
+        for m in order:
+            x = components[m]
+            n = len(label) + 1
+            if n == 1:
+                # from_DT() takes the other incoming half edge to follow
+                # the first one in the order of c.
+                j = [ h.c == pair[h] for h in x ].index(True)
+                x = x[j:] + x[:j]
+            for j, h in enumerate(x):
+                if pair[h] in label:
+                    if (n + j - label[pair[h]]) % 2 == 0:
+                        x = x[1:] + x[:1]
+                    break
+            for j, h in enumerate(x):
+                label[h] = n + j
+            output.append(x)
+        return output, label
+
     @property
     def DowkerThistlewaite(self):
-        """Computes a Dowker-Thistlewaite code of a knot diagram.
+        """Computes the sequence of crossings met along a link diagram.
 
-        EXAMPLE:
+        OUTPUT: For a knot a list of the crossings met in turn, numbered
+        in the order they are first met. For a link a list of these lists,
+        one for each component.
+
+        EXAMPLES:
 
         >>> c = DT([4,6,8,2])
         >>> g = LinkDiagram.from_DT(c)
@@ -296,35 +459,136 @@ class LinkDiagram(closedgraph.ClosedGraph):
         >>> a in [[1, 2, 3, 1, 4, 3, 2, 4],[1, 2, 3, 4, 2, 1, 4, 3]]
         True
 
+        >>> g = LinkDiagram.from_braid([1,1])
+        >>> [ sorted(x) for x in g.DowkerThistlewaite ]
+        [[1, 2], [1, 2]]
+
         """
-        cp = self._components
-        if len(cp) > 2:
-            raise ValueError("This has only been implemented for knots.")
+        X = self.index.crossing
+        D = dict()
+        output = []
+        for c in self._passes()[0]:
+            for a in c:
+                if not X[a] in D:
+                    D[X[a]] = len(D) + 1
+            output.append( [ D[X[a]] for a in c ] )
+        if len(output) == 1:
+            return output[0]
+        return output
 
-        c = cp[0]
-        vt = self.vertices
-        DV = dict()
-        for x in vt:
-            for a in x:
-                DV[a] = x
-        count = 0
-        D = dict([ (x,None) for x in vt ])
+    @property
+    def DT_code(self):
+        """Computes a Dowker-Thistlewaite code of a link diagram.
 
-        for a in c:
-            if D[DV[a]] == None:
-                count += 1
-                D[DV[a]] = count
+        OUTPUT: An instance of DT. For a link the code is a list with a
+        list for each component.
 
-        return [ D[DV[a]] for a in c ]
+        The crossings are met along the components and labelled in turn.
+        At each crossing one label is odd and the other is even. The code
+        lists the even label paired with each odd label, negated if the
+        even label is over. This is the convention of from_DT().
 
+        EXAMPLES:
+
+        >>> g = LinkDiagram.from_DT(DT([6,8,10,2,4]))
+        >>> [ abs(k) for k in g.DT_code.code ]
+        [6, 8, 10, 2, 4]
+        >>> LinkDiagram.from_DT(g.DT_code).jones_polynomial()
+        t^2 + t^4 - t^5 + t^6 - t^7
+
+        >>> [ map(abs, x) for x in LinkDiagram.from_braid([1,1]).DT_code.code ]
+        [[4], [2]]
+
+        A diagram with more than one block of crossings, such as a
+        connected sum, is not determined by its code. Then from_DT() may
+        reflect some of the blocks.
+
+        """
+        components, label = self._passes()
+        over = dict( (label[a], a.decorations.over) for a in label )
+        pair = dict()
+        for (a, b, c, d, sign) in self.index.crossings:
+            h = b if b.decorations.directed == 'head' else d
+            pair[label[a]] = label[h]
+            pair[label[h]] = label[a]
+        if any( (k - pair[k]) % 2 == 0 for k in pair ):
+            raise ValueError("This diagram does not have a DT code.")
+
+        code = []
+        for c in components:
+            x = []
+            for a in c:
+                k = label[a]
+                if k % 2 == 1:
+                    x.append( pair[k] if over[k] else -pair[k] )
+            code.append(x)
+        if len(code) == 1:
+            return DT(code[0])
+        return DT(code)
 
     @property
     def meander_word(self):
-        pass
+        """Computes the signed Gauss word of a link diagram.
+
+        OUTPUT: As for DowkerThistlewaite, except that a crossing is
+        negated when it is met on the under strand.
+
+        EXAMPLE:
+
+        >>> w = LinkDiagram.from_DT(DT([4,6,2])).meander_word
+        >>> sorted(w)
+        [-3, -2, -1, 1, 2, 3]
+
+        """
+        X = self.index.crossing
+        D = dict()
+        output = []
+        for c in self._passes()[0]:
+            x = []
+            for a in c:
+                if not X[a] in D:
+                    D[X[a]] = len(D) + 1
+                x.append( D[X[a]] if a.decorations.over else -D[X[a]] )
+            output.append(x)
+        if len(output) == 1:
+            return output[0]
+        return output
 
     @property
     def planar_diagram(self):
-        pass
+        """Computes the planar diagram code of a link diagram.
+
+        OUTPUT: A list of 4-tuples, one for each crossing
+
+        The edges are labelled along the components by the label of the
+        pass at their end, as for DT_code. Each crossing lists the labels
+        of its edges in the order of c, starting with the incoming under
+        edge, which is the convention of the Knot Atlas. This is the
+        inverse of from_PlanarDiagram().
+
+        EXAMPLES:
+
+        >>> x = LinkDiagram.from_DT(DT([4,6,2])).planar_diagram
+        >>> len(x), sorted( k for y in x for k in y ) == sorted(range(1,7)*2)
+        (3, True)
+
+        >>> x = LinkDiagram.from_braid([1,-2,1,-2]).planar_diagram
+        >>> LinkDiagram.from_PlanarDiagram(x).jones_polynomial()
+        t^-2 - t^-1 + 1 - t + t^2
+
+        """
+        components, label = self._passes()
+        def edge(a):
+            return label[a] if a in label else label[a.e]
+
+        output = []
+        for c in components:
+            for a in c:
+                if not a.decorations.over:
+                    output.append( (edge(a), edge(a.c), edge(a.c.c),
+                                    edge(a.c.c.c)) )
+        output.sort()
+        return output
 
     def reverse_orientation(self):
         """Reverses the crossings of a LinkDiagram.
@@ -392,16 +656,18 @@ class LinkDiagram(closedgraph.ClosedGraph):
         he = phi.codomain.he.union(psi.codomain.he)
 
         u = phi.map[self.outside[0]]
-        v = psi.map[other.outside[0]]
+        # The edges which are joined must be oriented the same way.
+        w = [ a for a in other.outside
+              if a.decorations.directed == u.decorations.directed ]
+        if not w:
+            # Any face of the other diagram can be taken as its outside.
+            w = [ a for a in other.graph.he
+                  if a.decorations.directed == u.decorations.directed ]
+        v = psi.map[w[0]]
         x = u.e; y = v.e
 
-        if u.decorations.over == v.decorations.over:
-            u.e = y; y.e = u
-            v.e = x; x.e = v
-        else:
-            u.e = x; x.e = u
-            v.e = y; y.e = v
-
+        u.e = y; y.e = u
+        v.e = x; x.e = v
 
         outside = [u]
         s = u.e.c
@@ -425,7 +691,215 @@ class LinkDiagram(closedgraph.ClosedGraph):
 
 
     def colourings(self,n):
-        pass
+        """Generates the Fox n-colourings of the LinkDiagram.
+
+        INPUT: An integer n at least 2
+
+        OUTPUT: An iterator over lists of labels of the arcs, in the order
+        of self.arcs
+
+        The arcs are labelled in turn and after each choice any crossing
+        with one unlabelled arc determines that label, when it is unique.
+
+        EXAMPLE:
+
+        >>> g = LinkDiagram.from_DT(DT([4,6,2]))
+        >>> len(list(g.colourings(3))) == g.fox_colourings(3)
+        True
+
+        """
+        m = len(self.arcs)
+        rows = self.fox_matrix()
+        # For each arc the crossings it meets.
+        meets = [ [] for i in xrange(m) ]
+        for r in rows:
+            for i in set(r):
+                meets[i].append(r)
+        label = [None] * m
+
+        def propagate(i, stack):
+            queue = [i]
+            while queue:
+                for (x, y, z) in meets[queue.pop()]:
+                    # The coefficients of the relation 2x - y - z.
+                    coeff = {x: 0, y: 0, z: 0}
+                    coeff[x] += 2; coeff[y] -= 1; coeff[z] -= 1
+                    unknown = [ j for j in coeff if label[j] == None ]
+                    known = sum( c*label[j] for j, c in coeff.iteritems()
+                                 if label[j] != None )
+                    if not unknown:
+                        if known % n != 0:
+                            return False
+                    elif len(unknown) == 1:
+                        j = unknown[0]
+                        u = inverse(coeff[j], n)
+                        if u != None:
+                            label[j] = (-known * u) % n
+                            stack.append(j)
+                            queue.append(j)
+            return True
+
+        def search(k):
+            while k < m and label[k] != None:
+                k += 1
+            if k == m:
+                if all( (2*label[x] - label[y] - label[z]) % n == 0
+                        for (x, y, z) in rows ):
+                    yield list(label)
+                return
+            for v in xrange(n):
+                label[k] = v
+                stack = [k]
+                if propagate(k, stack):
+                    for c in search(k+1):
+                        yield c
+                for j in stack:
+                    label[j] = None
+
+        return search(0)
+
+    def fox_matrix(self):
+        """The crossing relations of the Fox colourings.
+
+        OUTPUT: A list with a triple for each crossing. The triple is
+        the index in self.arcs of the over arc and the two under arcs.
+        A labelling x is a colouring if 2x[a] - x[b] - x[c] = 0 for
+        each triple (a,b,c).
+
+        EXAMPLE:
+
+        >>> g = LinkDiagram.from_DT(DT([4,6,2]))
+        >>> len(g.fox_matrix())
+        3
+
+        """
+        label = self.index.arc
+        rows = []
+        for (a, b, c, d, sign) in self.index.crossings:
+            if label[a] != label[c]:
+                raise RuntimeError
+            rows.append( (label[a], label[b], label[d]) )
+        return rows
+
+    def fox_colourings(self,n):
+        """Counts the Fox n-colourings of the LinkDiagram.
+
+        INPUT: An integer n at least 2
+
+        OUTPUT: The number of labellings of the arcs by Z/n such that at
+        each crossing twice the label of the over arc is the sum of the
+        labels of the under arcs. This is a link invariant.
+
+        The relation matrix is diagonalised over the integers. If the
+        diagonal entries are d then the number of colourings is the
+        product of gcd(d,n), where the missing entries are 0.
+
+        EXAMPLES:
+
+        >>> g = LinkDiagram.from_DT(DT([4,6,2]))
+        >>> g.fox_colourings(3)
+        9
+        >>> g = LinkDiagram.from_DT(DT([4,6,8,2]))
+        >>> g.fox_colourings(3), g.fox_colourings(5)
+        (3, 25)
+
+        """
+        m = len(self.arcs)
+        A = []
+        for (x, y, z) in self.fox_matrix():
+            r = [0] * m
+            r[x] += 2
+            r[y] -= 1
+            r[z] -= 1
+            A.append(r)
+        count = 1
+        for d in diagonal(A, m):
+            count *= gcd(d, n)
+        return count
+
+    @property
+    def index(self):
+        """The cached arcs, Seifert circles and crossings of the diagram.
+
+        OUTPUT: An instance of LinkIndex. The fields are
+
+        - arcs, a list of lists of half edges
+        - arc, a dictionary from half edges to the position of their arc
+        - circles, the orbits of the Seifert circles
+        - circle, a dictionary from half edges to the position of their orbit
+        - crossings, a tuple for each crossing as in _crossings
+        - crossing, a dictionary from half edges to the position of their crossing
+
+        This is recomputed only if the graph has been modified, as for cells.
+
+        EXAMPLE:
+
+        >>> g = LinkDiagram.from_DT(DT([4,6,2]))
+        >>> x = g.index
+        >>> x is g.index
+        True
+        >>> len(x.arcs), len(x.crossings)
+        (3, 3)
+        >>> a = x.crossings[0][0]
+        >>> x.arc[a] == x.arc[a.c.c]
+        True
+
+        """
+        x = getattr(self, '_index', None)
+        g = self.graph
+        if x == None or x.version != g.version:
+            initial = []
+            crossings = []
+            crossing = dict()
+            for a in g.he:
+                d = a.decorations
+                if d.directed == 'tail' and d.over == False:
+                    initial.append(a)
+                elif d.directed == 'head' and d.over and not a.IsI:
+                    b = a.c
+                    sign = 1 if b.decorations.directed == 'head' else -1
+                    for h in (a, b, b.c, b.c.c):
+                        crossing[h] = len(crossings)
+                    crossings.append( (a, b, b.c, b.c.c, sign) )
+
+            arcs = []
+            arc = dict()
+            for a in initial:
+                x = [a, a.e]
+                s = a
+                while s.e.decorations.over:
+                    s = s.e.c.c
+                    x.append(s)
+                    x.append(s.e)
+                for h in x:
+                    arc[h] = len(arcs)
+                arcs.append(x)
+            # A component which is never under is a single closed arc.
+            for y in crossings:
+                if not y[0] in arc:
+                    x = []
+                    s = y[2]
+                    while True:
+                        x.append(s)
+                        x.append(s.e)
+                        s = s.e.c.c
+                        if s == y[2]:
+                            break
+                    for h in x:
+                        arc[h] = len(arcs)
+                    arcs.append(x)
+
+            def _next(a):
+                if a.e.c.decorations.directed == a.decorations.directed:
+                    return a.e.c
+                else:
+                    return a.e.c.c.c
+
+            sf = g.orbits('seifert', _next)
+            x = LinkIndex(arcs, arc, sf.orbits, sf.index,
+                          crossings, crossing, g.version)
+            self._index = x
+        return x
 
     @property
     def seifert(self):
@@ -439,13 +913,18 @@ class LinkDiagram(closedgraph.ClosedGraph):
         [2, 2, 2, 2, 4, 4]
 
         """
-        def _next(a):
-            if a.e.c.decorations.directed == a.decorations.directed:
-                return a.e.c
-            else:
-                return a.e.c.c.c
+        return self.index.circles
 
-        return self.graph.get_orbits( _next )
+    def _recoloured(self, label):
+        """A copy of the diagram with the half edges coloured by label."""
+        colours = ['red','blue','green','purple','orange','brown']
+        phi = self.graph.copy()
+        for a, b in phi.map.iteritems():
+            dec = b.decorations
+            c = colours[label[a] % len(colours)]
+            b.decorations = ribbon.Features(dec.directed, c, dec.over)
+        ot = [ phi.map[a] for a in self.outside ]
+        return LinkDiagram(phi.codomain, ot)
 
     def withseifert(self):
         """Draws a link diagram with coloured Seifert circles.
@@ -453,22 +932,14 @@ class LinkDiagram(closedgraph.ClosedGraph):
         EXAMPLES: See demo.py
 
         """
-        colours = ['red','blue','green','purple','orange','brown']
-        phi = self.graph.copy()
-        g = phi.codomain
-        ot = [ phi.map[a] for a in self.outside ]
-        ld = LinkDiagram(g, ot)
-        st = set([ frozenset(x + tuple([ a.e for a in x ])) for x in ld.seifert ])
-        col = colours
-        while len(col) < len(st):
-            col = col + colours
-
-        for x, c in zip(st, col):
-            for a in x:
-                dec = a.decorations
-                a.decorations = ribbon.Features(dec.directed, c, dec.over)
-
-        return ld
+        circle = self.index.circle
+        # The two orbits of a Seifert circle get the same colour.
+        label = dict()
+        colour = dict()
+        for a in self.graph.he:
+            k = min(circle[a], circle[a.e])
+            colour[a] = label.setdefault(k, len(label))
+        return self._recoloured(colour)
 
     def witharcs(self):
         """Draws a link diagram with coloured arcs.
@@ -476,22 +947,7 @@ class LinkDiagram(closedgraph.ClosedGraph):
         EXAMPLES: See demo.py
 
         """
-        colours = ['red','blue','green','purple','orange','brown']
-        phi = self.graph.copy()
-        g = phi.codomain
-        ot = [ phi.map[a] for a in self.outside ]
-        ld = LinkDiagram(g, ot)
-        st = ld.arcs
-        col = colours
-        while len(col) < len(st):
-            col = col + colours
-
-        for x, c in zip(st, col):
-            for a in x:
-                dec = a.decorations
-                a.decorations = ribbon.Features(dec.directed, c, dec.over)
-
-        return ld
+        return self._recoloured(self.index.arc)
 
     @property
     def arcs(self):
@@ -511,19 +967,256 @@ class LinkDiagram(closedgraph.ClosedGraph):
         [4, 4, 4, 4]
 
         """
-        initial = [ a for a in self.graph.he if\
-          a.decorations.directed == 'tail' and\
-          a.decorations.over == False ]
+        return self.index.arcs
 
-        output = []
-        for a in initial:
-            arc = [a,a.e]
-            s = a
-            while s.e.decorations.over:
-                s = s.e.c.c
-                arc = arc + [s,s.e]
-            output.append(arc)
-        return output
+    def _crossings(self):
+        """The crossings of the diagram.
+
+        OUTPUT: A list with a tuple for each crossing. The tuple is the half
+        edges of the crossing in the order of c, starting with the incoming
+        over strand, followed by the sign of the crossing.
+        """
+        return self.index.crossings
+
+    @property
+    def writhe(self):
+        """The sum of the signs of the crossings.
+
+        EXAMPLE:
+
+        >>> LinkDiagram.from_braid([1,1,1]).writhe
+        3
+
+        """
+        return sum( x[4] for x in self._crossings() )
+
+    def alexander_polynomial(self):
+        """Calculates the Alexander polynomial of the LinkDiagram.
+
+        OUTPUT: A Laurent polynomial
+
+        The Alexander matrix has a row for each crossing and a column for
+        each arc. The row of a crossing has 1-t in the column of the over
+        arc and t and -1 in the columns of the incoming and outgoing under
+        arcs, exchanged if the crossing is negative. The polynomial is the
+        determinant of the minor with the last row and column removed,
+        found by polynomial_determinant(). Each row has at most three
+        entries so the elimination only touches a few rows at each step.
+
+        The polynomial is only defined up to multiplication by -1 and a
+        power of t, so it is normalised to be symmetric, with exponents
+        which are halves of integers for some links, and to have a
+        positive leading coefficient.
+
+        EXAMPLES:
+
+        >>> LinkDiagram.from_DT(DT([4,6,2])).alexander_polynomial()
+        t^-1 - 1 + t
+        >>> LinkDiagram.from_DT(DT([4,6,8,2])).alexander_polynomial()
+        t^-1 - 3 + t
+        >>> LinkDiagram.from_DT(DT([6,8,10,2,4])).alexander_polynomial()
+        t^-2 - t^-1 + 1 - t + t^2
+        >>> LinkDiagram.from_braid([1,1]).alexander_polynomial()
+        -t^(-1/2) + t^(1/2)
+        >>> LinkDiagram.from_braid([-1,-1]).alexander_polynomial()
+        -t^(-1/2) + t^(1/2)
+
+        """
+        arcs = self.arcs
+        label = self.index.arc
+        X = self._crossings()
+        n = len(X)
+        if self._loops() and n + self._loops() > 1:
+            # A loop with no crossings is split from the rest.
+            return Laurent()
+        if n < 2:
+            return Laurent({0:1})
+        if len(arcs) != n:
+            # A component which is never under can be lifted off the
+            # rest so the link is split.
+            return Laurent()
+
+        M = []
+        for (a, b, c, d, sign) in X[:-1]:
+            if b.decorations.directed != 'head':
+                b, d = d, b
+            if sign < 0:
+                b, d = d, b
+            r = dict()
+            for k, q in ( (label[a], {0:1, 1:-1}), (label[b], {1:1}),
+                          (label[d], {0:-1}) ):
+                if k != n-1:
+                    _accumulate(r.setdefault(k, {}), q)
+            M.append( dict( (k, q) for k, q in r.iteritems() if q ) )
+
+        p = polynomial_determinant(M, n-1)
+        if not p:
+            return Laurent()
+        lo, hi = min(p), max(p)
+        shift = -Fraction(lo+hi, 2)
+        sign = -1 if p[hi] < 0 else 1
+        terms = []
+        for k, c in p.iteritems():
+            e = k + shift
+            if e.denominator == 1:
+                e = int(e)
+            terms.append( (e, sign*c) )
+        return Laurent(terms)
+
+    def kauffman_bracket(self):
+        """Calculates the Kauffman bracket of the LinkDiagram.
+
+        OUTPUT: A Laurent polynomial in A
+
+        This is the sum over the states of A^(a-b) d^(l-1), where a and b
+        are the numbers of A and B smoothings, l is the number of loops
+        and d = -A^2 - A^-2. The crossings are added one at a time, in an
+        order which keeps the number of edges between the crossings that
+        have been added and the rest small. The partial states are grouped
+        by how they join up these edges, so the work grows with the number
+        of these edges rather than with the number of crossings.
+
+        EXAMPLE:
+
+        >>> LinkDiagram.from_DT(DT([4,6,8,2])).kauffman_bracket()
+        A^-8 - A^-4 + 1 - A^4 + A^8
+
+        """
+        X = self._crossings()
+        # Each component with no crossings is a loop which contributes d.
+        free = self._loops()
+        d = {2:-1, -2:-1}
+        if not X:
+            total = {0:1}
+            for l in xrange(free-1):
+                total = _multiply(total, d)
+            return Laurent(total, 'A')
+        number = dict()
+        for x in X:
+            for a in x[:4]:
+                number[a] = len(number)
+        partner = [None] * len(number)
+        crossing = [None] * len(number)
+        for r, x in enumerate(X):
+            for a in x[:4]:
+                partner[number[a]] = number[a.e]
+                crossing[number[a]] = r
+        H = [ [ number[a] for a in x[:4] ] for x in X ]
+
+        # The order of the crossings: each step adds a crossing which
+        # least increases the number of edges leaving the added crossings.
+        added = [False] * len(X)
+        order = []
+        candidates = set()
+        for k in xrange(len(X)):
+            if not candidates:
+                candidates = set( [ r for r in xrange(len(X)) if not added[r] ][:1] )
+            def growth(r):
+                return sum( -1 if added[crossing[partner[h]]] else
+                            (0 if crossing[partner[h]] == r else 1) for h in H[r] )
+            r = min(candidates, key=lambda r: (growth(r), r))
+            candidates.discard(r)
+            added[r] = True
+            order.append(r)
+            for h in H[r]:
+                q = crossing[partner[h]]
+                if not added[q]:
+                    candidates.add(q)
+
+        states = { (): {0:1} }
+        done = [False] * len(X)
+        for r in order:
+            h0, h1, h2, h3 = H[r]
+            here = set(H[r])
+            # The open ends of earlier crossings joined to this crossing.
+            touched = [ partner[h] for h in H[r] if done[crossing[partner[h]]] ]
+            fixed = [ (h, partner[h]) for h in H[r] if partner[h] in here and h < partner[h] ]
+            fixed += [ (partner[g], g) for g in touched ]
+            new = dict()
+            for smoothing, w in ( (((h1,h2),(h3,h0)), 1), (((h0,h1),(h2,h3)), -1) ):
+                for key, poly in states.iteritems():
+                    pairing = dict()
+                    for u, v in key:
+                        pairing[u] = v
+                        pairing[v] = u
+                    edges = list(smoothing) + fixed
+                    for g in touched:
+                        f = pairing[g]
+                        if not f in touched or g < f:
+                            edges.append( (g, f) )
+                    for g in touched:
+                        pairing.pop(g, None)
+                        pairing.pop(pairing.get(g), None)
+                    for u, v in edges[len(smoothing)+len(fixed):]:
+                        pairing.pop(u, None)
+                        pairing.pop(v, None)
+                    # Every node has one or two edges so the edges form
+                    # paths, which give the new pairs, and loops.
+                    adj = dict()
+                    for k, (u, v) in enumerate(edges):
+                        adj.setdefault(u, []).append(k)
+                        adj.setdefault(v, []).append(k)
+                    used = [False] * len(edges)
+
+                    def walk(u, k):
+                        while True:
+                            used[k] = True
+                            a, b = edges[k]
+                            u = b if a == u else a
+                            rest = [ l for l in adj[u] if not used[l] ]
+                            if not rest:
+                                return u
+                            k = rest[0]
+
+                    for u in adj:
+                        if len(adj[u]) == 1 and not used[adj[u][0]]:
+                            v = walk(u, adj[u][0])
+                            pairing[u] = v
+                            pairing[v] = u
+                    loops = 0
+                    for k in xrange(len(edges)):
+                        if not used[k]:
+                            loops += 1
+                            walk(edges[k][0], k)
+                    key = tuple(sorted( (u, v) for u, v in pairing.iteritems() if u < v ))
+                    term = _shift(poly, w)
+                    for l in xrange(loops):
+                        term = _multiply(term, d)
+                    _accumulate(new.setdefault(key, {}), term)
+            done[r] = True
+            states = new
+        total = states.get((), {})
+        for l in xrange(free):
+            total = _multiply(total, d)
+        return Laurent(_divide(total, d), 'A')
+
+    def jones_polynomial(self):
+        """Calculates the Jones polynomial of the LinkDiagram.
+
+        OUTPUT: A Laurent polynomial in t. The exponents are halves of
+        integers for links with an even number of components.
+
+        This is (-A^3)^(-w) times the Kauffman bracket, where w is the
+        writhe, with t = A^-4.
+
+        EXAMPLES:
+
+        >>> LinkDiagram.from_braid([1,1,1]).jones_polynomial()
+        t + t^3 - t^4
+        >>> LinkDiagram.from_DT(DT([4,6,8,2])).jones_polynomial()
+        t^-2 - t^-1 + 1 - t + t^2
+
+        """
+        w = self.writhe
+        bracket = self.kauffman_bracket()
+        sign = -1 if w % 2 else 1
+        terms = []
+        for k, c in bracket.iteritems():
+            e = Fraction(-(k - 3*w), 4)
+            if e.denominator == 1:
+                e = int(e)
+            terms.append( (e, sign*c) )
+        return Laurent(terms)
 
     @property
     def three_colourings(self):
@@ -536,8 +1229,6 @@ class LinkDiagram(closedgraph.ClosedGraph):
         interchanged. If the number of colourings is N then the number
         returned by this function is N/3 - 1.
 
-        This should be rewritten using backtracking.
-
         >>> c = DT([4,6,2])
         >>> g = LinkDiagram.from_DT(c)
         >>> g.three_colourings
@@ -551,42 +1242,242 @@ class LinkDiagram(closedgraph.ClosedGraph):
         >>> g.three_colourings
         0
         """
-        ac = self.arcs
-        seq = product( * [range(3)] * (len(ac)-1) )
-        count = 0
-        label = dict()
+        return self.fox_colourings(3)/3 - 1
 
-        def allowed(p):
-            for a in ac[0]:
-                label[a] = 0
-            for i, x in enumerate(ac[1:]):
-                for a in x:
-                    label[a] = p[i]
-
-            init = ( a for a in self.graph.he if\
-              a.decorations.directed == 'head' and\
-              a.decorations.over == True )
-
-            for a in init:
-                if label[a] != label[a.c.c]:
-                    raise RuntimeError
-                if (2*label[a] - label[a.c] - label[a.c.c.c]) % 3 != 0:
-                    return False
-            return True
+    def vogel(self):
+        """Given a link diagram find a braid whose closure is the link.
+
+        OUTPUT: A pair of the braid word, a list of non-zero integers,
+        and the braid as a pivotal.Morphism
+
+        The existence of the braid is known as Alexander's theorem.
+        This is an implementation of Vogel's algorithm. A face is a defect
+        if two of its edges belong to different Seifert circles and are
+        oriented the same way around the face. A Vogel move is the
+        Reidemeister II move which pushes one of these edges over the
+        other. This merges the two Seifert circles and makes a new small
+        circle so the number of circles does not change, but the number of
+        crossings increases by two. When there are no defects the Seifert
+        circles are nested and the diagram is the closure of a braid.
+
+        The moves are made on a single copy of the diagram. The Seifert
+        circles and the faces are updated locally after each move and the
+        defects are kept in a heap ordered by the size of the face.
+
+        EXAMPLES:
+
+        >>> g = LinkDiagram.from_DT(DT([4,6,8,2]))
+        >>> word, b = g.vogel()
+        >>> len(b.domain) == len(g.seifert)/2
+        True
+        >>> LinkDiagram.from_braid(word).alexander_polynomial()
+        t^-1 - 3 + t
+
+        """
+        # The diagram must be connected.
+        seen = set()
+        stack = [ next(iter(self.graph.he)) ] if self.graph.he else []
+        while stack:
+            a = stack.pop()
+            if not a in seen:
+                seen.add(a)
+                stack.extend([a.c, a.e])
+        if len(seen) != len(self.graph.he):
+            raise ValueError("The diagram is not connected.")
+
+        switch = {'head':'tail','neither':'neither','tail':'head'}
+        phi = self.graph.copy()
+        g = phi.codomain
+        he = g.he
+
+        # The Seifert circle of each half edge, the same for a and a.e
+        index = self.index.circle
+        circle = dict()
+        circles = dict()
+        for a, b in phi.map.iteritems():
+            k = min(index[a], index[a.e])
+            circle[b] = k
+            circles.setdefault(k, []).append(b)
+
+        face = dict()
+        faces = dict()
+        heap = []
+        # Fresh numbers for faces and circles.
+        ids = count(len(he))
+
+        def defect(k):
+            """Two half edges of face k which make a defect, or None."""
+            first = dict()
+            for a in faces[k]:
+                d = a.decorations.directed
+                b = first.setdefault(d, a)
+                if circle[b] != circle[a]:
+                    return b, a
+            return None
 
-        for p in seq:
-            if allowed(p):
-                count += 1
-        return count - 1
+        def add_face(a):
+            k = next(ids)
+            x = [a]
+            s = a.e.c
+            while s != a:
+                x.append(s)
+                s = s.e.c
+            for s in x:
+                face[s] = k
+            faces[k] = x
+            if defect(k) != None:
+                heappush(heap, (len(x), k))
+
+        for x in g.orbits('faces'):
+            add_face(x[0])
+
+        def merge(i, j):
+            if len(circles[i]) < len(circles[j]):
+                i, j = j, i
+            for a in circles[j]:
+                circle[a] = i
+            circles[i].extend(circles.pop(j))
+            return i
+
+        def vogel_move(u, v):
+            a, b, c, d = u, u.e, v, v.e
+            old = set( face[s] for s in (a, b, c, d) )
+            x = [ ribbon.halfedge() for i in range(4) ]
+            y = [ ribbon.halfedge() for i in range(4) ]
+            for i in range(4):
+                x[i].c = x[i-1]
+                y[i].c = y[i-1]
+            a.e = x[0]; x[0].e = a
+            d.e = x[3]; x[3].e = d
+            b.e = y[1]; y[1].e = b
+            c.e = y[2]; y[2].e = c
+            x[1].e = y[0]; y[0].e = x[1]
+            x[2].e = y[3]; y[3].e = x[2]
+
+            # The strand of u passes over the strand of v twice.
+            for p, q, dec, over in ((x[0], x[2], a.decorations, True),
+                                    (y[3], y[1], a.decorations, True),
+                                    (y[2], y[0], c.decorations, False),
+                                    (x[1], x[3], c.decorations, False)):
+                p.decorations = ribbon.Features(switch[dec.directed],
+                                                dec.colour, over)
+                q.decorations = ribbon.Features(dec.directed, dec.colour, over)
+            he.update(x + y)
+
+            k = merge(circle[a], circle[c])
+            for s in (x[0], x[3], y[1], y[2]):
+                circle[s] = k
+                circles[k].append(s)
+            k = next(ids)
+            circles[k] = [x[1], x[2], y[0], y[3]]
+            for s in circles[k]:
+                circle[s] = k
+
+            stale = x + y
+            for k in old:
+                stale.extend(faces.pop(k))
+            for s in stale:
+                face.pop(s, None)
+            for s in stale:
+                if not s in face:
+                    add_face(s)
+
+        while heap:
+            k = heappop(heap)[1]
+            if k in faces:
+                p = defect(k)
+                if p != None:
+                    vogel_move(*p)
+        g.touch()
+
+        # The Seifert graph is now a path. Number the circles along it.
+        vertex = g.orbits('vertices')
+        crossing = [ None ] * len(vertex)
+        nb = dict( (k, set()) for k in circles )
+        for i, x in enumerate(vertex):
+            a = [ s for s in x if s.decorations.directed == 'head' and\
+                  s.decorations.over ][0]
+            sign = 1 if a.c.decorations.directed == 'head' else -1
+            p, q = circle[a], circle[a.c.c]
+            crossing[i] = (p, q, sign)
+            nb[p].add(q)
+            nb[q].add(p)
+        if any( len(x) > 2 for x in nb.itervalues() ):
+            raise RuntimeError("The Seifert circles are not nested.")
+
+        def inner(k):
+            """A half edge on circle k whose face has only edges of k."""
+            seen = set()
+            for a in circles[k]:
+                if a.decorations.directed == 'head' and not face[a] in seen:
+                    seen.add(face[a])
+                    if all( circle[s] == k for s in faces[face[a]] ):
+                        return a
+            return None
+
+        ends = [ k for k in circles if len(nb[k]) < 2 ]
+        cut = [ s for s in ( inner(k) for k in ends ) if s != None ][:1]
+        if not cut:
+            raise RuntimeError
+        level = { circle[cut[0]]: 0 }
+        while len(level) < len(circles):
+            k = circle[cut[-1]]
+            a = [ s for s in faces[face[cut[-1].e]]
+                  if circle[s] != k and s.decorations.directed == 'head' ]
+            if not a or circle[a[0]] in level:
+                raise RuntimeError
+            level[circle[a[0]]] = len(cut)
+            cut.append(a[0])
+
+        # Read the crossings along each circle from the cut and take
+        # them in an order compatible with every circle.
+        order = []
+        for a in cut:
+            x = []
+            s = a
+            while True:
+                x.append(vertex.index[s])
+                t = s.c if circle[s.c] == circle[s] else s.c.c.c
+                s = t.e
+                if s == a:
+                    break
+            order.append(x)
+        pos = [0] * len(order)
+        heads = [0] * len(vertex)
+        for x in order:
+            if x:
+                heads[x[0]] += 1
+        ready = [ i for i in xrange(len(vertex)) if heads[i] == 2 ]
+        word = []
+        while ready:
+            i = ready.pop()
+            p, q, sign = crossing[i]
+            l = min(level[p], level[q])
+            word.append( sign * (l+1) )
+            for m in (l, l+1):
+                pos[m] += 1
+                if pos[m] < len(order[m]):
+                    j = order[m][pos[m]]
+                    heads[j] += 1
+                    if heads[j] == 2:
+                        ready.append(j)
+        if len(word) != len(vertex):
+            raise RuntimeError
+
+        co = []
+        for a in cut:
+            co.append(a.e)
+            a.e.e = None
+            a.e = None
+        g.touch()
+
+        return word, pivotal.Morphism(g, cut, co)
 
     @property
     def braid(self):
         """Given a link diagram find a braid whose closure is the link.
 
-        The existence of the braid is known as Alexander's theorem.
-        This is an implementation of Vogel's algorithm. This does not
-        change the number of Seifert circles but does increase the number
-        of crossings.
+        See vogel().
 
         EXAMPLES:
 
@@ -600,9 +1491,9 @@ class LinkDiagram(closedgraph.ClosedGraph):
         >>> g.braid #doctest: +ELLIPSIS
         <pivotal.Morphism instance at 0x...>
 
-        c = DT([4,8,10,2,6])
-        g = LinkDiagram.from_DT(c)
-        g.braid #doctest: +ELLIPSIS
+        >>> c = DT([4,8,10,2,6])
+        >>> g = LinkDiagram.from_DT(c)
+        >>> g.braid #doctest: +ELLIPSIS
         <pivotal.Morphism instance at 0x...>
 
         >>> c = DT([8,10,2,12,4,6])
@@ -611,168 +1502,318 @@ class LinkDiagram(closedgraph.ClosedGraph):
         <pivotal.Morphism instance at 0x...>
 
         """
+        return self.vogel()[1]
 
-        def get_arc(f):
-            """Finds an arc."""
-            sf = f.seifert
-            DS = dict()
-            for x in sf:
-                for a in x:
-                    DS[a] = x
-
-            # Could use product and ifilter from itertools
-            for fc in f.faces:
-                for j, v in enumerate(fc):
-                    for i in range(j-1):
-                        u = fc[i]
-                        if DS[u] != DS[v] and u.decorations.directed == v.decorations.directed:
-                            return u,v
-            return None
+    @property
+    def braid_word(self):
+        """A braid word whose closure is the link. See vogel().
 
-        def vogel_move(f,u,v):
-            # This goes into an infinite loop
-            phi = f.graph.copy()
-            new = phi.codomain
-            a = phi.map[u]
-            b = a.e
-            c = phi.map[v]
-            d = c.e
-            x = [ ribbon.halfedge() for i in range(4) ]
-            for i in range(4):
-                x[i-1].c = x[i]
-            y = [ ribbon.halfedge() for i in range(4) ]
-            for i in range(4):
-                y[i-1].c = y[i]
-            a.e = x[0]; x[0].e = a
-            d.e = x[3]; x[3].e = d
-            b.e = y[1]; y[1].e = b
-            c.e = y[2]; y[2].e = c
-            x[1].e = y[0]; y[0].e = x[1]
-            x[2].e = y[3]; y[3].e = x[2]
-            switch = {'head':'tail','neither':'neither','tail':'head'}
-            ut = a.decorations.directed
-            ot = switch[ut]
-
-            if False:
-                x[0].decorations._replace(a.decorations.colour)
-                x[1].decorations._replace(c.decorations.colour)
-                x[2].decorations._replace(a.decorations.colour)
-                x[3].decorations._replace(c.decorations.colour)
-                y[0].decorations._replace(d.decorations.colour)
-                y[1].decorations._replace(b.decorations.colour)
-                y[2].decorations._replace(d.decorations.colour)
-                y[3].decorations._replace(b.decorations.colour)
-
-            for a in x:
-                a.decorations._replace(colour='red')
-            for a in y:
-                a.decorations._replace(colour='red')
-
-
-            g = ribbon.justgraph( new.he.union( set(x+y) ) )
-
-            u = phi.map[f.outside[0]]
-            outside = [u]
-            s = u.e.c
-            while s != u:
-                outside.append(s)
-                s = s.e.c
+        EXAMPLE:
 
-            return LinkDiagram(g,outside)
+        >>> g = LinkDiagram.from_braid([1,1,1])
+        >>> g.braid_word
+        [1, 1, 1]
 
+        """
+        return self.vogel()[0]
 
-        f = self
-        while 1:
-            a = get_arc(f)
-            if a == None:
-                break
-            f = vogel_move(f,a[0],a[1])
-            print f.genus
-            #f.show()
 
-        # The code below appears to be correct
-        faces = f.faces
-        fc = [ frozenset(x) for x in faces ]
+class Laurent(dict):
+    """Laurent polynomials with integer coefficients.
 
-        def start():
-            for x in f.seifert:
-                if frozenset(x) in fc:
-                    if x[0].decorations.directed == 'head':
-                        return x
-            raise RuntimeError
+    This is a dictionary from the exponents to the non-zero coefficients.
 
-        index = dict()
-        for a in f.graph.he:
-            index[a] = None
-        for a in start():
-            index[a] = 0
-            index[a.e] = 0
-
-        def v_find(i):
-            for x in f.vertices:
-                u = [ a for a in x if index[a] == None ]
-                v = [ a for a in x if index[a] == i ]
-                if len(u) == 2 and len(v) == 2:
-                    return u,v
-            raise RuntimeError
+    EXAMPLES:
 
-        sf = f.seifert
-        DS = dict()
-        for x in sf:
-            for a in x:
-                DS[a] = x
-
-        n = len(sf)/2 # This is #braid strings = #Seifert circles
-        for i in range(n-1):
-            c = v_find(i)
-            for x in c[0]:
-                for a in DS[x]:
-                    index[a] = i+1
-                    index[a.e] = i+1
-
-        if any([ index[a] == None for a in f.graph.he ]):
-            raise RuntimeError
+    >>> p = Laurent({-1:-1, 0:3, 1:-1})
+    >>> p
+    -t^-1 + 3 - t
+    >>> p * p
+    t^-2 - 6*t^-1 + 11 - 6*t + t^2
+    >>> Laurent({Fraction(1,2):1}, 'q')
+    q^(1/2)
 
+    """
+    def __init__(self, terms=(), var='t'):
+        dict.__init__(self)
+        self.var = var
+        for k, c in dict(terms).iteritems():
+            if c != 0:
+                self[k] = c
 
-        for a in start():
-            if a.decorations.directed == 'head':
-                cut_path = [ a ]
-                break
+    def __add__(self, other):
+        p = dict(self)
+        _accumulate(p, other)
+        return Laurent(p, self.var)
 
-        DF = dict()
-        for x in faces:
-            for a in x:
-                DF[a] = x
+    def __neg__(self):
+        return Laurent( ((k, -c) for k, c in self.iteritems()), self.var )
 
-        for i in range(n-1):
-            x = DF[ cut_path[i].e ]
-            for a in x:
-                if index[a] == i+1 and a.decorations.directed == 'head':
-                    cut_path.append(a)
-                    break
+    def __sub__(self, other):
+        return self + (-other)
 
-        if len(cut_path) != n:
-            raise RuntimeError
+    def __mul__(self, other):
+        return Laurent(_multiply(self, other), self.var)
+
+    def __call__(self, x):
+        return sum( c * x**k for k, c in self.iteritems() )
+
+    def __repr__(self):
+        if not self:
+            return '0'
+        output = ''
+        for k in sorted(self):
+            c = self[k]
+            if k == 0:
+                term = str(abs(c))
+            else:
+                if k == 1:
+                    mono = self.var
+                elif isinstance(k, Fraction):
+                    mono = '%s^(%s)' % (self.var, k)
+                else:
+                    mono = '%s^%s' % (self.var, k)
+                term = mono if abs(c) == 1 else '%d*%s' % (abs(c), mono)
+            if output == '':
+                output = term if c > 0 else '-' + term
+            else:
+                output += (' + ' if c > 0 else ' - ') + term
+        return output
 
-        phi = f.graph.copy()
-        do = [ phi.map[a] for a in cut_path ]
-        co = [ phi.map[a.e] for a in cut_path ]
+def _accumulate(p, q):
+    """Adds the polynomial q to the dictionary p in place."""
+    for k, c in q.iteritems():
+        c += p.get(k, 0)
+        if c == 0:
+            p.pop(k, None)
+        else:
+            p[k] = c
+
+def _multiply(p, q):
+    r = dict()
+    for i, a in p.iteritems():
+        for j, b in q.iteritems():
+            r[i+j] = r.get(i+j, 0) + a*b
+    return dict( (k, c) for k, c in r.iteritems() if c != 0 )
+
+def _shift(p, n):
+    return dict( (k+n, c) for k, c in p.iteritems() )
+
+def _negate(p):
+    return dict( (k, -c) for k, c in p.iteritems() )
+
+def _divide(p, q):
+    """Exact division of Laurent polynomials."""
+    p = dict(p)
+    top = max(q)
+    r = dict()
+    while p:
+        k = max(p)
+        c, m = divmod(p[k], q[top])
+        if m != 0:
+            raise ValueError("The division is not exact.")
+        r[k-top] = c
+        _accumulate(p, dict( (i+k-top, -c*b) for i, b in q.iteritems() ))
+    return r
+
+def polynomial_determinant(M, n):
+    """The determinant of a sparse matrix of polynomials.
+
+    INPUT: A list of n rows, each a dictionary from the columns of its
+    non-zero entries to polynomials, and the number of columns. The
+    polynomials are dictionaries from exponents to integer coefficients.
+
+    OUTPUT: A polynomial
+
+    This is fraction-free (Bareiss) elimination. The pivot is taken in
+    the column with the fewest non-zero entries. A row with no entry in
+    the pivot column would only be multiplied by the ratio of the new and
+    the previous pivot, so this is postponed until the row is next used;
+    the ratios telescope, and each division is exact. At worst this is
+    O(n^3) operations on polynomials of degree up to n, but for a sparse
+    matrix only the rows with an entry in the pivot column are changed.
+
+    EXAMPLE:
+
+    >>> polynomial_determinant([{0:{0:2}, 1:{0:1}}, {0:{0:1}, 1:{1:3}}], 2)
+    {0: -1, 1: 6}
+
+    """
+    rows = [ dict(r) for r in M ]
+    if len(rows) != n:
+        raise ValueError("The matrix must be square.")
+    # The pivots after each step, and the step of the last update of each row.
+    pivots = [{0:1}]
+    stamp = [0] * n
+    column = dict( (j, set()) for j in xrange(n) )
+    for i, r in enumerate(rows):
+        for j in r:
+            column[j].add(i)
+
+    def current(i):
+        s = stamp[i]
+        if s != len(pivots)-1:
+            p, q = pivots[-1], pivots[s]
+            rows[i] = dict( (j, _divide(_multiply(x, p), q))
+                            for j, x in rows[i].iteritems() )
+            stamp[i] = len(pivots)-1
+        return rows[i]
+
+    order = dict()
+    while column:
+        j = min(column, key=lambda j: (len(column[j]), j))
+        below = column.pop(j)
+        if not below:
+            return {}
+        k = min(below, key=lambda i: (len(rows[i]), i))
+        below.discard(k)
+        order[k] = j
+        pivot = current(k)
+        for l in pivot:
+            if l in column:
+                column[l].discard(k)
+        P = pivot[j]
+        prev = pivots[-1]
+        for i in below:
+            r = current(i)
+            a = r.pop(j)
+            new = dict()
+            for l in set(r) | set(pivot):
+                if l == j:
+                    continue
+                x = _multiply(P, r[l]) if l in r else {}
+                if l in pivot:
+                    _accumulate(x, _multiply(_negate(a), pivot[l]))
+                x = _divide(x, prev) if x else x
+                if x:
+                    new[l] = x
+                    column[l].add(i)
+                else:
+                    column[l].discard(i)
+            rows[i] = new
+            stamp[i] = len(pivots)
+        pivots.append(P)
+
+    # The sign of the permutation from the pivot rows to their columns.
+    sign = 1
+    seen = set()
+    for k in order:
+        l = k
+        while not l in seen:
+            seen.add(l)
+            l = order[l]
+            if l != k and not l in seen:
+                sign = -sign
+    return dict( (e, sign*c) for e, c in pivots[-1].iteritems() )
+
+def inverse(a, n):
+    """The inverse of a modulo n, or None if there is none.
+
+    EXAMPLE:
+
+    >>> inverse(2, 5), inverse(2, 4)
+    (3, None)
+
+    """
+    r0, r1, s0, s1 = n, a % n, 0, 1
+    while r1 != 0:
+        q = r0 // r1
+        r0, r1 = r1, r0 - q*r1
+        s0, s1 = s1, s0 - q*s1
+    if r0 != 1:
+        return None
+    return s0 % n
+
+def diagonal(A, m):
+    """Diagonalises an integer matrix by row and column operations.
+
+    INPUT: A list of rows of integers and the number of columns
+
+    OUTPUT: A list of m integers, the diagonal entries, padded with 0
+
+    The rows are modified. The number of solutions of Ax = 0 over Z/n
+    is the product of gcd(d,n) over the diagonal entries d.
+
+    EXAMPLE:
+
+    >>> diagonal([[2,4],[6,8]], 2)
+    [2, -4]
+
+    """
+    A = [ list(r) for r in A if any(r) ]
+    output = []
+    while A:
+        # The pivot is an entry of least absolute value.
+        p = min( (abs(v), i, j) for i, r in enumerate(A)
+                 for j, v in enumerate(r) if v != 0 )
+        i, j = p[1], p[2]
+        A[0], A[i] = A[i], A[0]
+        done = False
+        while not done:
+            done = True
+            r = A[0]
+            d = r[j]
+            for k in xrange(1, len(A)):
+                q = A[k][j] // d
+                if q != 0:
+                    s = A[k]
+                    A[k] = [ u - q*v for u, v in zip(s, r) ]
+                if A[k][j] != 0:
+                    done = False
+            for k in xrange(m):
+                if k != j and r[k] != 0:
+                    q = r[k] // d
+                    if q != 0:
+                        for s in A:
+                            s[k] -= q*s[j]
+                    if r[k] != 0:
+                        done = False
+            if not done:
+                # Move a smaller entry in the row or column to the pivot.
+                p = min( [ (abs(A[k][j]), k, j) for k in xrange(1, len(A)) if A[k][j] != 0 ]
+                       + [ (abs(r[k]), 0, k) for k in xrange(m) if k != j and r[k] != 0 ] )
+                i, j = p[1], p[2]
+                A[0], A[i] = A[i], A[0]
+        output.append(A[0][j])
+        A = [ s[:j] + s[j+1:] for s in A[1:] ]
+        A = [ s for s in A if any(s) ]
+        m -= 1
+    return output + [0] * m
 
-        for a in cut_path:
-            phi.map[a].e = None
-            phi.map[a.e].e = None
+class DT(object):
+    """Implements Dowker-Thistlewaite codes.
 
-        g = ribbon.justgraph(phi.codomain.he)
+    The code of a knot is a list of even integers. The code of a link is
+    a list with a list for each component.
 
-        return pivotal.Morphism(g,do,co)
+    EXAMPLE:
 
+    >>> DT([4,6,3])
+    Traceback (most recent call last):
+    ...
+    ValueError: Not a valid Dowker-Thistlewaite code
 
-class DT(object):
-    """Implements Dowker-Thistlewaite codes."""
+    """
     def __init__(self,code):
-        # Should do checking here.
+        code = [ list(x) if isinstance(x, (list, tuple)) else x for x in code ]
+        if len(code) == 1 and isinstance(code[0], list):
+            code = code[0]
+        flat = code
+        if any( isinstance(x, list) for x in code ):
+            flat = [ k for x in code for k in x ]
+        seen = [False] * (len(flat) + 1)
+        for k in flat:
+            if not isinstance(k, (int, long)) or k == 0 or k % 2 != 0 or\
+                    abs(k) > 2*len(flat) or seen[abs(k)/2]:
+                raise ValueError("Not a valid Dowker-Thistlewaite code")
+            seen[abs(k)/2] = True
         self.code = code
 
+    @property
+    def is_link(self):
+        """Whether this is the code of a link with more than one component."""
+        return any( isinstance(x, list) for x in self.code )
+
     @property
     def full_code(self):
         n = len(self.code)
@@ -809,51 +1850,58 @@ class DT(object):
         [1, -1, 1, 1, -1, 1]
 
         """
-        first_non_zero = lambda L: min(i for i in range(len(L)) if L[i])
-        # Returns the index of the frist non-zero entry in the list - dies on an all 0 list.
-
         code = self.full_code
 
-        M = len(code) # Uusualy denoted 2*N
+        M = len(code) # Usually denoted 2*N
         seq = code * 2  # seq is two copies of full DT involution on crossings numbered 0 to 2N-1.
         emb, A = [0] * M, [0] * M  # zero emb and A. A will only ever contain zeroes and ones.
 
-        # Set initial conditions.
-        A[0], A[seq[0]] = 1, 1
-        emb[0], emb[seq[0]] = 1, -1
-
-        # Determine the possible phi's
-        all_phi = [[0] * M for i in range(M)]
-        for i in range(M):
-            all_phi[i][i] = 1
-            for j in range(i, i+M):
-                all_phi[i][j % M] = 1 if i == j else -all_phi[i][(j-1) % M] if i <= seq[j] <= seq[i] else all_phi[i][(j-1) % M ]
-
-        while any(A):
-            i = first_non_zero(A)  # let i be the index of the first non-zero member of A
-            psi = all_phi[i]
-
-            D = [1] * M
-            D[i:seq[i]+1] = [0] * (seq[i] - i + 1)
-            while any(D):
-                x = first_non_zero(D)  # let x be the index of the first non-zero member of D
-                D[x] = 0
-
-                if i <= seq[x] <= seq[i] and emb[x] != 0 and psi[x] * psi[seq[x]] * emb[i] != emb[x]:
-                    raise ValueError("Something bad has happened, sequence is not realizable.")
-                if (seq[x] < i or seq[i] < seq[x]) and psi[x] * psi[seq[x]] != 1 and x < i:
-                    # This extra AND conditions shouldn't be needed.
-                    raise ValueError("Something bad has happened, sequence is not realizable.")
-
-                if seq[i] < seq[x] or seq[x] < i:
-                    D[seq[x]] = 0
-                elif emb[x] == 0: # emb[x] is already defined
-                    assert D[seq[x]] == 0
-                    emb[x] = psi[x] * psi[seq[x]] * emb[i]
-                    emb[seq[x]] = -emb[x]
-                    if abs(seq[x]-seq[x-1]) % M != 1:
-                        A[x] = 1
-                        A[seq[x]] = 1
+        def phi(i):
+            """The possible phi for the crossing with first label i."""
+            row = [0] * M
+            row[i] = 1
+            for j in xrange(i+1, i+M):
+                row[j % M] = -row[(j-1) % M] if i <= seq[j] <= seq[i] else row[(j-1) % M]
+            return row
+
+        # Each block of crossings which are not determined by the previous
+        # ones is started with the first crossing of the block. There is
+        # one block unless the diagram has kinks or is a connected sum.
+        for start in xrange(M):
+            if emb[start] != 0:
+                continue
+            # Set initial conditions.
+            A[start], A[seq[start]] = 1, 1
+            emb[start], emb[seq[start]] = 1, -1
+
+            while any(A):
+                i = A.index(1)  # let i be the index of the first non-zero member of A
+                psi = phi(i)
+
+                D = [1] * M
+                D[i:seq[i]+1] = [0] * (seq[i] - i + 1)
+                # Entries of D are only ever cleared, so the first
+                # non-zero member is found by a single scan.
+                for x in xrange(M):
+                    if not D[x]:
+                        continue
+                    D[x] = 0
+
+                    if i <= seq[x] <= seq[i] and emb[x] != 0 and psi[x] * psi[seq[x]] * emb[i] != emb[x]:
+                        raise ValueError("Something bad has happened, sequence is not realizable.")
+                    if (seq[x] < i or seq[i] < seq[x]) and psi[x] * psi[seq[x]] != 1 and x < i:
+                        # This extra AND conditions shouldn't be needed.
+                        raise ValueError("Something bad has happened, sequence is not realizable.")
+
+                    if seq[i] < seq[x] or seq[x] < i:
+                        D[seq[x]] = 0
+                    elif emb[x] == 0: # emb[x] is already defined
+                        assert D[seq[x]] == 0
+                        emb[x] = psi[x] * psi[seq[x]] * emb[i]
+                        emb[seq[x]] = -emb[x]
+                        if abs(seq[x]-seq[x-1]) % M != 1:
+                            A[x] = 1
+                            A[seq[x]] = 1
 
                 A[i], A[seq[i]] = 0, 0
 
@@ -123,8 +123,8 @@ class justmap():
 
         EXAMPLE:
 
-        >>> justgraph.polygon(4) #doctest: +ELLIPSIS
-        <__main__.justgraph instance at 0x...>
+        >>> len(justmap.polygon(4).he)
+        20
 
         """
 
@@ -144,7 +144,7 @@ class justmap():
             in1[i].f = in2[i-1]
             in2[i].f = bdo[i]
 
-        he = inn1 + inn2 + inn3 + bdi + bdo
+        he = in1 + in2 + in3 + bdi + bdo
         return justmap(he)
 
     def copy(self):
@@ -190,27 +190,34 @@ class justmap():
 
         EXAMPLE:
 
-        >>> justgraph.polygon(4).is_connected()
+        >>> justmap.polygon(4).is_connected()
+        True
+        >>> g = justmap.polygon(4)
+        >>> n = len(g.he)
+        >>> g.is_connected() and len(g.he) == n
         True
 
         """
         he = self.he
-        if he == {}:
+        if not he:
             return True
-        component = { he.pop() }
-        flag = True
-        while flag:
-            flag = False
-            nev = { a.v for a in component if a.v not in component and a.v != None }
-            if len(nev) > 0:
-                flag = True
-                component.update(nev)
-            nef = { a.f for a in component if a.f not in component and a.f != None }
-            if len(nef) > 0:
-                flag = True
-                component.update(nef)
-
-        return component == h
+        # The maps are partial so they are followed in both directions.
+        inverse = dict()
+        for a in he:
+            for b in (a.v, a.f):
+                if b != None:
+                    inverse.setdefault(b, []).append(a)
+        start = next(iter(he))
+        component = { start }
+        frontier = [ start ]
+        while frontier:
+            a = frontier.pop()
+            for b in [a.v, a.f] + inverse.get(a, []):
+                if b != None and not b in component:
+                    component.add(b)
+                    frontier.append(b)
+
+        return component == he
 
     def dual(self):
         D = dict()
@@ -517,7 +524,6 @@ class Embedding():
 
 
 
-# This could be speeded up by only checking new entries at each pass.
 # Use search(g,g) to construct the set of automorphisms of g
 def search(h,g,u=None):
     """
@@ -529,10 +535,12 @@ def search(h,g,u=None):
 
     EXAMPLE:
 
-    >>> h=justgraph.vertex(3)
-    >>> g=justgraph.polygon(4)
+    >>> h=justmap.vertex(3)
+    >>> g=justmap.polygon(4)
     >>> len(search(h,g))
     12
+    >>> len(search(g,g))
+    4
 
     """
     if u != None and not u in h.he:
@@ -542,36 +550,51 @@ def search(h,g,u=None):
     if len(h.he) == 1:
         raise ValueError, "Domain must be non-empty." 
 
-    if u == None: u = h.he.pop()
+    if u == None: u = next(iter(h.he))
+
+    # The maps are partial so their inverses are needed to reach every dart.
+    def inverses(k):
+        vi, fi = dict(), dict()
+        for a in k.he:
+            if a.v != None:
+                vi[a.v] = a
+            if a.f != None:
+                fi[a.f] = a
+        return vi, fi
+
+    hvi, hfi = inverses(h)
+    gvi, gfi = inverses(g)
 
     def test(x):
-        D = dict()
-        D[u] = x
-        flag = True
-        while flag:
-            flag = False
-            newD = dict()
-            for a in D:
-                if a.v != None and not a.v in D:
-                    newD[a.v] = D[a].v
-                if a.f != None and not a.f in D:
-                    newD[a.f] = D[a].f
-            if len(newD) != 0:
-                if any( a.decorations != newD[a].decorations for a in newD ):
+        # The map is extended from the newly mapped darts only.
+        D = {u: x}
+        used = {x}
+        frontier = [u]
+        while frontier:
+            a = frontier.pop()
+            b = D[a]
+            for s, t in ((a.v, b.v), (a.f, b.f),
+                         (hvi.get(a), gvi.get(b)), (hfi.get(a), gfi.get(b))):
+                if s == None:
+                    continue
+                if t == None:
                     return False, D
-                D.update(newD)
-                flag = True
-            for a in D:
-                if a.v in D:
-                    if D[a.v] != D[a].v:
+                if s in D:
+                    if D[s] != t:
                         return False, D
-                if a.f in D:
-                    if D[a.f] != D[a].f:
-                        return False, D
-        return len(D.values()) == len(h.he), D
+                elif t in used or s.decorations != t.decorations:
+                    return False, D
+                else:
+                    D[s] = t
+                    used.add(t)
+                    frontier.append(s)
+        return len(D) == len(h.he), D
 
+    # Only darts with the same decorations as u are tried.
     output = []
     for x in g.he:
+        if x.decorations != u.decorations:
+            continue
         t, D = test(x)
         if t:
             output.append(Embedding(D, h, g))
@@ -579,12 +602,34 @@ def search(h,g,u=None):
 
 
 def overlaps(f,g):
-    """Finds overlaps between two justgraphs.
+    """Finds overlaps between two justmaps.
 
-    INPUT: Two justgraphs
+    INPUT: Two justmaps
 
     OUTPUT: A list of dictionaries
 
+    This is ribbon.overlaps() for darts. A vertex of f is matched with a
+    vertex of g of the same valency and decorations and the map is
+    extended along v and f, and their inverses, where they are defined in
+    both maps. Each overlap is listed once. If f is g then an overlap and
+    its inverse are the same, so only one of them is listed; the canonical
+    form of an overlap is then its set of unordered pairs.
+
+    EXAMPLES:
+
+    >>> f = justmap.vertex(3)
+    >>> g = justmap.polygon(4)
+    >>> len(overlaps(f,g))
+    12
+    >>> sorted(set( len(D) for D in overlaps(f,g) ))
+    [9]
+
+    An overlap of g with itself and its inverse are listed once.
+
+    >>> h = justmap.polygon(4)
+    >>> len(overlaps(g,h)), len(overlaps(g,g))
+    (20, 13)
+
     """
 
     if not f.is_connected():
@@ -592,59 +637,73 @@ def overlaps(f,g):
     if not g.is_connected():
         raise ValueError
 
-    def test():
-        for a in D:
-            if a.decorations != D[a].decorations:
-                return False
-            if a.IsI != D[a].IsI:
-                return False
-
-        flag = True
-        while flag:
-            flag = False
-            newD = dict()
-            for a in D:
-                while not a.c in D:
-                    if a in D:
-                        newD[a.c] = D[a].c
-                    elif a in newD:
-                        newD[a.c] = newD[a].c
-                    a = a.c
-            for a in D:
-                if a.e != None and not a.e in D:
-                    if D[a].e != None:
-                        newD[a.e] = D[a].e
-            if len(newD) != 0:
-                if any( a.decorations != newD[a].decorations for a in newD ):
-                    return False
-                D.update(newD)
-                flag = True
-            for a in D:
-                if D[a].IsI != a.IsI:
-                    return False
-                if a.c in D:
-                    if D[a.c] != D[a].c:
-                        return False
-                if a.e in D:
-                    if D[a.e] != D[a].e:
+    def inverses(k):
+        vi, fi = dict(), dict()
+        for a in k.he:
+            if a.v != None:
+                vi[a.v] = a
+            if a.f != None:
+                fi[a.f] = a
+        return vi, fi
+
+    fvi, ffi = inverses(f)
+    gvi, gfi = inverses(g)
+
+    def extend(D):
+        used = set(D.values())
+        frontier = list(D)
+        while frontier:
+            a = frontier.pop()
+            b = D[a]
+            for s, t in ((a.v, b.v), (a.f, b.f),
+                         (fvi.get(a), gvi.get(b)), (ffi.get(a), gfi.get(b))):
+                # The overlap stops where either map is not defined. A
+                # conflict there is found from the other end of the map.
+                if s == None or t == None:
+                    continue
+                if s in D:
+                    if D[s] != t:
                         return False
-        if len(set(D.values())) != len(D):
-            return False
+                elif t in used or s.decorations != t.decorations:
+                    return False
+                else:
+                    D[s] = t
+                    used.add(t)
+                    frontier.append(s)
         return True
 
+    def vertices(h):
+        return [ x for x in h.get_orbits(lambda a: a.v) if x[0].v != None ]
+
+    index = dict()
+    for ug in vertices(g):
+        k = tuple(sorted( a.decorations for a in ug ))
+        index.setdefault(k, []).append(ug)
 
     output = []
-    vf = f.get_orbits(lambda a: a.c)
-    vg = g.get_orbits(lambda a: a.c)
-    for uf in vf:
-        n = len(v)
-        for ug in [ u for u in vg if len(u) == n ]:
-            D = dict()
+    covered = set()
+    seen = set()
+    for uf in vertices(f):
+        n = len(uf)
+        k = tuple(sorted( a.decorations for a in uf ))
+        for ug in index.get(k, []):
             for i in xrange(n):
-                D[uf[i]] = ug[i]
-            if test():
-                output.append(D)
-    return D
+                if (uf[0], ug[i]) in covered:
+                    continue
+                D = dict()
+                for j in xrange(n):
+                    D[uf[j]] = ug[(i+j) % n]
+                if any( a.decorations != D[a].decorations for a in uf ):
+                    continue
+                if extend(D):
+                    covered.update(D.iteritems())
+                    if f is g:
+                        code = frozenset( frozenset(p) for p in D.iteritems() )
+                        if code in seen:
+                            continue
+                        seen.add(code)
+                    output.append(D)
+    return output
 
 
 
@@ -0,0 +1,1132 @@
+#*****************************************************************************
+#       Copyright (C) 2013 Bruce Westbury Bruce.Westbury@warwick.ac.uk
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#                  http://www.gnu.org/licenses/
+#*****************************************************************************
+
+"""
+Array implementations of the circle packing algorithms in surface.py.
+
+The circles are indexed by integers, in the order Vcircles + Ecircles + Fcircles,
+and the triangles are stored as an integer array with three columns. This means
+the angles of all the triangles are computed in one pass and then added into
+the angle sums at the circles with numpy.bincount.
+
+This is selected by SurfaceComplex.packing_accelerated(backend='numpy').
+The function packing_newton() solves the same equations by Newton's method
+and is used by SurfaceComplex.packing_newton(). The function
+packing_spherical() packs triangulations of the sphere and layout_spherical()
+places the circles on the sphere; stereographic() projects them to the plane.
+The circles of every layout are placed one triangle at a time by
+place_triangles().
+After a subdivision SurfaceComplex.packing_subdivision starts packing_newton(),
+or packing_disc() on the sphere, from the radii of the coarser packing.
+"""
+
+import telemetry
+
+from time import time
+from cmath import rect, phase
+from collections import deque
+from heapq import heappush, heappop
+from itertools import count
+
+import numpy
+from scipy.sparse import coo_matrix
+from scipy.sparse.linalg import spsolve, lsqr
+
+def euc_angles(u):
+    """Calculates the angles of Euclidean triangles.
+
+    INPUT: An array of radii of shape (T,3)
+
+    OUTPUT: An array of angles of shape (T,3)
+
+    The angle in position i is the angle at the centre of circle i.
+
+    EXAMPLES:
+
+    >>> a = euc_angles(numpy.ones((2,3)))
+    >>> numpy.allclose(a, numpy.pi/3)
+    True
+
+    """
+    a = numpy.roll(u,1,axis=1) + numpy.roll(u,2,axis=1)
+    b = numpy.roll(a,1,axis=1)
+    c = numpy.roll(a,2,axis=1)
+    x = (b*b + c*c - a*a) / (2*b*c)
+    return numpy.arccos(numpy.clip(x,-1.0,1.0))
+
+def hyp_angles(u):
+    """Calculates the angles of hyperbolic triangles.
+
+    INPUT: An array of x-radii of shape (T,3)
+
+    OUTPUT: An array of angles of shape (T,3)
+
+    This is surface.hyp_tri01 applied to arrays.
+
+    EXAMPLES:
+
+    >>> import surface
+    >>> u = numpy.array([[0.2,0.5,0.7]])
+    >>> numpy.allclose(hyp_angles(u), surface.hyp_tri01(u[0]))
+    True
+
+    """
+    v = numpy.roll(u,1,axis=1)
+    w = numpy.roll(u,2,axis=1)
+    x = ((1+u*v)*(1+u*w) - 2*u*(1+v*w)) / ((1-u*v)*(1-u*w))
+    return numpy.arccos(numpy.clip(x,-1.0,1.0))
+
+def sph_angles(u):
+    """Calculates the angles of spherical triangles.
+
+    INPUT: An array of radii of shape (T,3)
+
+    OUTPUT: An array of angles of shape (T,3)
+
+    This uses the half angle form of the spherical cosine rule,
+    sin(a_i/2)^2 = sin(r_j)sin(r_k)/(sin(r_i+r_j)sin(r_i+r_k)),
+    which is accurate for small circles. See Stephenson p. 57.
+
+    EXAMPLES:
+
+    Three circles of radius pi/4 with centres at the vertices of an
+    octant meet at right angles.
+
+    >>> a = sph_angles(numpy.ones((1,3))*numpy.pi/4)
+    >>> numpy.allclose(a, numpy.pi/2)
+    True
+
+    """
+    v = numpy.roll(u,1,axis=1)
+    w = numpy.roll(u,2,axis=1)
+    p = numpy.sin(v)*numpy.sin(w) / (numpy.sin(u+v)*numpy.sin(u+w))
+    return 2*numpy.arcsin(numpy.sqrt(numpy.clip(p,0.0,1.0)))
+
+def euc_derivatives(u):
+    """Calculates the derivatives of the angles of Euclidean triangles
+    with respect to the logarithms of the radii.
+
+    INPUT: An array of radii of shape (T,3)
+
+    OUTPUT: An array of shape (T,3,3)
+
+    The entry in position (i,j) is the derivative of the angle at circle i
+    with respect to log(r_j). The incircle of the triangle of centres passes
+    through the three points of tangency and if its radius is rho then the
+    off diagonal entries are rho/(r_i+r_j). The rows sum to zero since the
+    angles do not change under scaling.
+
+    EXAMPLES:
+
+    >>> d = euc_derivatives(numpy.array([[1.0,2.0,3.0]]))
+    >>> numpy.allclose(d.sum(axis=2), 0)
+    True
+    >>> numpy.allclose(d[0], d[0].T)
+    True
+
+    """
+    rho = numpy.sqrt( u.prod(axis=1) / u.sum(axis=1) )
+    d = rho[:,None,None] / (u[:,:,None] + u[:,None,:])
+    i = numpy.arange(3)
+    d[:,i,i] = 0
+    d[:,i,i] = -d.sum(axis=2)
+    return d
+
+def hyp_to_coords(x):
+    """The coordinates used by Newton's method in hyperbolic geometry are
+    the logarithms of the hyperbolic radii."""
+    return numpy.log(-0.5*numpy.log(x))
+
+def hyp_from_coords(z):
+    return numpy.exp(-2*numpy.exp(z))
+
+def hyp_derivatives(u, h=1e-6):
+    """Calculates the derivatives of the angles of hyperbolic triangles
+    with respect to the logarithms of the hyperbolic radii.
+
+    INPUT: An array of x-radii of shape (T,3)
+
+    OUTPUT: An array of shape (T,3,3)
+
+    These are calculated by central differences.
+    """
+    z = hyp_to_coords(u)
+    d = numpy.empty(u.shape+(3,))
+    for j in range(3):
+        zp = z.copy(); zp[:,j] += h
+        zm = z.copy(); zm[:,j] -= h
+        d[:,:,j] = (hyp_angles(hyp_from_coords(zp)) - hyp_angles(hyp_from_coords(zm)))/(2*h)
+    return d
+
+def euc_adj(angle,k,d,r):
+    """This is surface.euc_adj applied to arrays."""
+    beta = numpy.sin( angle/(2*k) )
+    f = (d-1)/d
+    return r * f * beta / (beta-1)
+
+def hyp_adj(angle,k,d,r):
+    """This is surface.hyp_adj applied to arrays."""
+    beta = numpy.sin( angle/(2*k) )
+    sr = numpy.sqrt(r)
+    v = numpy.maximum( (beta-sr)/(beta*r-sr) , 0 )
+    den = numpy.sqrt((1-v)*(1-v)+4*d*d*v) + 1 - v
+    t = 2*d/den
+    return t*t
+
+def angle_sums(tri,r,_angles=euc_angles):
+    """Calculates the angle sum at each circle.
+
+    INPUT: A (T,3) array of circle indices and an array of radii.
+
+    OUTPUT: An array of angle sums, one for each circle.
+    """
+    ac = _angles(r[tri])
+    return numpy.bincount(tri.ravel(), weights=ac.ravel(), minlength=len(r))
+
+def initial_radii(sc, circles, start=None):
+    """The radii of SurfaceComplex.initial_radii as arrays.
+
+    OUTPUT: An array of radii and a boolean array marking the fixed circles.
+
+    If a dictionary start is given then the circles which are not fixed
+    start with these radii instead. In Euclidean geometry they are scaled
+    to agree with the fixed circles.
+    """
+    radius, fixed = sc.initial_radii()
+    r = numpy.array([ radius[c] for c in circles ], dtype=float)
+    f = numpy.array([ c in fixed for c in circles ], dtype=bool)
+    if start != None:
+        s = numpy.array([ start[c] for c in circles ], dtype=float)
+        if sc.geometry == 'Euclidean':
+            # The Euclidean packing is only determined up to scale.
+            s *= numpy.mean( r[f]/s[f] )
+        r = numpy.where(f, r, s)
+    return r, f
+
+def triangle_array(circles,triangles,tri=None):
+    """Converts the triangles to an array of circle indices.
+
+    INPUT: A list of circles and a list of triangles. Optionally the
+    circle indices as a flat integer array, as made by
+    ClosedGraph.set_triangles(), which is then used directly.
+
+    OUTPUT: An integer array of shape (T,3)
+
+    EXAMPLES:
+
+    >>> import spider
+    >>> g = spider.RibbonGraph.polygon(5).closure()
+    >>> c = g.Vcircles + g.Ecircles + g.Fcircles
+    >>> (triangle_array(c, g.triangles) == triangle_array(c, g.triangles, g.tri)).all()
+    True
+
+    """
+    if tri != None:
+        tri = numpy.frombuffer(tri, dtype=numpy.intc)
+        return tri.astype(numpy.intp).reshape((len(triangles),3))
+    index = { c:i for i, c in enumerate(circles) }
+    tri = numpy.array([ [ index[t[i]] for i in range(3) ] for t in triangles ],
+                      dtype=numpy.intp)
+    return tri.reshape((len(triangles),3))
+
+def packing_accelerated(sc, recorder=None, maxiter=None):
+    """This is SurfaceComplex.packing_accelerated using arrays.
+
+    INPUT: A SurfaceComplex, optionally a telemetry.Recorder and the
+    maximum number of iterations
+
+    OUTPUT: A dictionary of radii
+
+    The iteration, including the acceleration scheme, is the same as
+    the iteration in SurfaceComplex.packing_accelerated.
+    """
+    if sc.geometry == 'Euclidean':
+        _angles = euc_angles
+        _adj    = euc_adj
+        upper   = None
+    elif sc.geometry == 'hyperbolic':
+        _angles = hyp_angles
+        _adj    = hyp_adj
+        # x-radii must stay below 1.
+        upper   = 1.0
+    elif sc.geometry == 'spherical':
+        circles = sc.Vcircles + sc.Ecircles + sc.Fcircles
+        return packing_spherical(circles, sc.triangles, sc.error, sc.tolerance, recorder)
+    else:
+        raise RuntimeError, "This can't happen."
+
+    circles = sc.Vcircles + sc.Ecircles + sc.Fcircles
+    tri = triangle_array(circles, sc.triangles, sc.tri)
+
+    target = numpy.array([ c.angle for c in circles ], dtype=float)
+    # The angle sums at boundary circles are not prescribed.
+    interior = numpy.array([ not c.boundary for c in circles ], dtype=bool)
+
+    radius, fixed = initial_radii(sc, circles)
+    radius = accelerate(tri, target, interior, radius, fixed, _angles, _adj,
+                        sc.error, sc.tolerance, upper, recorder, maxiter)
+    return { c:float(radius[i]) for i, c in enumerate(circles) }
+
+def accelerate(tri, target, interior, radius, fixed, _angles, _adj,
+               error, tolerance, upper=None, recorder=None, maxiter=None):
+    """The accelerated uniform neighbour iteration on arrays.
+
+    INPUT:
+
+    - A (T,3) array of circle indices
+    - An array of target angle sums
+    - A boolean array marking the circles whose angle sums are prescribed
+    - An array of initial radii
+    - A boolean array marking the circles whose radii are fixed
+    - The functions giving the angles of triangles and the adjustment
+    - The error and tolerance
+    - An upper bound for the radii, or None
+    - Optionally a telemetry.Recorder
+    - The maximum number of iterations, by default 100 for each circle
+      and at least 10000
+
+    OUTPUT: An array of radii
+
+    A RuntimeError is raised if the error is not below error after
+    maxiter iterations. This is used by packing_accelerated() and
+    packing_spherical().
+
+    EXAMPLE:
+
+    >>> tri = numpy.array([[0,1,2]])
+    >>> r = numpy.ones(3)
+    >>> fixed = numpy.array([True, False, False])
+    >>> target = numpy.ones(3)
+    >>> accelerate(tri, target, ~fixed, r, fixed, euc_angles, euc_adj,
+    ...            1e-12, 0.1, None, None, 5)
+    Traceback (most recent call last):
+    ...
+    RuntimeError: The packing did not converge in 5 iterations.
+
+    """
+    n = len(radius)
+    k = numpy.bincount(tri.ravel(), minlength=n).astype(float)
+    delta = numpy.sin( target/(2*k) )
+    free = ~fixed
+    if maxiter == None:
+        maxiter = max(10000, 100*n)
+
+    radius_new = radius.copy()
+    error_new = 1 + error
+    lambda_new = -1
+    flag_new = False
+
+    packing = False
+    count = 0
+    while not packing:
+        count += 1
+        if count > maxiter:
+            if recorder != None:
+                recorder.finish('packing_accelerated', False)
+            raise RuntimeError, "The packing did not converge in %d iterations." % maxiter
+        error_old  = error_new
+        lambda_old = lambda_new
+        flag_old   = flag_new
+        radius_old = radius_new
+
+        t0 = time()
+        angle = angle_sums(tri,radius_old,_angles)
+
+        ae = (target - angle)[interior]
+        error_new = numpy.sqrt(numpy.dot(ae,ae))
+        packing = error_new < error
+        current = error_new
+
+        t1 = time()
+        radius_new = radius_old.copy()
+        radius_new[free] = _adj(angle[free],k[free],delta[free],radius_old[free])
+
+        t2 = time()
+        lambda_new = error_new / error_old
+        flag_new = True
+        factor = None
+
+        if flag_old and lambda_new < 1:
+            error_new *= lambda_new
+            if abs( lambda_new - lambda_old ) < tolerance:
+                lambda_new = lambda_new / (1-lambda_new)
+            dec = free & (radius_old > radius_new)
+            lm = list( radius_new[dec] / (radius_old[dec]-radius_new[dec]) )
+            if upper != None:
+                inc = free & (radius_old < radius_new)
+                lm += list( (upper-radius_new[inc]) / (radius_new[inc]-radius_old[inc]) )
+            if lm:
+                lambda_new = min( lambda_new, min(lm) * 0.5 )
+            step = radius_new[free] - radius_old[free]
+            radius_new[free] += lambda_new * step
+            flag_new = False
+            factor = lambda_new
+
+        if recorder != None:
+            recorder(telemetry.Iteration(count, float(current), factor,
+                        t1-t0, t2-t1, time()-t2,
+                        int(numpy.count_nonzero(numpy.abs(ae) > error))))
+
+    if recorder != None:
+        recorder.finish('packing_accelerated', True)
+    return radius_new
+
+def jacobian(tri,r,_derivatives=euc_derivatives):
+    """Assembles the sparse Jacobian of the angle sums with respect to
+    the logarithms of the radii.
+
+    INPUT: A (T,3) array of circle indices and an array of radii.
+
+    OUTPUT: A sparse matrix in CSR format.
+    """
+    n = len(r)
+    d = _derivatives(r[tri])
+    rows = numpy.repeat(tri, 3, axis=1)
+    cols = numpy.tile(tri, (1,3))
+    return coo_matrix((d.ravel(), (rows.ravel(), cols.ravel())), shape=(n,n)).tocsr()
+
+def packing_newton(sc, maxiter=100, recorder=None, start=None):
+    """Solves the angle sum equations by Newton's method.
+
+    INPUT: A SurfaceComplex and optionally a telemetry.Recorder and a
+    dictionary of radii to start from (see initial_radii())
+
+    OUTPUT: A dictionary of radii
+
+    The unknowns are the logarithms of the radii (of the hyperbolic radii
+    in hyperbolic geometry). The boundary conditions are those encoded in
+    the circles: each circle has a target angle sum given by Circle.angle,
+    and a circle with Circle.boundary set has its radius fixed. In Euclidean
+    geometry with no such circles the first circle is fixed to normalise
+    the packing, as in packing_accelerated(). The iteration is newton().
+    """
+    if sc.geometry == 'Euclidean':
+        _angles = euc_angles
+        _derivatives = euc_derivatives
+        _to, _from = numpy.log, numpy.exp
+    elif sc.geometry == 'hyperbolic':
+        _angles = hyp_angles
+        _derivatives = hyp_derivatives
+        _to, _from = hyp_to_coords, hyp_from_coords
+    elif sc.geometry == 'spherical':
+        raise NotImplementedError, "Use packing_accelerated in spherical geometry."
+    else:
+        raise RuntimeError, "This can't happen."
+
+    circles = sc.Vcircles + sc.Ecircles + sc.Fcircles
+    tri = triangle_array(circles, sc.triangles, sc.tri)
+
+    target = numpy.array([ c.angle for c in circles ], dtype=float)
+    interior = numpy.array([ not c.boundary for c in circles ], dtype=bool)
+
+    radius, fixed = initial_radii(sc, circles, start)
+    radius = newton(tri, target, interior, radius, fixed, _angles, _derivatives,
+                    _to, _from, sc.error, maxiter, recorder)
+    return { c:float(radius[i]) for i, c in enumerate(circles) }
+
+def newton(tri, target, interior, radius, fixed, _angles, _derivatives,
+           _to, _from, error, maxiter=100, recorder=None):
+    """Newton's method for the angle sum equations on arrays.
+
+    INPUT:
+
+    - A (T,3) array of circle indices
+    - An array of target angle sums
+    - A boolean array marking the circles whose angle sums are prescribed
+    - An array of initial radii
+    - A boolean array marking the circles whose radii are fixed
+    - The functions giving the angles of triangles and their derivatives
+    - The functions to and from the coordinates used for the derivatives
+    - The error, the maximum number of steps and optionally a
+      telemetry.Recorder
+
+    OUTPUT: An array of radii
+
+    Each Newton step is damped by halving until the angle sum error
+    decreases. If it does not decrease, or is not finite, for any step
+    down to 1e-10 of the Newton step then a RuntimeError is raised. The
+    same happens after maxiter steps. For the recorder the three phases are assembling the
+    Jacobian, solving the linear system and the line search, and the
+    factor is the damping. This is used by packing_newton() and
+    packing_disc().
+
+    EXAMPLE:
+
+    The angles at two corners of a triangle can't both be 1.6.
+
+    >>> import warnings
+    >>> tri = numpy.array([[0,1,2]])
+    >>> fixed = numpy.array([True, False, False])
+    >>> target = numpy.array([0, 1.6, 1.6])
+    >>> with warnings.catch_warnings():
+    ...     warnings.simplefilter('ignore')
+    ...     newton(tri, target, ~fixed, numpy.ones(3), fixed, euc_angles,
+    ...            euc_derivatives, numpy.log, numpy.exp, 1e-7)
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Newton's method found no step which decreases the error.
+
+    """
+    n = len(radius)
+    free = (~fixed).nonzero()[0]
+
+    x = _to(radius)
+
+    def residual(x):
+        res = angle_sums(tri, _from(x), _angles) - target
+        res[~interior] = 0
+        return res
+
+    res = residual(x)
+    err = numpy.sqrt(numpy.dot(res,res))
+    count = 0
+    while err >= error:
+        count += 1
+        if count > maxiter:
+            if recorder != None:
+                recorder.finish('packing_newton', False)
+            raise RuntimeError, "Newton's method did not converge."
+        t0 = time()
+        J = jacobian(tri, _from(x), _derivatives)
+        J = J[free,:][:,free]
+        t1 = time()
+        step = numpy.zeros(n)
+        step[free] = spsolve(J.tocsc(), -res[free])
+
+        t2 = time()
+        t = 1.0
+        while True:
+            y = x + t*step
+            new = residual(y)
+            e = numpy.sqrt(numpy.dot(new,new))
+            if numpy.isfinite(e) and e < err:
+                break
+            t *= 0.5
+            if t < 1e-10:
+                if recorder != None:
+                    recorder.finish('packing_newton', False)
+                raise RuntimeError, "Newton's method found no step which decreases the error."
+        x, res, err = y, new, e
+
+        if recorder != None:
+            recorder(telemetry.Iteration(count, float(err), t,
+                        t1-t0, t2-t1, time()-t2,
+                        int(numpy.count_nonzero(numpy.abs(res) > error))))
+
+    if recorder != None:
+        recorder.finish('packing_newton', True)
+    return _from(x)
+
+def transition_weights(tri, r):
+    """The weights of the harmonic property of a Euclidean packing.
+
+    INPUT: A (T,3) array of circle indices and an array of radii.
+
+    OUTPUT: A symmetric sparse matrix in CSR format.
+
+    The incircle of a triangle of centres passes through the three points
+    of tangency. If rho is its radius then the triangle contributes
+    rho/(r_i+r_j) to the weight of the edge ij. So the weight of an edge
+    is the length of the segment joining the incentres of the two
+    triangles on the edge divided by the length of the edge, which is
+    formula (90) on page 237 of 'Circle Packing' by Stephenson. These
+    segments close up around each interior circle, so the centre of an
+    interior circle is the weighted average of the centres of its
+    neighbours.
+    """
+    n = len(r)
+    u = r[tri]
+    rho = numpy.sqrt( u.prod(axis=1) / u.sum(axis=1) )
+    rows, cols, vals = [], [], []
+    for i, j in [(0,1),(1,2),(2,0)]:
+        w = rho / (u[:,i] + u[:,j])
+        rows += [ tri[:,i], tri[:,j] ]
+        cols += [ tri[:,j], tri[:,i] ]
+        vals += [ w, w ]
+    rows, cols, vals = numpy.hstack(rows), numpy.hstack(cols), numpy.hstack(vals)
+    return coo_matrix((vals, (rows, cols)), shape=(n,n)).tocsr()
+
+def pcg(A, b, x, tol=1e-12, maxiter=None):
+    """The conjugate gradient method with the Jacobi preconditioner.
+
+    INPUT: A symmetric positive definite sparse matrix, a right hand side,
+    a starting vector, the tolerance (relative to the norm of b) and a
+    bound on the number of iterations.
+
+    OUTPUT: The solution and the number of iterations.
+
+    EXAMPLES:
+
+    >>> A = coo_matrix(numpy.array([[4.0,1.0],[1.0,3.0]])).tocsr()
+    >>> x, k = pcg(A, numpy.array([1.0,2.0]), numpy.zeros(2))
+    >>> numpy.allclose(A.dot(x), [1.0,2.0])
+    True
+
+    """
+    if maxiter == None:
+        maxiter = 10*len(b)
+    M = 1/A.diagonal()
+    r = b - A.dot(x)
+    z = M*r
+    p = z.copy()
+    rz = numpy.dot(r,z)
+    bound = tol * numpy.sqrt(numpy.dot(b,b))
+    count = 0
+    while numpy.sqrt(numpy.dot(r,r)) > bound and count < maxiter:
+        count += 1
+        Ap = A.dot(p)
+        alpha = rz / numpy.dot(p,Ap)
+        x = x + alpha*p
+        r = r - alpha*Ap
+        z = M*r
+        rznew = numpy.dot(r,z)
+        p = z + (rznew/rz)*p
+        rz = rznew
+    return x, count
+
+def harmonic_centres(tri, r, fixed, z, tol=1e-12):
+    """Finds the centres of a Euclidean packing from the boundary centres.
+
+    INPUT: A (T,3) array of circle indices, an array of radii, a boolean
+    array marking the circles whose centres are given and an array of
+    (complex) centres, of which only the given centres are used.
+
+    OUTPUT: An array of centres.
+
+    The centres of the other circles solve the linear equations given
+    by transition_weights(). The matrix is a graph Laplacian restricted
+    to these circles, which is symmetric and positive definite, so the
+    real and imaginary parts are found by pcg().
+    """
+    W = transition_weights(tri, r)
+    free = (~fixed).nonzero()[0]
+    given = fixed.nonzero()[0]
+    d = numpy.asarray(W.sum(axis=1)).ravel()
+    A = (coo_matrix((d, (numpy.arange(len(r)),)*2), shape=W.shape).tocsr() - W)
+    A = A[free,:][:,free]
+    b = W[free,:][:,given].dot(z[given])
+
+    z = numpy.array(z, dtype=complex)
+    x0 = numpy.ones(len(free)) * z[given].mean()
+    x, k = pcg(A, b.real, x0.real, tol)
+    y, k = pcg(A, b.imag, x0.imag, tol)
+    z[free] = x + 1j*y
+    return z
+
+def tangencies(tri):
+    """The pairs of tangent circles.
+
+    INPUT: A (T,3) array of circle indices.
+
+    OUTPUT: An integer array of shape (E,2), each pair listed once with
+    the smaller index first.
+
+    EXAMPLES:
+
+    >>> tangencies(numpy.array([[0,1,2],[2,1,3]]))
+    array([[0, 1],
+           [0, 2],
+           [1, 2],
+           [1, 3],
+           [2, 3]])
+
+    """
+    e = numpy.vstack([ tri[:,[0,1]], tri[:,[1,2]], tri[:,[2,0]] ])
+    e.sort(axis=1)
+    return numpy.unique(e, axis=0)
+
+def refine_centres(tri, r, z, maxiter=10, tol=1e-12):
+    """Least squares refinement of the centres of a Euclidean packing.
+
+    INPUT: A (T,3) array of circle indices, an array of radii, an array
+    of (complex) centres, a bound on the number of steps and a tolerance.
+
+    OUTPUT: The array of refined centres and an array of residuals, one
+    for each pair given by tangencies(tri).
+
+    Each tangency gives the equation |z_a - z_b| = r_a + r_b. These are
+    solved in the least squares sense by the Gauss-Newton method. Each
+    step is a sparse linear least squares problem which is solved by LSQR
+    (the conjugate gradient method applied to the normal equations). LSQR
+    finds the solution of least norm so the centres are not moved by
+    rigid motions. This stops when the residuals, or a step, are less
+    than tol times the largest radius.
+
+    EXAMPLES:
+
+    >>> tri = numpy.array([[0,1,2]])
+    >>> r = numpy.array([1.0,1.0,1.0])
+    >>> z = numpy.array([0, 2, 1+1.7j])
+    >>> z, res = refine_centres(tri, r, z)
+    >>> numpy.abs(res).max() < 1e-12
+    True
+
+    """
+    e = tangencies(tri)
+    a, b = e[:,0], e[:,1]
+    n, m = len(r), len(e)
+    z = numpy.array(z, dtype=complex)
+    rows = numpy.repeat(numpy.arange(m), 4)
+    cols = numpy.vstack([ 2*a, 2*a+1, 2*b, 2*b+1 ]).T.ravel()
+
+    for count in range(maxiter):
+        d = z[a] - z[b]
+        dist = numpy.abs(d)
+        res = dist - (r[a] + r[b])
+        if numpy.abs(res).max() < tol * r.max():
+            break
+        u = d / dist
+        vals = numpy.vstack([ u.real, u.imag, -u.real, -u.imag ]).T.ravel()
+        A = coo_matrix((vals, (rows, cols)), shape=(m,2*n)).tocsr()
+        step = lsqr(A, -res, atol=1e-15, btol=1e-15)[0]
+        z += step[0::2] + 1j*step[1::2]
+        if numpy.abs(step).max() < tol * r.max():
+            break
+
+    res = numpy.abs(z[a] - z[b]) - (r[a] + r[b])
+    return z, res
+
+def packing_spherical(circles, triangles, error=0.00001, tolerance=0.05, recorder=None):
+    """Packs a triangulation of the sphere.
+
+    INPUT: A list of circles and a list of triangles (whose first three
+    entries are circles and whose fourth entry gives the orientation, as
+    for SurfaceComplex). Optionally the error, the tolerance for the
+    acceleration and a telemetry.Recorder.
+
+    OUTPUT: A dictionary of spherical radii
+
+    Every circle has angle sum 2*pi. This is used by
+    SurfaceComplex.packing_accelerated in spherical geometry, and so by
+    constellation.HyperMap.layout.
+
+    The packings of the sphere are only unique up to Mobius transformations
+    and the uniform neighbour iteration on the sphere is not stable. So, as
+    in Bowers & Stephenson, the circle with the most neighbours is removed
+    and the rest is given the maximal packing of the unit disc, in which the
+    neighbours of the removed circle are horocycles. This is computed by the
+    accelerated iteration in hyperbolic radii (rather than x-radii, which
+    lose precision for small circles). The packing is laid out by
+    layout_disc() and taken to the sphere by inverse stereographic
+    projection. The removed circle is the northern hemisphere.
+
+    EXAMPLES:
+
+    The octahedron. The circle 0 is removed so it is a hemisphere.
+
+    >>> c = range(6)
+    >>> t = [ (0,1,2,False), (1,3,2,False), (3,4,2,False), (4,0,2,False),
+    ...       (1,0,5,False), (3,1,5,False), (4,3,5,False), (0,4,5,False) ]
+    >>> r = packing_spherical(c, t)
+    >>> r = numpy.array([ r[i] for i in c ])
+    >>> numpy.allclose( angle_sums(triangle_array(c, t), r, sph_angles), 2*numpy.pi )
+    True
+
+    """
+    top = puncture(circles, triangles)
+    h = packing_disc(circles, triangles, top, error, tolerance, recorder)
+    return disc_to_sphere(circles, triangles, top, h)
+
+def puncture(circles, triangles):
+    """The circle removed by packing_spherical(), which is the circle with
+    the most neighbours."""
+    tri = triangle_array(circles, triangles)
+    k = numpy.bincount(tri.ravel(), minlength=len(circles))
+    return circles[int(numpy.argmax(k))]
+
+def packing_disc(circles, triangles, top, error=0.00001, tolerance=0.05,
+                 recorder=None, start=None, smoothing=0.1):
+    """The maximal packing of a triangulation of the sphere with one circle
+    removed.
+
+    INPUT: A list of circles, a list of triangles and the circle to remove.
+    Optionally the error, the tolerance for the acceleration, a
+    telemetry.Recorder and a dictionary of hyperbolic radii to start from.
+
+    OUTPUT: A dictionary of hyperbolic radii of the other circles
+
+    The neighbours of the removed circle are horocycles, with radius
+    numpy.inf. Without start the other circles start from 0.5 and the
+    accelerated iteration is used. With start, which should be close to
+    the packing (as in SurfaceComplex.packing_subdivision), the circles
+    missing from start start from 0.5. The accelerated iteration is only
+    used until the error is below smoothing, which deals with the circles
+    near the horocycles, and then Newton's method is used. This is used by
+    packing_spherical() and by SurfaceComplex.packing_disc.
+    """
+    inner = [ c for c in circles if c != top ]
+    disc = [ t for t in triangles if not top in t[:3] ]
+    rim = set()
+    for t in triangles:
+        if top in t[:3]:
+            rim.update( t[i] for i in range(3) )
+    rim.discard(top)
+
+    n = len(inner)
+    tri = triangle_array(inner, disc)
+    target = numpy.ones(n) * 2*numpy.pi
+    fixed = numpy.array([ c in rim for c in inner ], dtype=bool)
+    if fixed.all():
+        raise ValueError, "There are not enough circles to pack."
+    if start == None:
+        h = numpy.where(fixed, numpy.inf, 0.5)
+        h = accelerate(tri, target, ~fixed, h, fixed, hyp_angles_h, hyp_adj_h,
+                       error, tolerance, None, recorder)
+    else:
+        h = numpy.array([ numpy.inf if c in rim else start.get(c, 0.5) for c in inner ])
+        h = accelerate(tri, target, ~fixed, h, fixed, hyp_angles_h, hyp_adj_h,
+                       max(error, smoothing), tolerance, None, recorder)
+        h = newton(tri, target, ~fixed, h, fixed, hyp_angles_h, hyp_derivatives_h,
+                   numpy.log, numpy.exp, error, 100, recorder)
+    return { c:float(h[i]) for i, c in enumerate(inner) }
+
+def disc_to_sphere(circles, triangles, top, h):
+    """The spherical radii from the maximal packing given by packing_disc().
+
+    INPUT: A list of circles, a list of triangles, the removed circle and
+    the dictionary of hyperbolic radii
+
+    OUTPUT: A dictionary of spherical radii
+    """
+    inner = [ c for c in circles if c != top ]
+    disc = [ t for t in triangles if not top in t[:3] ]
+    rim = set( c for c in inner if h[c] == numpy.inf )
+
+    centre = layout_disc(inner, disc, h)
+
+    # The Euclidean circles. A horocycle is found from a neighbour which
+    # is not a horocycle.
+    euclidean = {}
+    for c in inner:
+        if not c in rim:
+            euclidean[c] = hyp_to_euc_h(centre[c], h[c])
+    for t in disc:
+        for i, j in [(0,1),(1,2),(2,0),(1,0),(2,1),(0,2)]:
+            c, d = t[i], t[j]
+            if c in rim and not d in rim and not c in euclidean:
+                z, s = euclidean[d]
+                w = centre[c]
+                rho = (abs(w-z)**2 - s*s) / (2*(1 - (w.conjugate()*z).real + s))
+                euclidean[c] = ((1-rho)*w, rho)
+
+    radius = { top:numpy.pi/2 }
+    for c in inner:
+        radius[c] = inverse_stereographic(*euclidean[c])[1]
+    return radius
+
+def hyp_angles_h(h):
+    """Calculates the angles of hyperbolic triangles from the hyperbolic
+    radii. A radius may be numpy.inf, for a horocycle.
+
+    INPUT: An array of hyperbolic radii of shape (T,3)
+
+    OUTPUT: An array of angles of shape (T,3)
+
+    This uses the half angle formula
+    sin(a_i/2)^2 = sinh(h_j)sinh(h_k)/(sinh(h_i+h_j)sinh(h_i+h_k))
+    which is accurate for small circles.
+
+    EXAMPLES:
+
+    >>> x = numpy.array([[0.2,0.5,0.7]])
+    >>> numpy.allclose(hyp_angles_h(-0.5*numpy.log(x)), hyp_angles(x))
+    True
+    >>> hyp_angles_h(numpy.array([[numpy.inf,1.0,1.0]]))[0,0]
+    0.0
+
+    """
+    def ratio(a,b):
+        # This is sinh(b)/sinh(a+b)
+        return 1/( numpy.cosh(a) + numpy.sinh(a)/numpy.tanh(b) )
+    v = numpy.roll(h,1,axis=1)
+    w = numpy.roll(h,2,axis=1)
+    p = ratio(h,v) * ratio(h,w)
+    return 2*numpy.arcsin(numpy.sqrt(numpy.clip(p,0.0,1.0)))
+
+def hyp_derivatives_h(u, h=1e-6):
+    """Calculates the derivatives of the angles of hyperbolic triangles
+    with respect to the logarithms of the hyperbolic radii.
+
+    INPUT: An array of hyperbolic radii of shape (T,3), which may be
+    numpy.inf
+
+    OUTPUT: An array of shape (T,3,3)
+
+    These are calculated by central differences. The derivatives with
+    respect to a horocycle are zero.
+    """
+    z = numpy.log(u)
+    d = numpy.empty(u.shape+(3,))
+    for j in range(3):
+        zp = z.copy(); zp[:,j] += h
+        zm = z.copy(); zm[:,j] -= h
+        d[:,:,j] = (hyp_angles_h(numpy.exp(zp)) - hyp_angles_h(numpy.exp(zm)))/(2*h)
+    return d
+
+def hyp_adj_h(angle,k,d,h):
+    """The uniform neighbour adjustment for hyperbolic radii.
+
+    If the k neighbours all have radius rho then sin(angle/(2k)) is
+    1/(cosh(h)+c*sinh(h)) where c = coth(rho). This finds c and then solves
+    cosh(h)+c*sinh(h) = 1/d for the new radius.
+    """
+    beta = numpy.sin( angle/(2*k) )
+    c = numpy.maximum( (1/beta - numpy.cosh(h))/numpy.sinh(h), 1.0 )
+    s = 1/d
+    e = ( (s-1) + (s*s-1)/(numpy.sqrt(s*s+c*c-1)+c) ) / (1+c)
+    return numpy.log1p(e)
+
+def hyp_to_euc_h(z, h):
+    """This is surface.hyp_to_euc for a hyperbolic radius h."""
+    tb = numpy.tanh(h/2)
+    ta = abs(z)
+    if ta == 0:
+        return complex(0), float(tb)
+    a = (ta-tb)/(1-ta*tb)
+    b = (ta+tb)/(1+ta*tb)
+    return (a+b)/2 * z/ta, float(b-a)/2
+
+def place_triangles(triangles, centre, place, drift=False):
+    """Places the circles of a packing, triangle by triangle.
+
+    INPUT:
+
+    - a list of triangles; the fourth entry gives the orientation
+    - a dictionary of centres, with None for the circles not yet placed
+    - a function place(x,c) which returns the centre of the circle c from
+      the pair x of placed circles, oriented as in
+      surface.SurfaceComplex.layout, or None if c can not be placed from
+      this pair
+    - drift, see below
+
+    OUTPUT: None. The dictionary of centres is updated.
+
+    The triangles are kept in a queue. When a circle is placed the
+    triangles which contain it are added to the queue, and a triangle is
+    used when it comes off the queue if exactly one of its centres is
+    unknown. So each triangle is looked at most three times.
+
+    Each placement adds to the floating point error so the error in a
+    centre grows with the length of the chain of placements back to the
+    circles which were placed first. If drift is True then the queue is
+    a priority queue and a circle is always placed from the pair whose
+    longest chain is shortest.
+
+    EXAMPLES:
+
+    >>> centre = { 'a':0j, 'b':1j, 'c':None }
+    >>> place_triangles([('a','b','c',False)], centre, lambda x,c: 2j)
+    >>> centre['c']
+    2j
+
+    """
+    incident = dict()
+    for t in triangles:
+        for i in range(3):
+            incident.setdefault(t[i], []).append(t)
+
+    depth = dict( (c,0) for c in centre if centre[c] is not None )
+    tiebreak = count()
+    if drift:
+        queue = []
+    else:
+        queue = deque()
+
+    def push(c):
+        for t in incident.get(c, []):
+            if drift:
+                # The longest chain of the placed circles of t.
+                key = max( depth[x] for x in t[:3] if x in depth )
+                heappush(queue, (key, next(tiebreak), t))
+            else:
+                queue.append(t)
+
+    for c in depth.keys():
+        push(c)
+
+    while queue:
+        if drift:
+            t = heappop(queue)[2]
+        else:
+            t = queue.popleft()
+        pt = [ t[i] for i in xrange(3) ]
+        unknown = [ i for i in xrange(3) if centre[pt[i]] is None ]
+        if len(unknown) != 1:
+            continue
+        i = unknown[0]
+        if t[3]:
+            x = (pt[i-1],pt[i-2])
+        else:
+            x = (pt[i-2],pt[i-1])
+        z = place(x, pt[i])
+        if z is None:
+            continue
+        centre[pt[i]] = z
+        depth[pt[i]] = max(depth[x[0]], depth[x[1]]) + 1
+        push(pt[i])
+
+def layout_disc(circles, triangles, radius):
+    """Places the circles of a packing of the Poincare disc.
+
+    INPUT: A list of circles, a list of triangles and a dictionary of
+    hyperbolic radii. Circles with infinite radius are horocycles.
+
+    OUTPUT: A dictionary of hyperbolic centres. The centre of a horocycle
+    is the point where it touches the unit circle.
+
+    The first circle which is not a horocycle is placed at the origin.
+    A circle is placed from a triangle in which one of the other two
+    circles is not a horocycle.
+    """
+    finite = lambda c: radius[c] < numpy.inf
+    centre = { c:None for c in circles }
+    c = [ a for a in circles if finite(a) ][0]
+    t = [ t[:3] for t in triangles if c in t[:3] ][0]
+    d = t[t.index(c)-1]
+    centre[c] = complex(0)
+    centre[d] = complex(numpy.tanh((radius[c]+radius[d])/2))
+
+    def place(x, c):
+        if finite(x[0]):
+            return hyp_place(centre[x[0]], centre[x[1]],
+                             radius[x[0]], radius[x[1]], radius[c], 1)
+        elif finite(x[1]):
+            return hyp_place(centre[x[1]], centre[x[0]],
+                             radius[x[1]], radius[x[0]], radius[c], -1)
+        return None
+
+    place_triangles(triangles, centre, place)
+    return centre
+
+def hyp_place(z, w, r, s, t, sign):
+    """Places a circle in the Poincare disc.
+
+    INPUT: The centres z, w and hyperbolic radii r, s of two tangent
+    circles, where r is finite, the radius t of the new circle and the
+    direction.
+
+    OUTPUT: The centre of the circle of radius t which is tangent to
+    both, anticlockwise from w as seen from z if sign is 1 and clockwise
+    if sign is -1.
+    """
+    theta = hyp_angles_h(numpy.array([[r,s,t]]))[0,0]
+    # Move z to the origin by a Mobius transformation of the disc.
+    m = (w-z)/(1-z.conjugate()*w)
+    d = rect(numpy.tanh((r+t)/2), phase(m)+sign*theta)
+    return (d+z)/(1+z.conjugate()*d)
+
+def inverse_stereographic(z, rho):
+    """The inverse of stereographic projection from the north pole.
+
+    INPUT: A Euclidean centre z and radius rho of a circle which does
+    not contain the unit disc.
+
+    OUTPUT: The centre (a unit vector) and the radius of the circle on the
+    sphere.
+
+    EXAMPLES:
+
+    The unit circle is the equator.
+
+    >>> p, r = inverse_stereographic(complex(0), 1.0)
+    >>> numpy.allclose(p, [0,0,-1]), numpy.allclose(r, numpy.pi/2)
+    (True, True)
+
+    """
+    m = abs(z)
+    u = z/m if m > 1e-15 else complex(1)
+    phi = numpy.arctan2(1, m+rho) + numpy.arctan2(1, m-rho)
+    p = numpy.array([numpy.sin(phi)*u.real, numpy.sin(phi)*u.imag, numpy.cos(phi)])
+    return p, float(numpy.arctan2(2*rho, 1+m*m-rho*rho))
+
+def sph_place(p, q, r, s, t):
+    """Places a circle on the sphere.
+
+    INPUT: The centres p, q (unit vectors) and radii r, s of two tangent
+    circles and the radius t of the new circle.
+
+    OUTPUT: The centre of the circle of radius t which is tangent to both
+    and is anticlockwise from q as seen from p (after stereographic
+    projection from the north pole).
+    """
+    alpha = sph_angles(numpy.array([[r,s,t]]))[0,0]
+    v = q - numpy.dot(p,q)*p
+    v /= numpy.sqrt(numpy.dot(v,v))
+    w = numpy.cos(alpha)*v + numpy.sin(alpha)*numpy.cross(v,p)
+    return numpy.cos(r+t)*p + numpy.sin(r+t)*w
+
+def stereographic(p, r):
+    """Stereographic projection of a circle on the sphere from the north pole.
+
+    INPUT: A centre p (a unit vector) and a spherical radius r.
+
+    OUTPUT: The Euclidean centre (a complex number) and radius of the image.
+
+    If the circle contains the north pole the image is the outside of the
+    circle which is returned.
+
+    EXAMPLES:
+
+    The equator is the unit circle.
+
+    >>> z, r = stereographic(numpy.array([0.0,0.0,-1.0]), numpy.pi/2)
+    >>> abs(z) < 1e-12, round(r, 10)
+    (True, 1.0)
+
+    """
+    phi = numpy.arccos(numpy.clip(p[2],-1.0,1.0))
+    u = complex(p[0],p[1])
+    u = u/abs(u) if abs(u) > 1e-15 else complex(1)
+    a = 1/numpy.tan( (phi-r)/2 )
+    b = 1/numpy.tan( (phi+r)/2 )
+    return complex((a+b)/2)*u, float(abs(a-b)/2)
+
+def to_pole(p):
+    """A rotation which takes the unit vector p to the north pole."""
+    n = numpy.array([0.0,0.0,1.0])
+    k = numpy.cross(p,n)
+    s = numpy.sqrt(numpy.dot(k,k))
+    c = numpy.dot(p,n)
+    if s < 1e-15:
+        return numpy.eye(3) if c > 0 else numpy.diag([1.0,-1.0,-1.0])
+    k /= s
+    K = numpy.array([[0,-k[2],k[1]],[k[2],0,-k[0]],[-k[1],k[0],0]])
+    return numpy.eye(3) + s*K + (1-c)*numpy.dot(K,K)
+
+def layout_spherical(circles, triangles, radius, drift=False):
+    """Places the circles of a spherical packing.
+
+    INPUT: A list of circles, a list of triangles (as for SurfaceComplex,
+    the fourth entry gives the orientation) and a dictionary of radii.
+    The order of placement is given by place_triangles().
+
+    OUTPUT: A dictionary of centres on the unit sphere.
+
+    The largest circle is centred at the north pole so that, after
+    stereographic projection, it is the outside of a circle and the
+    remaining circles are inside.
+    """
+    centre = { c:None for c in circles }
+    t = triangles[0]
+    centre[t[0]] = numpy.array([0.0,0.0,-1.0])
+    d = radius[t[0]] + radius[t[1]]
+    centre[t[1]] = numpy.array([numpy.sin(d),0.0,-numpy.cos(d)])
+
+    def place(x, c):
+        return sph_place(centre[x[0]], centre[x[1]], radius[x[0]], radius[x[1]], radius[c])
+
+    place_triangles(triangles, centre, place, drift)
+
+    top = max(circles, key=lambda c: radius[c])
+    R = to_pole(centre[top])
+    return { c:numpy.dot(R,centre[c]) for c in circles }
+
+# This is to run the tests in the examples.
+# http://docs.python.org/library/doctest.html
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -112,7 +112,7 @@ class Morphism():
 
         sm = self.copy()
         om = other.copy()
-        jg = ribbon.justgraph(sm.graph.he.union(om.graph.he))
+        jg = ribbon.justgraph(sm.graph.he.union(om.graph.he), True)
         for u, v in zip(sm.codomain,om.domain):
             jg.stitch(u, v)
         jg.normal()
@@ -279,7 +279,7 @@ def Artin_generator(n,k):
     else:
         raise RuntimeError
 
-    g = ribbon.justgraph( set(do+co) )
+    g = ribbon.justgraph( set(do+co), True )
     return Morphism(g, do, co)
 
 
@@ -41,6 +41,11 @@ Features = namedtuple('Features',['directed','colour','over'])
 
 vanilla = Features('neither','red',True)
 
+# The constructors of justgraph and Embedding skip their checks when called
+# with trusted=True by the routines in this package. Set debug to True to
+# check these as well.
+debug = False
+
 # class halfedge(SageObject):
 class halfedge(object):
     """
@@ -63,20 +68,82 @@ class halfedge(object):
             s, t = t, t.c
         return s
 
+class Orbits(object):
+    """The orbits of a bijection on the half edges of a justgraph.
+
+    The orbits are a list of tuples and index maps each half edge to the
+    position of its orbit in the list. The version is the version of the
+    justgraph the orbits were computed from.
+    """
+    __slots__ = ('orbits', 'index', 'version')
+    def __init__(self, orbits, version):
+        self.orbits = orbits
+        self.index = dict()
+        for i, x in enumerate(orbits):
+            for a in x:
+                self.index[a] = i
+        self.version = version
+
+    def __len__(self):
+        return len(self.orbits)
+
+    def __iter__(self):
+        return iter(self.orbits)
+
+    def __getitem__(self, i):
+        return self.orbits[i]
+
+    def orbit(self, a):
+        """The orbit containing the half edge a."""
+        return self.orbits[self.index[a]]
+
 class justgraph():
     """A class for a set of half edges."""
 
-    def __init__(self,he):
-        if { a.c for a in he } != set(he):
-            raise ValueError("c is not a bijection.")
-        if any( a.e not in he for a in he if a.e != None ):
-            raise ValueError("e is inconsistent.")
-        if any( a.e.e != a for a in he if a.e != None ):
-            raise ValueError("e is not an involution.")
-        if any( a.e == a for a in he if a.e != None ):
-            raise ValueError("e has a fixed point.")
-
+    def __init__(self,he,trusted=False):
         self.he = set(he)
+        self.version = 0
+        self._orbits = dict()
+        if debug or not trusted:
+            self.check()
+
+    def check(self):
+        """Checks that c is a bijection and e is a fixed point free
+        involution on the half edges where it is defined.
+
+        INPUT: None
+
+        OUTPUT: None. A ValueError is raised if a check fails.
+
+        EXAMPLES:
+
+        >>> g = justgraph.vertex(3)
+        >>> g.check()
+        >>> a = list(g.he)
+        >>> a[0].e = a[0]
+        >>> g.check()
+        Traceback (most recent call last):
+        ...
+        ValueError: e has a fixed point.
+
+        """
+        he = self.he
+        if { a.c for a in he } != he:
+            raise ValueError("c is not a bijection.")
+        for a in he:
+            b = a.e
+            if b != None:
+                if b not in he:
+                    raise ValueError("e is inconsistent.")
+                if b == a:
+                    raise ValueError("e has a fixed point.")
+                if b.e != a:
+                    raise ValueError("e is not an involution.")
+
+    # The permutations used by orbits() when no bijection is given.
+    _permutations = { 'vertices': lambda a: a.c,
+                      'edges': lambda a: a.e,
+                      'faces': lambda a: a.e.c }
 
     def _repr_(self):
         s = len(self)
@@ -133,7 +200,7 @@ class justgraph():
         for a in self.he:
             flags[a].e = flags[a.e]
             flags[a.e].c = flags[a.c]
-        g = justgraph(flags.values())
+        g = justgraph(flags.values(), True)
         return g, flags
         
     @staticmethod
@@ -162,7 +229,7 @@ class justgraph():
         for i in xrange(n):
             a[i-1].c = a[i]
 
-        return justgraph(a)
+        return justgraph(a, True)
 
     @staticmethod
     def line():
@@ -189,7 +256,7 @@ class justgraph():
         he = justgraph.vertex(2).he
         for a in he:
             a.IsI = True
-        return justgraph(he)
+        return justgraph(he, True)
 
     @staticmethod
     def polygon(n):
@@ -224,7 +291,7 @@ class justgraph():
             a[i].c = b1[i]
             b1[i].c = b2[i]
             b2[i].c = a[i]
-        return justgraph(a+b1+b2)
+        return justgraph(a+b1+b2, True)
 
     def normal(self):
         """A normalisation. Removes superfluous vertices.
@@ -261,8 +328,10 @@ class justgraph():
                     y.c = z.c
                     z.anti.c = y
                     y.IsI = z.IsI
+                    y.decorations = z.decorations
                     he.discard(x)
                     he.discard(z)
+        self.touch()
 
     def copy(self):
         """Makes a deepcopy with the identification.
@@ -291,9 +360,21 @@ class justgraph():
                 D[a].e = D[a.e]
             D[a].IsI = a.IsI
             D[a].decorations = a.decorations
-        h = justgraph(D.values())
-        return Embedding(D,self,h)
+        h = justgraph(D.values(), True)
+        return Embedding(D,self,h,True)
+
 
+    def canonical(self):
+        """A hashable certificate for the isomorphism class of the graph.
+        See canonical().
+
+        EXAMPLE:
+
+        >>> justgraph.polygon(3).canonical() == justgraph.polygon(3).canonical()
+        True
+
+        """
+        return canonical(self)
 
     def is_connected(self):
         """Tests if graph is connected.
@@ -334,9 +415,9 @@ class justgraph():
         """
 
         if x != None and not x in self.he:
-            raise ValueError, "%s must be an element of %s", %(x,self)
+            raise ValueError, "%s must be an element of %s" % (x,self)
         if x != None and x.e != None:
-            raise ValueError, "%s must be in the boundary of %s", %(x,self)
+            raise ValueError, "%s must be in the boundary of %s" % (x,self)
         if x == None:
             r = [ a for a in self.he if a.e == None ]
             if r == []:
@@ -388,7 +469,7 @@ class justgraph():
             flags[(x,'A',)].decorations = Features('neither','None',True)
             flags[(x,'B',)].decorations = Features('neither','None',True)
 
-        g = justgraph(set(flags.values()))
+        g = justgraph(set(flags.values()), True)
         inc = {x: flags[(x,'O',)] for x in self.he}
             
         return g, inc
@@ -425,7 +506,24 @@ class justgraph():
         [3, 3, 3, 3]
 
         """
-        return self.get_orbits(lambda a: a.c)
+        return self.orbits('vertices').orbits
+
+    @property
+    def edges(self):
+        """Get the edges of a justgraph.
+
+        EXAMPLE:
+
+        >>> sorted( len(a) for a in justgraph.polygon(3).edges )
+        [1, 1, 1, 2, 2, 2]
+
+        """
+        return self.orbits('edges').orbits
+
+    @property
+    def faces(self):
+        """Get the faces of a closed justgraph."""
+        return self.orbits('faces').orbits
 
     def count_vertices(self):
         """Counts the numbers of vertices of each valency in a justgraph.
@@ -475,28 +573,64 @@ class justgraph():
         >>> set(ao) == set(av)
         True
 
+        The orbits are found by walking the half edges in place so the
+        justgraph is not copied. If m is not defined on a boundary half
+        edge it should return None and the orbit stops there.
+
         """
-        phi = self.copy()
-        h = phi.codomain.he
-        inv = dict([ [phi.map[a], a] for a in phi.map ])
+        he = self.he
+        seen = set()
         orbits = []
-        while h != set():
-            s = h.pop()
-            v = [inv[s]]
-            while m(s) in h:
-                t = m(s)
-                v.append(inv[t])
-                h.remove(t)
-                s = t
+        for s in he:
+            if s in seen:
+                continue
+            seen.add(s)
+            v = [s]
+            t = m(s)
+            while t in he and not t in seen:
+                seen.add(t)
+                v.append(t)
+                t = m(t)
             orbits.append(tuple(v))
 
         return orbits
 
-        #D = dict()
-        #for x in orbits:
-            #for a in x:
-                #D[a] = frozenset(x)
-        #return D
+    def orbits(self, name, m=None):
+        """The cached orbits of a bijection on the halfedges.
+
+        INPUT: A name and optionally a bijection. If the bijection is
+        omitted the name is one of 'vertices', 'edges' or 'faces'.
+
+        OUTPUT: An instance of Orbits
+
+        The orbits are recomputed only when the version of the justgraph
+        has changed. The methods stitch() and normal() change the version.
+        If the half edges are modified directly call touch().
+
+        EXAMPLE:
+
+        >>> g = justgraph.polygon(4)
+        >>> g.orbits('vertices') is g.orbits('vertices')
+        True
+        >>> p = g.orbits('vertices')
+        >>> len(p.orbit(p[0][0]))
+        3
+        >>> g.touch()
+        >>> g.orbits('vertices') is p
+        False
+
+        """
+        p = self._orbits.get(name)
+        if p == None or p.version != self.version:
+            if m == None:
+                m = justgraph._permutations[name]
+            p = Orbits(self.get_orbits(m), self.version)
+            self._orbits[name] = p
+        return p
+
+    def touch(self):
+        """Records that the half edges have been modified."""
+        self.version += 1
 
 
     def stitch(self,x,y):
@@ -522,6 +656,7 @@ class justgraph():
         a = Features(x.decorations.directed, y.decorations.colour, True)
         v.decorations = a
         self.he = he
+        self.touch()
 
 # End of class definition
 
@@ -558,7 +693,7 @@ def join(f, g, r, s):
     po = g.copy()
     hs = ps.codomain.he
     ho = po.codomain.he
-    jg = justgraph(hs.union(ho))
+    jg = justgraph(hs.union(ho), True)
 
     for x, y in zip(r,s):
         jg.stitch(ps.map[x], po.map[y])
@@ -577,8 +712,24 @@ def join(f, g, r, s):
 class Embedding():
     """ A class for embeddings of ribbon graphs."""
 
-    def __init__(self,D,f,g):
-        he = f.he
+    def __init__(self,D,f,g,trusted=False):
+        self.domain = f
+        self.codomain = g
+        self.map = D
+        if debug or not trusted:
+            self.check()
+
+    def check(self):
+        """Checks that the map is an injective map of ribbon graphs.
+        A ValueError is raised if a check fails.
+
+        EXAMPLES:
+
+        >>> justgraph.polygon(3).copy().check()
+
+        """
+        D = self.map
+        he = self.domain.he
         if set(D.keys()) != he:
             raise ValueError
         if len(set(D.values())) != len(D):
@@ -586,32 +737,145 @@ class Embedding():
         for a in he:
             if D[a.c] != D[a].c:
                 raise ValueError
-        for a in he:
             if a.e != None:
                 if D[a].e != None and D[a.e] != None:
                     if D[a.e] != D[a].e:
                         raise ValueError
-        for a in he:
             if D[a].IsI != a.IsI:
                 raise ValueError
 
-        self.domain = f
-        self.codomain = g
-        self.map = D
-
     def show(self):
         pass
 
 
-# This could be speeded up by only checking new entries at each pass.
+def _open_face(a):
+    """The face map, which is not defined on the boundary."""
+    if a.e == None:
+        return None
+    return a.e.c
+
+def signatures(g):
+    """The invariants of the half edges used to prune searches.
+
+    INPUT: A justgraph
+
+    OUTPUT: A dictionary from half edges to tuples
+
+    The signature of a half edge is its decorations, IsI, the valency of
+    its vertex and the size of its face, which is None if the face meets
+    the boundary. An embedding preserves the first three. It preserves the
+    face size of a half edge whose face does not meet the boundary.
+
+    EXAMPLES:
+
+    >>> sorted(set( x[1:] for x in signatures(justgraph.polygon(3)).values() ))
+    [(False, 3, None), (False, 3, 3)]
+
+    """
+    pv = g.orbits('vertices')
+    pf = g.orbits('open faces', _open_face)
+    size = dict()
+    for x in pf:
+        n = len(x) if _open_face(x[-1]) is x[0] else None
+        for a in x:
+            size[a] = n
+    return dict( (a, (a.decorations, a.IsI, len(pv.orbit(a)), size[a]))
+                 for a in g.he )
+
+def embeddings(h,g,u=None):
+    """
+    Generates the embeddings of h in g. This requires h is connected.
+
+    INPUT: A pair of ribbon graphs and optionally a half edge of h.
+
+    OUTPUT: An iterator over dictionaries from the half edges of h to the
+    half edges of g.
+
+    Each half edge of g with the same signature as u is tried as the image
+    of u. The map is extended from a frontier of newly mapped half edges
+    along c and e, so each half edge of h is visited once for each start.
+    If u is not given the half edge of h with fewest candidates is used.
+
+    EXAMPLE:
+
+    >>> h=justgraph.vertex(3)
+    >>> g=justgraph.polygon(4)
+    >>> sum( 1 for D in embeddings(h,g) )
+    12
+
+    """
+    if u != None and not u in h.he:
+        raise ValueError("%s must be an element of %s" % (u,h))
+    if len(h.he) == 0:
+        raise ValueError("The graph must be non-empty.")
+
+    # Check h is connected.
+    start = u if u != None else next(iter(h.he))
+    seen = {start}
+    frontier = [start]
+    while frontier:
+        a = frontier.pop()
+        for b in (a.c, a.e):
+            if b != None and not b in seen:
+                seen.add(b)
+                frontier.append(b)
+    if len(seen) != len(h.he):
+        raise ValueError("The graph must be connected.")
+
+    sh = signatures(h)
+    sg = signatures(g)
+    # The half edges of g indexed with and without the face size.
+    index = dict()
+    for x, k in sg.iteritems():
+        index.setdefault(k[:3], []).append(x)
+        index.setdefault(k, []).append(x)
+
+    def candidates(a):
+        k = sh[a]
+        if k[3] == None:
+            return index.get(k[:3], [])
+        return index.get(k, [])
+
+    if u == None:
+        u = min( h.he, key=lambda a: len(candidates(a)) )
+
+    def extend(x):
+        D = {u: x}
+        used = {x}
+        frontier = [u]
+        while frontier:
+            a = frontier.pop()
+            b = D[a]
+            for s, t in ((a.c, b.c), (a.e, b.e)):
+                if s == None:
+                    continue
+                if t == None:
+                    return None
+                if s in D:
+                    if D[s] is not t:
+                        return None
+                elif t in used or sh[s][:3] != sg[t][:3]:
+                    return None
+                else:
+                    D[s] = t
+                    used.add(t)
+                    frontier.append(s)
+        return D
+
+    for x in candidates(u):
+        D = extend(x)
+        if D != None:
+            yield D
+
 # Use search(g,g) to construct the set of automorphisms of g
-def search(h,g,u=None):
+def search(h,g,u=None,count=False):
     """
     Searches for embeddings of h in g. This requires h is connected.
 
-    INPUT: A pair of ribbon graphs.
+    INPUT: A pair of ribbon graphs. Optionally a half edge of h and
+    whether to count the embeddings instead of constructing them.
 
-    OUTPUT: A list of embeddings.
+    OUTPUT: A list of embeddings or the number of embeddings.
 
     EXAMPLE:
 
@@ -619,61 +883,21 @@ def search(h,g,u=None):
     >>> g=justgraph.polygon(4)
     >>> len(search(h,g))
     12
+    >>> search(h,g,count=True)
+    12
 
-    """
-    if u != None and not u in h.fe:
-        raise ValueError
-    if not h.is_connected():
-        raise ValueError
+    The rotations of the tetrahedron:
 
-    # If we did not require a boundary point we could use
-    # u = h.fe.pop(), he.fe.add(u)
-    if u == None:
-        r = [ a for a in h.he if a.e == None ]
-        if r == []: # Is this necessary?
-            raise ValueError
-        else:
-            u = r[0]
+    >>> f = justgraph.vertex(3)
+    >>> p = justgraph.polygon(3)
+    >>> tetrahedron = join(f,p,f.get_bd(),p.get_bd()[::-1])
+    >>> search(tetrahedron,tetrahedron,count=True)
+    12
 
-    def test(x):
-        D[u] = x
-        flag = True
-        while flag:
-            flag = False
-            newD = dict()
-            for a in D:
-                while not a.c in D:
-                    if a in D:
-                        newD[a.c] = D[a].c
-                    elif a in newD:
-                        newD[a.c] = newD[a].c
-                    a = a.c
-            for a in D:
-                if a.e != None and not a.e in D:
-                    newD[a.e] = D[a].e
-            if len(newD) != 0:
-                if any( a.decorations != newD[a].decorations for a in newD ):
-                    return False
-                D.update(newD)
-                flag = True
-            for a in D:
-                if D[a].IsI != a.IsI:
-                    return False
-                if a.c in D:
-                    if D[a.c] != D[a].c:
-                        return False
-                if a.e in D:
-                    if D[a.e] != D[a].e:
-                        return False
-        if len(set(D.values())) != len(D):
-            return False
-        return True
-    output = []
-    for x in g.he:
-        D = dict()
-        if test(x):
-            output.append(Embedding(D, h, g))
-    return output
+    """
+    if count:
+        return sum( 1 for D in embeddings(h,g,u) )
+    return [ Embedding(D, h, g, True) for D in embeddings(h,g,u) ]
 
 
 def overlaps(f,g):
@@ -683,67 +907,205 @@ def overlaps(f,g):
 
     OUTPUT: A list of dictionaries
 
+    An overlap is found by matching a vertex of f with a vertex of g and
+    extending along c, and along e where it is defined in both graphs,
+    until the map closes up. The vertices are only matched if they have
+    the same valency and decorations, and each overlap is listed once;
+    a start which lies in an overlap that has already been found gives
+    the same overlap again and is skipped. If f is g then an overlap and
+    its inverse are the same, so only one of them is listed; the canonical
+    form of an overlap is then its set of unordered pairs.
+
+    EXAMPLES:
+
+    >>> f = justgraph.polygon(4)
+    >>> g = justgraph.polygon(5)
+    >>> len(overlaps(f,g))
+    20
+    >>> sorted(set( len(D) for D in overlaps(f,g) ))
+    [6]
+    >>> h = justgraph.polygon(4)
+    >>> len(overlaps(f,h)), len(overlaps(f,f))
+    (20, 13)
+
     """
 
     if not f.is_connected():
-        raise ValueError
+        raise ValueError("The first graph must be connected.")
     if not g.is_connected():
-        raise ValueError
-
-    def test():
-        for a in D:
-            if a.decorations != D[a].decorations:
-                return False
-            if a.IsI != D[a].IsI:
-                return False
-
-        flag = True
-        while flag:
-            flag = False
-            newD = dict()
-            for a in D:
-                while not a.c in D:
-                    if a in D:
-                        newD[a.c] = D[a].c
-                    elif a in newD:
-                        newD[a.c] = newD[a].c
-                    a = a.c
-            for a in D:
-                if a.e != None and not a.e in D:
-                    if D[a].e != None:
-                        newD[a.e] = D[a].e
-            if len(newD) != 0:
-                if any( a.decorations != newD[a].decorations for a in newD ):
-                    return False
-                D.update(newD)
-                flag = True
-            for a in D:
-                if D[a].IsI != a.IsI:
-                    return False
-                if a.c in D:
-                    if D[a.c] != D[a].c:
+        raise ValueError("The second graph must be connected.")
+
+    def key(a):
+        return (a.decorations, a.IsI)
+
+    def extend(D):
+        used = set(D.values())
+        frontier = list(D)
+        while frontier:
+            a = frontier.pop()
+            b = D[a]
+            for s, t in ((a.c, b.c), (a.e, b.e)):
+                if s == None or t == None:
+                    # The overlap stops here, but it can not meet itself.
+                    if s in D or t in used:
                         return False
-                if a.e in D:
-                    if D[a.e] != D[a].e:
+                    continue
+                if s in D:
+                    if D[s] is not t:
                         return False
-        if len(set(D.values())) != len(D):
-            return False
+                elif t in used or key(s) != key(t):
+                    return False
+                else:
+                    D[s] = t
+                    used.add(t)
+                    frontier.append(s)
         return True
 
+    # The vertices of g indexed by valency and decorations.
+    index = dict()
+    for ug in g.vertices:
+        k = tuple(sorted( key(a) for a in ug ))
+        index.setdefault(k, []).append(ug)
 
     output = []
-    vf = f.get_orbits(lambda a: a.c)
-    vg = g.get_orbits(lambda a: a.c)
-    for uf in vf:
-        n = len(v)
-        for ug in [ u for u in vg if len(u) == n ]:
-            D = dict()
+    covered = set()
+    seen = set()
+    for uf in f.vertices:
+        n = len(uf)
+        k = tuple(sorted( key(a) for a in uf ))
+        for ug in index.get(k, []):
             for i in xrange(n):
-                D[uf[i]] = ug[i]
-            if test():
-                output.append(D)
-    return D
+                if key(uf[0]) != key(ug[i]) or (uf[0], ug[i]) in covered:
+                    continue
+                D = dict()
+                for j in xrange(n):
+                    D[uf[j]] = ug[(i+j) % n]
+                if any( key(a) != key(D[a]) for a in uf ):
+                    continue
+                if extend(D):
+                    covered.update(D.iteritems())
+                    if f is g:
+                        code = frozenset( frozenset(p) for p in D.iteritems() )
+                        if code in seen:
+                            continue
+                        seen.add(code)
+                    output.append(D)
+    return output
+
+
+
+def _code(roots, best=None):
+    """The code of the half edges reached from roots by c and e.
 
+    The half edges are numbered in the order they are reached by a
+    breadth first search which starts with the roots, in order. The code
+    lists, for each half edge in this order, the numbers of its images
+    under c and e, with -1 if e is not defined, its decorations and IsI.
+    If the code is greater than best the search stops and None is
+    returned.
+    """
+    number = dict()
+    order = []
+    for a in roots:
+        if not a in number:
+            number[a] = len(order)
+            order.append(a)
+    code = []
+    equal = best != None
+    i = 0
+    while i < len(order):
+        a = order[i]
+        for x in (a.c, a.e):
+            if x != None and not x in number:
+                number[x] = len(order)
+                order.append(x)
+        entry = (number[a.c], -1 if a.e == None else number[a.e],
+                 a.decorations, a.IsI)
+        if equal:
+            if entry > best[i]:
+                return None
+            if entry < best[i]:
+                equal = False
+        code.append(entry)
+        i += 1
+    return tuple(code)
+
+def canonical(g, roots=None):
+    """A canonical form of a justgraph.
+
+    INPUT: A justgraph and optionally a list of half edges.
+
+    OUTPUT: A hashable certificate
+
+    Two justgraphs have the same certificate if and only if they are
+    isomorphic, preserving the decorations. If roots are given the
+    isomorphism must also preserve them, in order. Each connected
+    component which does not meet the roots is coded from each of its
+    half edges with least signature and the least code is kept. The
+    codes of these components are sorted. This takes O(n^2) time at worst.
+
+    EXAMPLES:
+
+    >>> canonical(justgraph.polygon(4)) == canonical(justgraph.polygon(4))
+    True
+    >>> canonical(justgraph.polygon(4)) == canonical(justgraph.polygon(5))
+    False
+    >>> f = justgraph.vertex(3)
+    >>> p = justgraph.polygon(3)
+    >>> tetrahedron = join(f,p,f.get_bd(),p.get_bd()[::-1])
+    >>> canonical(tetrahedron) == canonical(tetrahedron.dual()[0])
+    True
+
+    """
+    rooted = ()
+    seen = set()
+    if roots:
+        rooted = _code(roots)
+        seen.update(roots)
+        frontier = list(seen)
+        while frontier:
+            a = frontier.pop()
+            for x in (a.c, a.e):
+                if x != None and not x in seen:
+                    seen.add(x)
+                    frontier.append(x)
+
+    sg = signatures(g)
+    codes = []
+    for a in g.he:
+        if a in seen:
+            continue
+        component = [a]
+        seen.add(a)
+        i = 0
+        while i < len(component):
+            for x in (component[i].c, component[i].e):
+                if x != None and not x in seen:
+                    seen.add(x)
+                    component.append(x)
+            i += 1
+        least = min( sg[x] for x in component )
+        best = None
+        for x in component:
+            if sg[x] == least:
+                code = _code([x], best)
+                if code != None:
+                    best = code
+        codes.append(best)
+    return (rooted, tuple(sorted(codes)))
+
+def isomorphic(f, g):
+    """Tests if two justgraphs are isomorphic.
+
+    EXAMPLE:
+
+    >>> isomorphic(justgraph.polygon(3), justgraph.polygon(3))
+    True
+
+    """
+    if len(f.he) != len(g.he):
+        return False
+    return canonical(f) == canonical(g)
 
 
 # This is to run the tests in the examples.
@@ -0,0 +1,466 @@
+
+#*****************************************************************************
+#       Copyright (C) 2013 Bruce Westbury Bruce.Westbury@warwick.ac.uk
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#                  http://www.gnu.org/licenses/
+#*****************************************************************************
+
+"""
+Array implementation of the justgraph in ribbon.py.
+
+The half edges are the integers 0, ..., n-1. The bijection c is an integer
+array which is a permutation and the involution e is an integer array with
+-1 for the half edges in the boundary. The decorations are stored as an array
+of codes into a list of the distinct Features, and IsI as a boolean array.
+So each half edge takes eleven bytes, which means graphs with millions of half
+edges fit in memory and can be copied and pickled quickly.
+
+The functions from_justgraph() and ArrayGraph.to_justgraph() convert between
+the two representations without losing any information.
+
+EXAMPLES:
+
+>>> g = ribbon.justgraph.polygon(4)
+>>> a, he = from_justgraph(g)
+>>> len(a), len(a.get_orbits(a.c))
+(12, 4)
+>>> h, he = a.to_justgraph()
+>>> h.count_vertices()
+[0, 0, 0, 4]
+
+"""
+
+import ribbon
+
+import numpy
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# The decorations of the half edges added by ArrayGraph.subdivision.
+medial = ribbon.Features('neither','None',True)
+
+class ArrayGraph(object):
+    """The class of justgraphs stored as arrays."""
+
+    def __init__(self, c, e, isI, code, features):
+        """Constructor for an array graph.
+
+        INPUT:
+
+        - c, a permutation of range(n)
+        - e, an involution without fixed points, with -1 on the boundary
+        - isI, a boolean array
+        - code, an array of indices into features
+        - features, a list of Features
+        """
+        c = numpy.asarray(c, dtype=numpy.int32)
+        e = numpy.asarray(e, dtype=numpy.int32)
+        n = len(c)
+        if len(e) != n or len(isI) != n or len(code) != n:
+            raise ValueError("The arrays have different lengths.")
+        if n and (c.min() < 0 or c.max() >= n or
+                  numpy.bincount(c, minlength=n).max() != 1):
+            raise ValueError("c is not a bijection.")
+        internal = (e != -1).nonzero()[0]
+        if len(internal):
+            if e.min() < -1 or e.max() >= n:
+                raise ValueError("e is inconsistent.")
+            if (e[e[internal]] != internal).any():
+                raise ValueError("e is not an involution.")
+            if (e[internal] == internal).any():
+                raise ValueError("e has a fixed point.")
+
+        self.c = c
+        self.e = e
+        self.isI = numpy.asarray(isI, dtype=bool)
+        self.code = numpy.asarray(code, dtype=numpy.int16)
+        self.features = list(features)
+
+    def __len__(self):
+        return len(self.c)
+
+    def decorations(self, a):
+        """The Features of the half edge a."""
+        return self.features[self.code[a]]
+
+    def is_closed(self):
+        """Determines if the graph is closed.
+
+        EXAMPLES:
+
+        >>> from_justgraph(ribbon.justgraph.polygon(3))[0].is_closed()
+        False
+
+        """
+        return not (self.e == -1).any()
+
+    def copy(self):
+        """Copies an array graph. The half edge a of the copy corresponds
+        to the half edge a of self."""
+        return ArrayGraph(self.c.copy(), self.e.copy(), self.isI.copy(),
+                          self.code.copy(), self.features)
+
+    @property
+    def f(self):
+        """The bijection a -> a.e.c of a closed graph, whose orbits are
+        the faces."""
+        if not self.is_closed():
+            raise ValueError('The graph must be closed.')
+        return self.c[self.e]
+
+    def orbit_labels(self, *maps):
+        """Labels the orbits of the half edges under some maps.
+
+        INPUT: Arrays which map the half edges to half edges, with -1
+        where a map is not defined, for example self.c and self.e
+
+        OUTPUT: The number of orbits and an array which gives the orbit
+        of each half edge
+
+        Two half edges are in the same orbit if one is taken to the other
+        by a sequence of the maps and their inverses. This is computed by
+        scipy, without a loop in Python.
+
+        EXAMPLES:
+
+        >>> a = from_justgraph(ribbon.justgraph.polygon(4))[0]
+        >>> k, label = a.orbit_labels(a.e)
+        >>> k, sorted(numpy.bincount(label))
+        (8, [1, 1, 1, 1, 2, 2, 2, 2])
+        >>> a.orbit_labels(a.c, a.e)[0]
+        1
+
+        """
+        n = len(maps[0])
+        rows = []
+        cols = []
+        for m in maps:
+            m = numpy.asarray(m)
+            d = (m != -1).nonzero()[0]
+            rows.append(d)
+            cols.append(m[d])
+        rows = numpy.concatenate(rows)
+        cols = numpy.concatenate(cols)
+        g = coo_matrix((numpy.ones(len(rows), dtype=numpy.int8), (rows, cols)),
+                       shape=(n,n))
+        return connected_components(g, directed=False)
+
+    def get_orbits(self, m):
+        """Get the orbits of a permutation of the half edges.
+
+        INPUT: A permutation, for example self.c or self.f, or an
+        involution with -1 on the boundary, such as self.e
+
+        OUTPUT: A list of arrays of half edges. Each orbit starts with
+        its smallest half edge and is in the order given by m, and the
+        orbits are in the order of their smallest half edges.
+
+        The orbits are found by orbit_labels() and the position of each
+        half edge in its orbit by pointer jumping, so this takes
+        O(n log n) time in numpy with no loop over the half edges.
+
+        EXAMPLES:
+
+        >>> a = from_justgraph(ribbon.justgraph.polygon(5))[0]
+        >>> sorted( len(x) for x in a.get_orbits(a.c) )
+        [3, 3, 3, 3, 3]
+        >>> m = numpy.array([3, 0, 4, 1, 2])
+        >>> [ list(x) for x in a.get_orbits(m) ]
+        [[0, 3, 1], [2, 4]]
+
+        """
+        m = numpy.asarray(m, dtype=numpy.int32)
+        n = len(m)
+        k, label = self.orbit_labels(m)
+        a = numpy.arange(n, dtype=numpy.int32)
+        first = numpy.full(k, n, dtype=numpy.int32)
+        numpy.minimum.at(first, label, a)
+        start = first[label]
+
+        # Cut each orbit before its first half edge and find the distance
+        # from each half edge to the end of the cut orbit.
+        nxt = numpy.where(m == start, -1, m)
+        dist = (nxt != -1).astype(numpy.int32)
+        live = (nxt != -1).nonzero()[0]
+        while len(live):
+            q = nxt[live]
+            dist[live] += dist[q]
+            nxt[live] = nxt[q]
+            live = live[nxt[live] != -1]
+
+        order = numpy.lexsort((dist[start] - dist, start))
+        sizes = numpy.bincount(label, minlength=k)[numpy.argsort(first)]
+        return numpy.split(a[order], numpy.cumsum(sizes)[:-1])
+
+    def dual(self):
+        """Finds the dual of a closed graph. The half edge a of the dual
+        corresponds to the half edge a of self, as in justgraph.dual.
+
+        EXAMPLES:
+
+        >>> import spider
+        >>> a = from_justgraph(spider.RibbonGraph.polygon(5).closure().graph)[0]
+        >>> d = a.dual()
+        >>> sorted( len(x) for x in d.get_orbits(d.c) ) == sorted( len(x) for x in a.get_orbits(a.f) )
+        True
+
+        """
+        if not self.is_closed():
+            raise ValueError('The graph must be closed.')
+        n = len(self)
+        return ArrayGraph(self.c[self.e], self.e, numpy.zeros(n, dtype=bool),
+                          numpy.zeros(n, dtype=numpy.int16), [ribbon.vanilla])
+
+    def subdivision(self):
+        """Medial subdivision, as in justgraph.subdivision.
+
+        OUTPUT: An array graph and the array inc
+
+        The half edges of the subdivision are numbered so that the flags
+        (x,'O'), (x,'E'), (x,'A') and (x,'B') are x, x+n, x+2n and x+3n.
+        So inc is the identity.
+
+        EXAMPLES:
+
+        >>> import spider
+        >>> g = spider.RibbonGraph.polygon(5).closure().graph
+        >>> h, inc = g.subdivision()
+        >>> s, inc = from_justgraph(g)[0].subdivision()
+        >>> sorted( len(x) for x in s.get_orbits(s.c) ) == sorted( len(x) for x in h.vertices )
+        True
+
+        """
+        if not self.is_closed():
+            raise ValueError('The graph must be closed.')
+        n = len(self)
+        x = numpy.arange(n, dtype=numpy.int32)
+        c, e = self.c, self.e
+        O, E, A, B = x, x+n, x+2*n, x+3*n
+
+        nc = numpy.empty(4*n, dtype=numpy.int32)
+        ne = numpy.empty(4*n, dtype=numpy.int32)
+        ne[O] = E
+        ne[E] = O
+        ne[A] = B[c]
+        ne[B[c]] = A
+        nc[O] = O[c]
+        nc[E] = B
+        nc[A] = E
+        nc[B] = A[e]
+
+        if medial in self.features:
+            m = self.features.index(medial)
+            features = self.features
+        else:
+            m = len(self.features)
+            features = self.features + [medial]
+        code = numpy.concatenate((self.code, self.code,
+                                  numpy.ones(2*n, dtype=numpy.int16)*m))
+        g = ArrayGraph(nc, ne, numpy.zeros(4*n, dtype=bool), code, features)
+        return g, x.copy()
+
+    def stitch(self, x, y):
+        """Joins boundary half edges with a line, as in justgraph.stitch.
+
+        INPUT: Two boundary half edges, or two arrays of boundary half edges
+        of the same length
+
+        OUTPUT: The new half edges, u joined to x and v joined to y
+
+        The graph is modified in place. All the pairs are stitched at once,
+        so stitching many pairs only copies the arrays once.
+
+        EXAMPLES:
+
+        >>> a = from_justgraph(ribbon.justgraph.polygon(4))[0]
+        >>> x, y = (a.e == -1).nonzero()[0][:2]
+        >>> u, v = a.stitch(x, y)
+        >>> len(a)
+        14
+        >>> number = a.normal()
+        >>> len(a), a.e[number[x]] == number[y]
+        (12, True)
+
+        """
+        x = numpy.atleast_1d(numpy.asarray(x, dtype=numpy.int32))
+        y = numpy.atleast_1d(numpy.asarray(y, dtype=numpy.int32))
+        if len(x) != len(y):
+            raise ValueError('Different numbers of half edges.')
+        if (self.e[x] != -1).any() or (self.e[y] != -1).any():
+            raise ValueError('Not a boundary halfedge')
+        features = self.features
+        allowed = [ ('neither','neither'), ('head','tail'), ('tail','head') ]
+        ucode, vcode = [], []
+        for a, b in zip(self.code[x], self.code[y]):
+            fx, fy = features[a], features[b]
+            if fx.colour != fy.colour:
+                raise ValueError('Colours do not match.')
+            if not (fx.directed,fy.directed) in allowed:
+                raise ValueError('Directions do not match.')
+            for new, l in [ (ribbon.Features(fy.directed, fx.colour, True), ucode),
+                            (ribbon.Features(fx.directed, fy.colour, True), vcode) ]:
+                if not new in features:
+                    features.append(new)
+                l.append(features.index(new))
+
+        n, k = len(self), len(x)
+        u = numpy.arange(n, n+k, dtype=numpy.int32)
+        v = u + k
+        self.c = numpy.concatenate((self.c, v, u))
+        self.e = numpy.concatenate((self.e, x, y))
+        self.e[x] = u
+        self.e[y] = v
+        self.isI = numpy.concatenate((self.isI, numpy.ones(2*k, dtype=bool)))
+        self.code = numpy.concatenate((self.code,
+                                       numpy.array(ucode+vcode, dtype=numpy.int16)))
+        return u, v
+
+    def normal(self):
+        """A normalisation. Removes superfluous vertices, as in
+        justgraph.normal.
+
+        OUTPUT: An array which gives the new number of each half edge,
+        or -1 if it has been removed
+
+        The graph is modified in place and the half edges are renumbered.
+        The strands of vertices made by stitch() are found by
+        orbit_labels() and each is removed at once, so this takes
+        O(n) time in numpy with no loop over the half edges.
+
+        EXAMPLE:
+
+        >>> import pivotal
+        >>> s = pivotal.Artin_generator(3,1).copy()
+        >>> t = pivotal.Artin_generator(3,-2).copy()
+        >>> g = ribbon.justgraph(s.graph.he.union(t.graph.he), True)
+        >>> for u, v in zip(s.codomain, t.domain):
+        ...     g.stitch(u, v)
+        >>> a = from_justgraph(g)[0]
+        >>> g.normal()
+        >>> number = a.normal()
+        >>> h = a.to_justgraph()[0]
+        >>> key = lambda k: sorted( (x.decorations, x.IsI) for x in k.he )
+        >>> key(g) == key(h)
+        True
+
+        """
+        c, e, code = self.c.copy(), self.e.copy(), self.code.copy()
+        isI = self.isI
+        n = len(c)
+        a = numpy.arange(n, dtype=numpy.int32)
+
+        # The vertices made by stitch() have two half edges with IsI set.
+        # These lie on strands, the orbits of e and of c restricted to
+        # these half edges. The ends of a strand are either half edges
+        # without IsI or boundary half edges with IsI.
+        k, label = self.orbit_labels(e, numpy.where(isI, c, -1))
+        strand = numpy.bincount(label, weights=isI, minlength=k) > 0
+        degree = (e != -1) + isI.astype(numpy.int32)
+        ends = ((degree == 1) & strand[label]).nonzero()[0]
+        ends = ends[numpy.argsort(label[ends], kind='mergesort')]
+        x, y = ends[0::2], ends[1::2]
+        swap = isI[x] & ~isI[y]
+        x[swap], y[swap] = y[swap], x[swap]
+        join = ~isI[x] & ~isI[y]
+        move = ~isI[x] & isI[y]
+        both = isI[x] & isI[y]
+        removed = isI.copy()
+
+        # A strand between two half edges: these are joined.
+        e[x[join]] = y[join]
+        e[y[join]] = x[join]
+
+        # A strand from a half edge p to the boundary: the boundary half
+        # edge b at the end takes the place of p.
+        p, b = x[move], y[move]
+        replace = a.copy()
+        replace[p] = b
+        c = replace[c]
+        c[b] = c[p]
+        code[b] = code[p]
+        isI = isI.copy()
+        isI[b] = False
+        removed[p] = True
+        removed[b] = False
+
+        # A strand between two boundary half edges: the ends make a vertex.
+        c[x[both]] = y[both]
+        c[y[both]] = x[both]
+        removed[x[both]] = removed[y[both]] = False
+
+        # A closed strand: the vertex of its first half edge is joined to
+        # itself.
+        closed = strand.copy()
+        closed[label[ends]] = False
+        first = numpy.full(k, n, dtype=numpy.int32)
+        numpy.minimum.at(first, label, a)
+        u = first[closed]
+        v = c[u]
+        e[u] = v
+        e[v] = u
+        removed[u] = removed[v] = False
+
+        keep = ~removed
+        number = numpy.cumsum(keep, dtype=numpy.int32) - 1
+        number[removed] = -1
+        e = e[keep]
+        self.c = number[c[keep]]
+        self.e = numpy.where(e == -1, -1, number[e]).astype(numpy.int32)
+        self.isI = isI[keep]
+        self.code = code[keep]
+        return number
+
+    def to_justgraph(self):
+        """Converts to the representation in ribbon.py.
+
+        OUTPUT: A justgraph and the list of its half edges, in which the
+        half edge in position a corresponds to a
+        """
+        he = [ ribbon.halfedge() for a in xrange(len(self)) ]
+        features = self.features
+        for a, (c, e, i, d) in enumerate(zip(self.c.tolist(), self.e.tolist(),
+                                             self.isI.tolist(), self.code.tolist())):
+            x = he[a]
+            x.c = he[c]
+            if e != -1:
+                x.e = he[e]
+            x.IsI = i
+            x.decorations = features[d]
+        return ribbon.justgraph(he), he
+
+# End of class definition
+
+def from_justgraph(g, he=None):
+    """Converts a justgraph to an array graph.
+
+    INPUT: A justgraph and optionally a list of its half edges, which
+    gives the numbering
+
+    OUTPUT: An array graph and the list of half edges, in which the
+    half edge in position a corresponds to a
+    """
+    if he == None:
+        he = list(g.he)
+    index = { x:a for a, x in enumerate(he) }
+    if len(index) != len(g.he):
+        raise ValueError("The list is not the set of half edges.")
+    c = [ index[x.c] for x in he ]
+    e = [ -1 if x.e == None else index[x.e] for x in he ]
+    isI = [ x.IsI for x in he ]
+    features = []
+    number = dict()
+    code = []
+    for x in he:
+        d = x.decorations
+        if not d in number:
+            number[d] = len(features)
+            features.append(d)
+        code.append(number[d])
+    return ArrayGraph(c, e, isI, code, features), he
+
+# This is to run the tests in the examples.
+# http://docs.python.org/library/doctest.html
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
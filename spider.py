@@ -103,7 +103,7 @@ class RibbonGraph(object):
                     raise ValueError
                 a[i].decorations = r
 
-        h = ribbon.justgraph(a)
+        h = ribbon.justgraph(a, True)
         return RibbonGraph(h,a)
 
     @staticmethod
@@ -145,7 +145,7 @@ class RibbonGraph(object):
             a[i].c = b1[i]
             b1[i].c = b2[i]
             b2[i].c = a[i]
-        h = ribbon.justgraph(a+b1+b2)
+        h = ribbon.justgraph(a+b1+b2, True)
         return RibbonGraph(h,a)
 
     def rotate(self,n):
@@ -200,14 +200,35 @@ class RibbonGraph(object):
         b = [ phi.map[a] for a in self.bd ]
         return RibbonGraph(h,b)
 
+    def canonical(self):
+        """A hashable certificate for the ribbon graph. Two ribbon graphs
+        have the same certificate if and only if they are isomorphic by
+        an isomorphism which preserves the boundary points in order.
+
+        EXAMPLE:
+
+        >>> len(set( g.canonical() for g in trees(4) ))
+        14
+        >>> g = RibbonGraph.polygon(5)
+        >>> g.canonical() == g.copy().canonical()
+        True
+        >>> g.canonical() == g.rotate(1).canonical()
+        True
+
+        """
+        return ribbon.canonical(self.jg, list(self.bd))
+
     def show(self,
-             geometry = 'Euclidean',
-             boundary = 'Neumann',
-             bv = None,
              style = 'SVG',
-             name = None):
+             name = None,
+             bv = None,
+             **kwargs):
         """Shows the ribbon graph.
 
+        The geometry and boundary conditions of the closure can be given
+        as the keywords geometry and boundary. The defaults are
+        'Euclidean' and 'Neumann'.
+
         EXAMPLES:
 
         >>> g = RibbonGraph.vertex(4)
@@ -221,10 +242,14 @@ class RibbonGraph(object):
 
 
         """
+        geometry = kwargs.pop('geometry', 'Euclidean')
+        boundary = kwargs.pop('boundary', 'Neumann')
+        if kwargs:
+            raise TypeError, "show() got an unexpected keyword argument %s" % kwargs.keys()[0]
         if bv == None:
             bv = [ 1 for a in self.bd ]
 
-        self.closure(bv).show(style, name )
+        self.closure(bv, geometry, boundary).show(style, name )
 
     def morphism(self,n,m):
         """Construct a morphism from a ribbon graph.
@@ -259,10 +284,11 @@ class RibbonGraph(object):
         """
         return self.jg.get_bd(self.bd[0]) == list(self.bd)
 
-    def closure(self, bv=None):
+    def closure(self, bv=None, geometry='Euclidean', boundary='Neumann'):
         """Construct the closure of a web.
 
-        INPUT: A web and a boundary vector.
+        INPUT: A web and a boundary vector. Optionally the geometry and
+        boundary conditions for the closed graph.
 
         OUTPUT: A closed web.
 
@@ -334,7 +360,7 @@ class RibbonGraph(object):
             r.e = ci[i]
             ci[i].e = r
 
-        ng = ribbon.justgraph(he)
+        ng = ribbon.justgraph(he, True)
 
         u = co[0]
         outside = [u]
@@ -343,7 +369,7 @@ class RibbonGraph(object):
             outside.append(s)
             s = s.e.c
 
-        return closedgraph.ClosedGraph(ng, outside)
+        return closedgraph.ClosedGraph(ng, outside, geometry, boundary)
 
 # End of class definition
 
@@ -373,7 +399,7 @@ def glue(g,h,n):
     a = g.copy()
     b = h.copy()
     he = a.jg.he.union(b.jg.he)
-    jg = ribbon.justgraph(he)
+    jg = ribbon.justgraph(he, True)
 
     for i in xrange(n):
         x = a.bd.pop()
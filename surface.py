@@ -19,9 +19,30 @@ This information is then available for different implementations of circle packi
 import spider
 import closedgraph
 import graphics
+import telemetry
+import packing
 
-from cmath import rect
-from math import pi, sin, acos, asin, sqrt
+import numpy
+
+import multiprocessing
+import traceback
+import os
+
+from time import time, sleep
+from multiprocessing.queues import SimpleQueue
+from array import array
+from collections import namedtuple
+
+from cmath import rect, phase
+from math import pi, sin, cos, acos, asin, sqrt, isinf, tanh, atanh
+
+# This has the attributes of a ClosedGraph used by SurfaceComplex.
+# It is constructed by decode().
+Complex = namedtuple('Complex',['Vcircles','Ecircles','Fcircles','triangles',\
+                                'outside','geometry','boundary_condition','options'])
+
+# The result of packing one closed graph with pack_many().
+Packed = namedtuple('Packed',['radius','centre','error','summary'])
 
 def euc_tri01(u):
     a = [ u[i-2]+u[i-1] for i in range(3) ]
@@ -31,7 +52,10 @@ def euc_tri01(u):
              for i in range(3) ]
 
 def hyp_tri01(u):
-    raise NotImplementedError, "Hyperbolic geometry has not been implemented."
+    """The hyperbolic cosine rule. The radii are x-radii, x = exp(-2h)
+    where h is the hyperbolic radius, so a horocycle has x = 0."""
+    return [ acos( ((1+u[i]*u[i-1])*(1+u[i]*u[i-2]) - 2*u[i]*(1+u[i-1]*u[i-2]))
+                   / ((1-u[i]*u[i-1])*(1-u[i]*u[i-2])) ) for i in range(3) ]
 
 def euc_tri02(u):
     a = [ (u[i-1]/(u[i]+u[i-1])) * (u[i-2]/(u[i]+u[i-2])) for i in range(3) ]
@@ -41,6 +65,31 @@ def hyp_tri02(u):
     a = [ ((1-u[i-1])/(1-u[i]*u[i-1])) * ((1-u[i-2])/(1-u[i]*u[i-2])) for i in range(3) ]
     return [ 2*asin(sqrt(u[i]*a[i])) for i in range(3) ]
 
+def hyp_distance(r,s):
+    """The Euclidean distance from the origin in the Poincare disc of a
+    point at hyperbolic distance h_r+h_s, where r, s are x-radii."""
+    e = sqrt(r*s)
+    return (1-e)/(1+e)
+
+def hyp_to_euc(z,r):
+    """Converts a hyperbolic circle in the Poincare disc, given by its
+    hyperbolic centre z and x-radius r, to its Euclidean centre and radius.
+
+    EXAMPLES:
+
+    >>> z, r = hyp_to_euc(complex(0), 1.0/9)
+    >>> z, round(r, 10)
+    (0j, 0.5)
+
+    """
+    tb = hyp_distance(r,1)
+    ta = abs(z)
+    if ta == 0:
+        return complex(0), tb
+    a = (ta-tb)/(1-ta*tb)
+    b = (ta+tb)/(1+ta*tb)
+    return (a+b)/2 * z/ta, (b-a)/2
+
 def euc_adj(c,a,k,d,r):
     beta = sin( a/(2*k) )
     f = (d-1)/d
@@ -60,6 +109,20 @@ class SurfaceComplex(object):
     er = 10.0
     tolerance = 0.1
 
+    # These are x-radii for hyperbolic geometry.
+    hyp_vr = 0.1
+    hyp_er = 0.5
+
+    # This is the default for packing_accelerated.
+    backend = 'dict'
+
+    # With at least this many circles layout() uses conjgrad().
+    conjgrad_size = 2000
+
+    # On the sphere packing_subdivision changes to Newton's method
+    # at this error.
+    smoothing = 0.1
+
 
     def __init__(self,gc):
         """
@@ -69,16 +132,23 @@ class SurfaceComplex(object):
         >>> SurfaceComplex(g.closure()) #doctest: +ELLIPSIS
         <__main__.SurfaceComplex object at 0x...>
 
+        >>> SurfaceComplex(g)
+        Traceback (most recent call last):
+        ...
+        ValueError: This construction takes a closed graph.
+
         """
 
-        if not isinstance(gc, closedgraph.ClosedGraph):
-            return ValueError, "This construction takes a closed graph."
+        if not isinstance(gc, (closedgraph.ClosedGraph, Complex)):
+            raise ValueError, "This construction takes a closed graph."
 
         self.Vcircles = gc.Vcircles
         self.Ecircles = gc.Ecircles
         self.Fcircles = gc.Fcircles
 
         self.triangles = gc.triangles
+        # The circle indices of the triangles, if the closed graph has them.
+        self.tri = getattr(gc, 'tri', None)
 
         self.outside = gc.outside
         self.boundary_condition = gc.boundary_condition
@@ -87,15 +157,120 @@ class SurfaceComplex(object):
         self.geometry = gc.geometry
         self.boundary_condition = gc.boundary_condition
 
+    def index(self):
+        """Builds the incidence tables for the complex in one pass over the
+        triangles. These are cached on the instance.
+
+        - incident maps a circle to the list of triangles containing it
+        - neighbours maps a circle to the number of these triangles
+        - delta maps an interior circle to the number used for correction
+        - vertex_circle, edge_circle and face_circle map a half edge
+          to its circles
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g)
+        >>> sum( s.index().neighbours.values() ) == 3*len(s.triangles)
+        True
+
+        """
+        if hasattr(self, 'incident'):
+            return self
+
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+
+        incident = { c:[] for c in circles }
+        for t in self.triangles:
+            for i in range(3):
+                incident[t[i]].append(t)
+
+        neighbours = { c:len(incident[c]) for c in circles }
+
+        # This is delta in Stephenson's notation.
+        delta = { c:sin(c.angle/(2*neighbours[c]))
+                  for c in circles if not c.boundary }
+
+        vertex_circle = dict()
+        for x in self.Vcircles:
+            for a in x.halfedges:
+                vertex_circle[a] = x
+
+        edge_circle = dict()
+        for x in self.Ecircles:
+            for a in x.halfedges:
+                edge_circle[a] = x
+
+        face_circle = dict()
+        for x in self.Fcircles:
+            for a in x.halfedges:
+                face_circle[a] = x
+
+        self.incident = incident
+        self.neighbours = neighbours
+        self.delta = delta
+        self.vertex_circle = vertex_circle
+        self.edge_circle = edge_circle
+        self.face_circle = face_circle
+        return self
+
+    def angle_sum(self, c, radius, _tri=None):
+        """Calculates the angle sum at the circle c from the incident
+        triangles only."""
+        if _tri == None:
+            _tri = euc_tri01 if self.geometry == 'Euclidean' else hyp_tri01
+        total = 0.0
+        for t in self.incident[c]:
+            u = [ radius[t[i]] for i in range(3) ]
+            total += _tri(u)[t.index(c)]
+        return total
+
+    def initial_radii(self):
+        """The radii used to start the packing algorithms.
+
+        OUTPUT: A dictionary of radii and a dictionary of fixed radii
+
+        The circles marked as boundary keep their radius. If there are no
+        such circles and the geometry is Euclidean then the first circle
+        is fixed to normalise the packing.
+        """
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        if self.geometry == 'Euclidean':
+            er, vr = SurfaceComplex.er, SurfaceComplex.vr
+        elif self.geometry == 'hyperbolic':
+            er, vr = SurfaceComplex.hyp_er, SurfaceComplex.hyp_vr
+        else:
+            raise RuntimeError, "This can't happen."
+
+        radius = { c:er for c in circles }
+        fixed = { c:vr for c in circles if c.boundary }
+        if not fixed and self.geometry == 'Euclidean':
+            fixed = { circles[0]:vr }
+        radius.update(fixed)
+        return radius, fixed
+
+    def euclidean_circle(self, c):
+        """The Euclidean centre and radius of a circle for drawing."""
+        if self.geometry == 'hyperbolic':
+            return hyp_to_euc(self.centre[c], self.radius[c])
+        if self.geometry == 'spherical':
+            return packing.stereographic(self.sphere[c], self.radius[c])
+        return self.centre[c], self.radius[c]
+
     def rim(self):
-        """Assumes Neumann boundary conditions."""
+        """Places the boundary circles from their radii alone.
+        Assumes Neumann boundary conditions.
+
+        OUTPUT: A dictionary of centres of the boundary circles
+
+        A ValueError is raised if the exterior angles do not sum to 2*pi.
+        """
         if not hasattr(self, 'radius'):
             self.layout()
 
-        bV = [[ a for a in self.Vcircles if x in a.halfedges ][0] \
-              for x in self.outside ]
-        bE = [[ a for a in self.Ecircles if x in a.halfedges ][0] \
-              for x in self.outside ]
+        self.index()
+        bV = [ self.vertex_circle[x] for x in self.outside ]
+        bE = [ self.edge_circle[x] for x in self.outside ]
         n = len(bV)
         if n != len(bE):
             raise RuntimeError
@@ -105,15 +280,15 @@ class SurfaceComplex(object):
 
         angles = [ pi-a.angle for a in bV ]
         ta = sum(angles)
-        if 2*pi != ta:
-            print "Warning sum of exterior angles is %s" % ta
+        if abs(ta - 2*pi) > SurfaceComplex.error:
+            raise ValueError, "The exterior angles sum to %s, not 2*pi." % ta
         ag = [0]*n
         #ag[0] = angles[0]
         for i in range(n-1):
             ag[i+1] = ag[i] + angles[i]
 
         sr = [ self.radius[bV[i]] for i in range(n) ]
-        lengths = [ sr[i] + 2*self.radius[bE[i]] + sr[i-1] \
+        lengths = [ sr[i] + 2*self.radius[bE[i-1]] + sr[i-1] \
                     for i in range(n) ]
         #print "Lengths (rim): ", [ "%3.4f " % lengths[i] for i in range(n) ]
         #cenV = [ self.centre[bV[i]] for i in range(n) ]
@@ -122,9 +297,6 @@ class SurfaceComplex(object):
         sides = [ -rect(r, phi) for r, phi in zip(lengths, ag) ]
         #print [ "%3.4f " % abs(cenV[i]-cenV[i-1]-sides[i]) for i in range(n) ]
 
-        from math import log10
-        print "Accurate to %3.2f decimal places." % log10(abs(sum(sides)))
-
         co = [0]*n
         #co[0] = sides[0]
         for i in range(n-1):
@@ -135,8 +307,8 @@ class SurfaceComplex(object):
         #print [ "%3.4f " % abs(cenV[i]-co[i]) for i in range(n) ]
 
         for i in range(n):
-            s = self.radius[bV[i-1]] + self.radius[bE[i]]
-            r = self.radius[bV[i]]   + self.radius[bE[i]]
+            s = self.radius[bV[i-1]] + self.radius[bE[i-1]]
+            r = self.radius[bV[i]]   + self.radius[bE[i-1]]
             pos[ bE[i-1] ] = (r*co[i-1]+s*co[i])/(r+s)
 
         #cenE = [ self.centre[bE[i]] for i in range(n) ]
@@ -144,12 +316,14 @@ class SurfaceComplex(object):
 
         return pos
 
-    def packing_basic(self):
+    def packing_basic(self, recorder=None):
         """This implements the algorithm in:
 
         Introduction to Circle Packing by Ken Stephenson, Practicum III
 
         (without using either of the acceleration schemes).
+
+        If a telemetry.Recorder is given it is called at each iteration.
         """
 
         if self.geometry == 'Euclidean':
@@ -161,29 +335,15 @@ class SurfaceComplex(object):
         else:
             raise RuntimeError, "This can't happen."
 
-        if self.boundary_condition == 'Neumann':
-            radius = {}
-
+        if self.boundary_condition in ['Neumann','Dirichlet']:
             circles = self.Vcircles + self.Ecircles + self.Fcircles
-            for c in circles:
-                radius[c] = SurfaceComplex.er
-
-            for c in self.Vcircles:
-                if c.boundary:
-                    radius[c] = SurfaceComplex.vr
-
-            # Dictionary for number of neighbours
-            neighbours = dict([ (c,len([ t for t in self.triangles if c in t ])) for c in circles])
+            radius, fixed = self.initial_radii()
 
-            int_circles = [ c for c in circles if not c.boundary ]
-            # Dictionary for number used for correction.
-            # This is delta in Stephenson's notation.
-            delta = dict([ (c,sin(c.angle/(2*neighbours[c]))) for c in int_circles])
+            self.index()
+            neighbours = self.neighbours
+            delta = self.delta
 
-            #if int_circles != circles: # Dirichlet boundary conditions
-            #    itcirc = int_circles
-            #else: # von Neumann boundary conditions
-            itcirc = int_circles[1:]
+            itcirc = [ c for c in circles if c not in fixed ]
 
             angle = {}
 
@@ -207,27 +367,69 @@ class SurfaceComplex(object):
                 # Now we have the problem of assigning these angles to the vertices.
 
 
+                t0 = time()
                 for t in self.triangles:
                     u = [ radius[t[i]] for i in range(3) ]
                     ac = _tri(u)
                     for i in range(3):
                         angle[t[i]] += ac[i]
 
+                t1 = time()
                 for c in itcirc:
                     r = _adj(c,angle[c],neighbours[c],delta[c],radius[c])
                     if abs(r-radius[c]) > SurfaceComplex.error:
                         packing = False
                     radius[c] = r
 
+                if recorder != None:
+                    ae = [ c.angle - angle[c] for c in circles if not c.boundary ]
+                    recorder(telemetry.Iteration(count,
+                        sqrt(sum( x*x for x in ae )), None, t1-t0, time()-t1, 0.0,
+                        len([ x for x in ae if abs(x) > SurfaceComplex.error ])))
+
+            if recorder != None:
+                recorder.finish('packing_basic', True)
             self.radius = radius
 
-    def packing_accelerated(self):
+    def packing_accelerated(self, backend=None, recorder=None):
         """This implements the Uniform Neighbour Model in
 
         A Circle Packing Algorithm by Charles R. Collins & Ken Stephenson
 
         (using the acceleration scheme).
+
+        The backend is either 'dict', which stores the radii in a dictionary
+        keyed by the circles, or 'numpy', which uses the array implementation
+        in packing.py. Both give the same radii. The default is given by
+        the backend attribute, which can be set on an instance or, for
+        all instances, on SurfaceComplex. Spherical geometry is only implemented
+        in packing.py.
+
+        If a telemetry.Recorder is given it is called at each iteration.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.packing_accelerated()
+        >>> t = SurfaceComplex(g); t.packing_accelerated(backend='numpy')
+        >>> max( abs(s.radius[c]-t.radius[c]) for c in s.radius ) < 0.00001
+        True
+        >>> u = SurfaceComplex(g); u.backend = 'numpy'; u.packing_accelerated()
+        >>> u.radius == t.radius
+        True
+
         """
+        if backend == None:
+            backend = self.backend
+        if self.geometry == 'spherical':
+            self.packing_disc(recorder)
+            return
+        if backend == 'numpy':
+            self.radius = packing.packing_accelerated(self, recorder)
+            return
+        elif backend != 'dict':
+            raise ValueError, "Unknown backend %s." % backend
+
         if self.geometry == 'Euclidean':
             _tri   = euc_tri01
             _adj   = euc_adj
@@ -238,34 +440,22 @@ class SurfaceComplex(object):
             raise RuntimeError, "This can't happen."
 
         circles = self.Vcircles + self.Ecircles + self.Fcircles
-        radius_new = { x:SurfaceComplex.er for x in circles }
-
-        for c in self.Vcircles:
-            if c.boundary:
-                radius_new[c] = SurfaceComplex.vr
+        radius_new, fixed = self.initial_radii()
 
-        # Dictionary for number of neighbours
-        neighbours = dict([ (c,len([ t for t in self.triangles if c in t ])) for c in circles])
-        mx = max( n for n in neighbours.values() )
+        self.index()
+        neighbours = self.neighbours
+        delta = self.delta
 
-        # Dictionary for number used for correction.
-        # This is delta in Stephenson's notation.
-        delta = dict([ (c,sin(c.angle/(2*neighbours[c])))
-                       for c in circles if not c.boundary ])
-
-        #if int_circles != circles: # Dirichlet boundary conditions
-        #    itcirc = [ c for c in circles if not c.boundary ]
-        #else: # von Neumann boundary conditions
-        itcirc = circles[1:]
+        itcirc = [ c for c in circles if c not in fixed ]
 
         angle = {}
         error_new = 1 + SurfaceComplex.error
         lambda_new = -1
         flag_new = False
 
-        packing = False
+        packed = False
         count = 0
-        while not packing:
+        while not packed:
             count += 1
             error_old  = error_new
             lambda_old = lambda_new
@@ -275,6 +465,7 @@ class SurfaceComplex(object):
             for c in circles:
                 angle[c] = 0.0
             
+            t0 = time()
             for t in self.triangles:
                 u = [ radius_old[t[i]] for i in range(3) ]
                 ac = _tri(u)
@@ -282,34 +473,330 @@ class SurfaceComplex(object):
                     angle[t[i]] += ac[i]
 
             total = 0
+            outside = 0
+            # The angle sums at boundary circles are not prescribed.
             for c in circles:
+                if c.boundary:
+                    continue
                 ae = c.angle - angle[c]
                 total += ae*ae
+                if abs(ae) > SurfaceComplex.error:
+                    outside += 1
             error_new = sqrt(total)
-            packing = error_new < SurfaceComplex.error
+            error = error_new
+            packed = error_new < SurfaceComplex.error
 
-            radius_new = {circles[0]:SurfaceComplex.vr}
+            t1 = time()
+            radius_new = dict(fixed)
 
             for c in itcirc:
                 radius_new[c] = _adj(c,angle[c],neighbours[c],delta[c],radius_old[c])
 
+            t2 = time()
             lambda_new = error_new / error_old
             flag_new = True
+            factor = None
 
             if flag_old and lambda_new < 1:
                 error_new *= lambda_new
                 if abs( lambda_new - lambda_old ) < SurfaceComplex.tolerance:
                     lambda_new = lambda_new / (1-lambda_new)
-                lambda_max = min( radius_new[c] / (radius_old[c]-radius_new[c])
-                        for c in itcirc if radius_old[c] > radius_new[c] )
-                lambda_new = min( lambda_new, lambda_max * 0.5 )
+                lm = [ radius_new[c] / (radius_old[c]-radius_new[c])
+                        for c in itcirc if radius_old[c] > radius_new[c] ]
+                if self.geometry == 'hyperbolic':
+                    # x-radii must also stay below 1.
+                    lm += [ (1-radius_new[c]) / (radius_new[c]-radius_old[c])
+                        for c in itcirc if radius_old[c] < radius_new[c] ]
+                if lm:
+                    lambda_new = min( lambda_new, min(lm) * 0.5 )
                 for c in itcirc:
                     r = radius_new[c]
                     radius_new[c] = r + lambda_new * (r-radius_old[c])
                 flag_new = False
+                factor = lambda_new
 
+            if recorder != None:
+                recorder(telemetry.Iteration(count, error, factor,
+                            t1-t0, t2-t1, time()-t2, outside))
+
+        if recorder != None:
+            recorder.finish('packing_accelerated', True)
         self.radius = radius_new
 
+    def packing_newton(self, recorder=None):
+        """This solves the angle sum equations by Newton's method in
+        the logarithms of the radii, using a sparse Jacobian. This is
+        implemented in packing.py and converges in far fewer iterations
+        than packing_accelerated.
+
+        If a telemetry.Recorder is given it is called at each iteration.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.packing_accelerated()
+        >>> t = SurfaceComplex(g); t.packing_newton()
+        >>> max( abs(s.radius[c]-t.radius[c]) for c in s.radius ) < 0.00001
+        True
+
+        """
+        self.radius = packing.packing_newton(self, recorder=recorder)
+
+    def packing_warm(self, old, cmap, recorder=None, maxiter=None):
+        """Packs the complex starting from the radii of a previous packing.
+
+        INPUT:
+
+        - old, a SurfaceComplex which has been packed
+        - cmap, a dictionary from circles of old to circles of self
+        - optionally a telemetry.Recorder and the maximum number of
+          iterations, by default as for packing.accelerate
+
+        The circles in the image of cmap start with their old radii and the
+        remaining circles start with the average radius of their packed
+        neighbours. Only the circles which are not in the image of cmap, and
+        their neighbours, are relaxed, by the accelerated iteration of
+        packing.accelerate with the other circles held fixed. If this does
+        not bring the angle sum error under SurfaceComplex.error then the
+        circles which are still out of tolerance, and their neighbours, are
+        added and the relaxation continues. After a local edit the work is
+        proportional to the size of the edit rather than the size of the
+        complex. A RuntimeError is raised if the relaxations take more
+        than maxiter iterations in all.
+
+        The function circle_map() constructs cmap from a map of half edges.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.packing_accelerated()
+        >>> phi = g.graph.copy()
+        >>> h = closedgraph.ClosedGraph(phi.codomain, [ phi.map[a] for a in g.outside ])
+        >>> t = SurfaceComplex(h)
+        >>> cmap = circle_map(s, t, phi.map)
+        >>> len(cmap) == len(s.radius)
+        True
+        >>> t.packing_warm(s, cmap)
+        >>> max( abs(s.radius[c]-t.radius[cmap[c]]) for c in s.radius ) < 0.00001
+        True
+
+        Here the circles around a vertex are left out of the map, so these
+        start from the average of their neighbours and are relaxed.
+
+        >>> patch = set( x for u in s.index().incident[s.Vcircles[0]] for x in u[:3] )
+        >>> cmap = { c:d for c, d in cmap.items() if c not in patch }
+        >>> t = SurfaceComplex(h); t.packing_warm(s, cmap)
+        >>> max( abs(s.radius[c]-t.radius[d]) for c, d in circle_map(s, t, phi.map).items() ) < 0.00001
+        True
+
+        The subdivision of a closed graph with Neumann boundary conditions
+        can't be packed (see multigrid()).
+
+        >>> f, inc = g.subdivision()
+        >>> u = SurfaceComplex(f); u.packing_warm(s, {}, maxiter=100)
+        Traceback (most recent call last):
+        ...
+        RuntimeError: The packing did not converge in 100 iterations.
+
+        """
+        if self.geometry == 'Euclidean':
+            _angles = packing.euc_angles
+            _adj    = packing.euc_adj
+            upper   = None
+        elif self.geometry == 'hyperbolic':
+            _angles = packing.hyp_angles
+            _adj    = packing.hyp_adj
+            # x-radii must stay below 1.
+            upper   = 1.0
+        else:
+            raise RuntimeError, "This can't happen."
+
+        self.index()
+        incident = self.incident
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        n = len(circles)
+        if maxiter == None:
+            maxiter = max(10000, 100*n)
+
+        def ring(cs):
+            return { t[i] for c in cs for t in incident[c] for i in range(3) }
+
+        radius = dict()
+        for c in cmap:
+            if c in old.radius:
+                radius[cmap[c]] = old.radius[c]
+
+        new = [ c for c in circles if c not in radius ]
+        for c in new:
+            known = [ radius[x] for x in ring([c]) if x in radius ]
+            if known:
+                radius[c] = sum(known)/len(known)
+        start, fixed = self.initial_radii()
+        for c in new:
+            if c not in radius:
+                radius[c] = start[c]
+
+        # The fixed circles are those used by packing_accelerated.
+        for c in fixed:
+            if c in new:
+                radius[c] = fixed[c]
+
+        tri = packing.triangle_array(circles, self.triangles, self.tri)
+        target = numpy.array([ c.angle for c in circles ], dtype=float)
+        interior = numpy.array([ not c.boundary for c in circles ], dtype=bool)
+        adjustable = numpy.array([ c not in fixed for c in circles ], dtype=bool)
+        r = numpy.array([ radius[c] for c in circles ], dtype=float)
+
+        def spread(m):
+            # The circles of the triangles which meet the circles in m.
+            out = numpy.zeros(n, dtype=bool)
+            out[tri[m[tri].any(axis=1)].ravel()] = True
+            return out
+
+        new = set(new)
+        active = spread(numpy.array([ c in new for c in circles ], dtype=bool))
+        active &= adjustable
+        tol = SurfaceComplex.error
+
+        # The iterations are numbered across all the relaxations.
+        log = telemetry.Recorder(lambda it:
+                recorder(it._replace(count=len(log.history))) if recorder != None else None)
+
+        def fail():
+            if recorder != None:
+                recorder.finish('packing_warm', False)
+            raise RuntimeError, "The packing did not converge in %d iterations." % maxiter
+
+        converged = False
+        while not converged:
+            if active.any():
+                # Relax the active circles, holding their neighbours fixed.
+                sub = tri[active[tri].any(axis=1)]
+                used, local = numpy.unique(sub, return_inverse=True)
+                local = local.reshape(sub.shape)
+                try:
+                    r[used] = packing.accelerate(local, target[used], active[used],
+                                r[used], ~active[used], _angles, _adj, tol/2,
+                                SurfaceComplex.tolerance, upper, log,
+                                maxiter - len(log.history))
+                except RuntimeError:
+                    fail()
+
+            # Check the global error.
+            ae = (target - packing.angle_sums(tri, r, _angles))
+            ae[~interior] = 0
+            error = numpy.sqrt(numpy.dot(ae,ae))
+            converged = error < SurfaceComplex.error
+            if not converged:
+                # Some circle has an error at least error/sqrt(n).
+                bad = numpy.abs(ae)*sqrt(n) > tol
+                grow = spread(bad) & adjustable & ~active
+                if grow.any():
+                    active |= grow
+                elif active.any():
+                    tol = tol/2
+                else:
+                    # The circles out of tolerance can't be adjusted.
+                    fail()
+
+        if recorder != None:
+            recorder.finish('packing_warm', True)
+        self.radius = { c:float(r[i]) for i, c in enumerate(circles) }
+
+    def packing_disc(self, recorder=None, top=None, start=None):
+        """Packs a triangulation of the sphere as in packing.packing_spherical.
+
+        The circle top, by default the circle with the most neighbours, is
+        removed and the rest is given the maximal packing of the disc,
+        starting from the dictionary of hyperbolic radii start. The removed
+        circle and the hyperbolic radii are kept as self.top and
+        self.hradius for packing_subdivision.
+        """
+        if self.geometry != 'spherical':
+            raise ValueError, "This is only for spherical geometry."
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        if top == None:
+            top = packing.puncture(circles, self.triangles)
+        self.top = top
+        self.hradius = packing.packing_disc(circles, self.triangles, top,
+                        self.error, self.tolerance, recorder, start,
+                        SurfaceComplex.smoothing)
+        self.radius = packing.disc_to_sphere(circles, self.triangles, top, self.hradius)
+
+    def packing_subdivision(self, coarse, inc, recorder=None):
+        """Packs a subdivision starting from the packing before subdivision.
+
+        INPUT:
+
+        - coarse, a SurfaceComplex which has been packed
+        - inc, the map of half edges returned by ClosedGraph.subdivision()
+
+        The circles of coarse are taken to circles of self by
+        subdivision_map(). These start with half of their old radius (in
+        hyperbolic geometry this halves the hyperbolic radius) and the
+        remaining circles start with the average radius of the neighbours
+        which have been given a radius. These are close enough to the
+        packing for Newton's method, packing.packing_newton, which only
+        needs a handful of steps.
+
+        In spherical geometry the image of coarse.top is removed and the
+        hyperbolic radii of the maximal packing of coarse are used in the
+        same way, see packing_disc. Halving the Euclidean radius of a
+        circle in the disc takes the hyperbolic radius h to
+        atanh(tanh(h)/2), approximately. The horocycles of the two packings
+        are different circles so these are given a radius by their
+        neighbours, and SurfaceComplex.smoothing controls the accelerated
+        iteration which is run before Newton's method.
+
+        The function multigrid() applies this repeatedly.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure(geometry='hyperbolic', boundary='Dirichlet')
+        >>> s = SurfaceComplex(g); s.packing_accelerated()
+        >>> h, inc = g.subdivision()
+        >>> t = SurfaceComplex(h); t.packing_subdivision(s, inc)
+        >>> u = SurfaceComplex(h); u.packing_accelerated()
+        >>> max( abs(t.radius[c]-u.radius[c]) for c in u.radius ) < 0.00001
+        True
+
+        """
+        self.index()
+        incident = self.incident
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        cmap = subdivision_map(coarse, self, inc)
+
+        if self.geometry == 'Euclidean':
+            radius = { cmap[c]:coarse.radius[c]/2 for c in cmap }
+        elif self.geometry == 'hyperbolic':
+            # These are x-radii, exp(-2h).
+            radius = { cmap[c]:sqrt(coarse.radius[c]) for c in cmap }
+        elif self.geometry == 'spherical':
+            radius = { cmap[c]:atanh(tanh(h)/2) for c, h in coarse.hradius.items() if not isinf(h) }
+        else:
+            raise RuntimeError, "This can't happen."
+
+        new = [ c for c in circles if c not in radius ]
+        while new:
+            wave = dict()
+            for c in new:
+                known = [ radius[x] for t in incident[c] for x in t[:3] if x in radius ]
+                if known:
+                    wave[c] = sum(known)/len(known)
+            if not wave:
+                break
+            radius.update(wave)
+            new = [ c for c in new if c not in radius ]
+
+        if self.geometry == 'spherical':
+            self.packing_disc(recorder, cmap[coarse.top], radius)
+            return
+
+        start, fixed = self.initial_radii()
+        start.update(radius)
+
+        self.radius = packing.packing_newton(self, recorder=recorder, start=start)
+
     def edge(self):
 
         circles = self.Vcircles + self.Ecircles + self.Fcircles
@@ -318,15 +805,20 @@ class SurfaceComplex(object):
             #self.packing_basic()
             self.packing_accelerated()
         radius = self.radius
+        self.index()
 
         centre = {c:None for c in circles}
 
         if self.boundary_condition == 'Dirichlet':
             #Set first two centres
             u = self.outside[0]
-            tr = [ t for t in self.triangles if t[3] and u in t[0].halfedges ][0]
+            tr = [ t for t in self.incident[self.vertex_circle[u]]
+                   if t[3] and u in t[0].halfedges ][0]
             centre[tr[0]] = complex(0)
-            centre[tr[1]] = complex(radius[tr[0]]+radius[tr[1]])
+            if self.geometry == 'hyperbolic':
+                centre[tr[1]] = complex(hyp_distance(radius[tr[0]],radius[tr[1]]))
+            else:
+                centre[tr[1]] = complex(radius[tr[0]]+radius[tr[1]])
 
         elif self.boundary_condition == 'Neumann':
             ##Set boundary centres
@@ -334,7 +826,8 @@ class SurfaceComplex(object):
             #for x in pos:
             #    centre[x] = pos[x]
             u = self.outside[0]
-            tr = [ t for t in self.triangles if t[3] and u in t[0].halfedges ][0]
+            tr = [ t for t in self.incident[self.vertex_circle[u]]
+                   if t[3] and u in t[0].halfedges ][0]
             centre[tr[0]] = complex(0)
             centre[tr[1]] = complex(radius[tr[0]]+radius[tr[1]])
 
@@ -343,12 +836,51 @@ class SurfaceComplex(object):
 
         self.centre = centre
 
-    def layout(self):
+    def layout(self, drift=False):
+        """Places the circles. The first two centres are placed by edge()
+        and the rest by packing.place_triangles(). If drift is True the circles
+        are placed in the order which keeps the chains of placements
+        short, which reduces the accumulated rounding error.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.layout()
+        >>> t = SurfaceComplex(g); t.radius = s.radius; t.layout(drift=True)
+        >>> max( abs(s.centre[c]-t.centre[c]) for c in s.centre ) < 0.00001
+        True
+
+        With Euclidean geometry, Neumann boundary conditions and at least
+        conjgrad_size circles the centres are found by conjgrad() and
+        then refine(). This is kept if every residual of refine() is
+        within SurfaceComplex.error of the largest radius, and otherwise
+        the circles are placed by triangles as above.
+
+        >>> u = SurfaceComplex(g); u.radius = s.radius; u.conjgrad_size = 0; u.layout()
+        >>> max( abs(x) for x in u.residual.values() ) < u.error * max(u.radius.values())
+        True
+        >>> max( abs(s.centre[c]-u.centre[c]) for c in s.centre ) < 0.0001
+        True
+
+        """
         circles = self.Vcircles + self.Ecircles + self.Fcircles
         #Place the remaining circles
-        if not hasattr(self,'centre'):
+        if not hasattr(self,'radius'):
             self.packing_accelerated()
 
+        if self.geometry == 'spherical':
+            self.sph_layout(drift)
+            return
+
+        if self.geometry == 'Euclidean' and self.boundary_condition == 'Neumann' \
+           and len(circles) >= self.conjgrad_size:
+            self.conjgrad()
+            res = self.refine()
+            if max( abs(x) for x in res.values() ) <= self.error * max(self.radius.values()):
+                self.get_bbox()
+                return
+            del self.centre, self.residual
+
         def euc_place(x,t):
             z, w = centre[x[0]], centre[x[1]]
             r, s = radius[x[0]], radius[x[1]]
@@ -356,8 +888,14 @@ class SurfaceComplex(object):
             theta = acos( 1 - 2*s*t/((r+s)*(r+t)) )
             return rect((r+t)/(r+s),theta)*(w-z)+z
 
-        def hyp_place(x):
-            raise NotImplementedError, "Hyperbolic geometry has not been implemented."
+        def hyp_place(x,t):
+            # Move z to the origin by a Mobius transformation of the disc.
+            z, w = centre[x[0]], centre[x[1]]
+            r, s = radius[x[0]], radius[x[1]]
+            theta = hyp_tri01([r,s,t])[0]
+            m = (w-z)/(1-z.conjugate()*w)
+            d = rect(hyp_distance(r,t), phase(m)+theta)
+            return (d+z)/(1+z.conjugate()*d)
 
         if self.geometry == 'Euclidean':
             _place = euc_place
@@ -372,22 +910,8 @@ class SurfaceComplex(object):
             self.edge()
 
         centre = self.centre
-        
-        done = False
-        while not done:
-            done = True
-            for tri in self.triangles:
-                pt = [ tri[i] for i in xrange(3) ]
-                pc = [ centre[a] for a in pt ]
-                if pc.count(None) == 1:
-                    done = False
-                    i = pc.index(None)
-                    if tri[3]:
-                        x = (pt[i-1],pt[i-2])
-                    else:
-                        x = (pt[i-2],pt[i-1])
-                    t = radius[tri[i]]
-                    centre[tri[i]] = _place(x,t)
+        packing.place_triangles(self.triangles, centre,
+                                lambda x, c: _place(x,radius[c]), drift)
 
         self.centre = centre
 
@@ -396,10 +920,82 @@ class SurfaceComplex(object):
         #print max( abs(centre[x]-rimpos[x]) for x in rimpos.keys() )
         #print max( abs(centre[x])-abs(rimpos[x]) for x in rimpos.keys() )
 
-        self.bbox = ( min([ centre[c].real for c in circles ]),\
-                      min([ centre[c].imag for c in circles ]),\
-                      max([ centre[c].real for c in circles ]),\
-                      max([ centre[c].imag for c in circles ]) )
+        if self.geometry == 'hyperbolic':
+            # This is the Poincare disc.
+            self.bbox = (-1.0, -1.0, 1.0, 1.0)
+            return
+
+        self.get_bbox()
+
+    def get_bbox(self):
+        """The bounding box of the centres."""
+        centre = self.centre
+        self.bbox = ( min([ centre[c].real for c in centre ]),\
+                      min([ centre[c].imag for c in centre ]),\
+                      max([ centre[c].real for c in centre ]),\
+                      max([ centre[c].imag for c in centre ]) )
+
+    def refine(self, maxiter=10):
+        """Refines the centres after layout() by least squares.
+
+        The centres placed by layout() are found one triangle at a time,
+        so the errors accumulate along the chains of placements. This
+        treats every tangency as a distance constraint and moves all the
+        centres at once, see packing.refine_centres.
+
+        OUTPUT: A dictionary which gives the residual
+        |z_a - z_b| - (r_a + r_b) for each pair (a,b) of tangent circles.
+        This is also kept as self.residual.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.layout()
+        >>> res = s.refine()
+        >>> max( abs(x) for x in res.values() ) < 0.0001
+        True
+
+        """
+        if self.geometry != 'Euclidean':
+            raise NotImplementedError, "Only Euclidean geometry has been implemented."
+        if not hasattr(self, 'centre'):
+            self.layout()
+
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        tri = packing.triangle_array(circles, self.triangles, self.tri)
+        r = numpy.array([ self.radius[c] for c in circles ])
+        z = numpy.array([ self.centre[c] for c in circles ])
+        z, res = packing.refine_centres(tri, r, z, maxiter)
+
+        self.centre = { c:complex(z[i]) for i, c in enumerate(circles) }
+        pairs = packing.tangencies(tri)
+        self.residual = { (circles[i],circles[j]):float(x) for (i, j), x in zip(pairs, res) }
+        return self.residual
+
+    def sph_layout(self, drift=False):
+        """The layout in spherical geometry. The centres on the unit
+        sphere are self.sphere and self.centre is the centre of each
+        circle after stereographic projection.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure(geometry='spherical')
+        >>> s = SurfaceComplex(g); s.layout()
+        >>> a, b = s.triangles[0][:2]
+        >>> abs(acos(sum(s.sphere[a]*s.sphere[b])) - s.radius[a] - s.radius[b]) < 0.00001
+        True
+
+        """
+        circles = self.Vcircles + self.Ecircles + self.Fcircles
+        self.sphere = packing.layout_spherical(circles, self.triangles, self.radius, drift)
+        self.centre = { c:self.euclidean_circle(c)[0] for c in circles }
+
+        # The largest circle is the outside of its projection.
+        inner = [ c for c in circles if self.sphere[c][2] < cos(self.radius[c]) ]
+        self.bbox = ( min([ self.centre[c].real for c in inner ]),\
+                      min([ self.centre[c].imag for c in inner ]),\
+                      max([ self.centre[c].real for c in inner ]),\
+                      max([ self.centre[c].imag for c in inner ]) )
 
     def conjgrad(self):
         """This is an iterative procedure for finding the positions
@@ -409,45 +1005,41 @@ class SurfaceComplex(object):
         The idea is that once the boundary circles are placed the
         positions of the remaining circles are the solution to a linear
         equation. This follows from the harmonic property described in
-        'Circle packing'."""
-        # x, r, p, Ap are vectors stored as dictionaries.
+        'Circle packing'. The boundary centres are given by rim() and
+        the linear equations, with the transition probabilities (90) on
+        page 237, are solved by packing.harmonic_centres. This assumes
+        Euclidean geometry and Neumann boundary conditions.
+
+        For large packings this is used by layout() in place of placing
+        the circles one triangle at a time, see SurfaceComplex.conjgrad_size.
+
+        EXAMPLES:
+
+        >>> g = spider.RibbonGraph.polygon(5).closure()
+        >>> s = SurfaceComplex(g); s.packing_accelerated()
+        >>> centre = s.conjgrad()
+        >>> t = s.triangles[0]
+        >>> abs( abs(centre[t[0]]-centre[t[1]]) - s.radius[t[0]] - s.radius[t[1]] ) < 0.0001
+        True
+
+        """
+        if self.geometry != 'Euclidean' or self.boundary_condition != 'Neumann':
+            raise NotImplementedError, "This assumes Euclidean geometry and Neumann boundary conditions."
+        if not hasattr(self, 'radius'):
+            self.packing_accelerated()
 
         circles = self.Vcircles + self.Ecircles + self.Fcircles
-        int_circles = [ c for c in circles if not c.boundary ]
+        pos = self.rim()
 
-        if not hasattr(self,'centre'):
-            self.rim()
-            self.layout()
-        x = self.centre
-
-        # Construct neighbours with cyclic ordering.
-        
-        def multiply(v):
-            # Calculates A * v for a vector v
-            u = { c:0 for c in int_circles }
-            # Do a sum over edges
-            return u
-
-        def transition(u,v,a,b):
-            """This is (90) on page 237 of 'Circle Packing'."""
-            s = u+v
-            return (sqrt(u*v)/s)*(sqrt(a/(s+a))+sqrt(b/(s+b)))
-        
-        Ax = multiply(x)
-        # b has not been defined
-        r = { c:b[c]-Ax[c] for c in int_circles }
-        p = r
-        rsold = sum( a*a for a in r.values() )
-        while rsold > error:
-            Ap = multiply(p)
-            alpha = rsold / sum( p[c]*Ap[c] for c in int_circles )
-            x = { c:x[c]+alpha*p[c] for c in int_circles }
-            r = { c:r[c]-alpha*Ap[c] for c in int_circles }
-            rsnew = sum( a*a for a in r.values() )
-            rs = rsnew / rsold
-            p = { c:r[c]+rs*p[c] for c in int_circles }
-            rsold = rsnew
-        return x
+        tri = packing.triangle_array(circles, self.triangles, self.tri)
+        r = numpy.array([ self.radius[c] for c in circles ])
+        fixed = numpy.array([ c in pos for c in circles ], dtype=bool)
+        z = numpy.array([ pos.get(c,0) for c in circles ], dtype=complex)
+        z = packing.harmonic_centres(tri, r, fixed, z, self.error)
+
+        self.centre = { c:complex(z[i]) for i, c in enumerate(circles) }
+        self.get_bbox()
+        return self.centre
     
     def report(self):
         """
@@ -575,6 +1167,304 @@ class SurfaceComplex(object):
     def __latex__(self):
         self.show('Tikz','stdout')
 
+def circle_map(old, new, D):
+    """Constructs the map of circles used by SurfaceComplex.packing_warm.
+
+    INPUT:
+
+    - old, a SurfaceComplex
+    - new, a SurfaceComplex
+    - D, a dictionary from half edges of old to half edges of new,
+      for example the map of the Embedding returned by justgraph.copy()
+
+    OUTPUT: A dictionary from circles of old to circles of new
+
+    A circle of old is mapped to the circle of new of the same kind whose
+    half edges are the images of its half edges. Circles whose cell has been
+    changed by an edit are left out.
+    """
+    new.index()
+    lookup = ( (old.Vcircles, new.vertex_circle),
+               (old.Ecircles, new.edge_circle),
+               (old.Fcircles, new.face_circle) )
+    cmap = dict()
+    for cs, nc in lookup:
+        for c in cs:
+            if not all( a in D for a in c.halfedges ):
+                continue
+            image = frozenset( D[a] for a in c.halfedges )
+            d = nc.get(next(iter(image)))
+            if d != None and d.halfedges == image:
+                cmap[c] = d
+    return cmap
+
+def subdivision_map(coarse, fine, inc):
+    """Constructs the map of circles used by SurfaceComplex.packing_subdivision.
+
+    INPUT:
+
+    - coarse, a SurfaceComplex
+    - fine, the SurfaceComplex of its subdivision
+    - inc, the map of half edges returned by ClosedGraph.subdivision()
+
+    OUTPUT: A dictionary from circles of coarse to circles of fine
+
+    A vertex circle goes to the circle of the same vertex, an edge circle
+    goes to the circle of the new vertex in the middle of the edge and a
+    face circle goes to the circle of the face in the middle of the face.
+    """
+    fine.index()
+    cmap = dict()
+    for c in coarse.Vcircles:
+        a = next(iter(c.halfedges))
+        cmap[c] = fine.vertex_circle[inc[a]]
+    for c in coarse.Ecircles:
+        a = next(iter(c.halfedges))
+        cmap[c] = fine.vertex_circle[inc[a].e]
+    for c in coarse.Fcircles:
+        a = next(iter(c.halfedges))
+        cmap[c] = fine.face_circle[inc[a].e.c.c]
+    return cmap
+
+def multigrid(gc, levels=1, recorder=None):
+    """Packs repeated subdivisions of a closed graph.
+
+    INPUT: A ClosedGraph, the number of subdivisions and optionally a
+    telemetry.Recorder
+
+    OUTPUT: A list of packed SurfaceComplex, one for each level starting
+    with gc
+
+    Each level is packed by SurfaceComplex.packing_subdivision starting
+    from the packing of the level before, as in the sequence of hexagonal
+    refinements used by Bowers & Stephenson (see constellation.py).
+    Subdivision loses the corners of the outside face so this needs
+    spherical geometry or Dirichlet boundary conditions.
+
+    EXAMPLES:
+
+    >>> g = spider.RibbonGraph.polygon(5).closure(geometry='hyperbolic', boundary='Dirichlet')
+    >>> [ len(s.radius) for s in multigrid(g, 2) ]
+    [41, 161, 641]
+
+    """
+    if gc.geometry != 'spherical' and gc.boundary_condition != 'Dirichlet':
+        raise NotImplementedError, "Subdivision needs Dirichlet boundary conditions."
+
+    sc = SurfaceComplex(gc)
+    sc.packing_accelerated(backend='numpy', recorder=recorder)
+    result = [sc]
+    for i in range(levels):
+        gc, inc = gc.subdivision()
+        fine = SurfaceComplex(gc)
+        fine.packing_subdivision(sc, inc, recorder)
+        result.append(fine)
+        sc = fine
+    return result
+
+def encode(gc):
+    """Encodes a closed graph by arrays of integers for pack_many().
+
+    INPUT: A ClosedGraph
+
+    OUTPUT: A tuple which is cheap to pickle
+
+    The circles are numbered in the order Vcircles + Ecircles + Fcircles
+    and the half edges are numbered in the order they are met. The
+    triangles are an array of circle numbers, three for each triangle,
+    with an array of orientations. The half edges of circle i are the
+    entries of cells from offsets[i] to offsets[i+1].
+    """
+    circles = gc.Vcircles + gc.Ecircles + gc.Fcircles
+    index = { c:i for i, c in enumerate(circles) }
+    number = dict()
+    cells = array('i')
+    offsets = array('i', [0])
+    for c in circles:
+        for a in c.halfedges:
+            cells.append( number.setdefault(a, len(number)) )
+        offsets.append(len(cells))
+
+    kinds = [ (c.type, c.angle, c.boundary) for c in circles ]
+    sizes = (len(gc.Vcircles), len(gc.Ecircles), len(gc.Fcircles))
+    tri = getattr(gc, 'tri', None)
+    if tri == None:
+        tri = array('i', [ index[t[i]] for t in gc.triangles for i in range(3) ])
+    flags = array('b', [ t[3] for t in gc.triangles ])
+    outside = array('i', [ number[a] for a in gc.outside ])
+    return (gc.geometry, gc.boundary_condition, sizes, kinds,
+            cells, offsets, tri, flags, outside)
+
+def decode(code):
+    """Constructs a SurfaceComplex from the output of encode(). The
+    half edges of the circles are the integers used by encode().
+
+    EXAMPLES:
+
+    >>> g = spider.RibbonGraph.polygon(5).closure()
+    >>> s = decode(encode(g)); s.packing_accelerated()
+    >>> t = SurfaceComplex(g); t.packing_accelerated()
+    >>> sorted(s.radius.values()) == sorted(t.radius.values())
+    True
+
+    """
+    geometry, bc, sizes, kinds, cells, offsets, tri, flags, outside = code
+    circles = [ closedgraph.Circle(t, angle, b, frozenset(cells[offsets[i]:offsets[i+1]]))
+                for i, (t, angle, b) in enumerate(kinds) ]
+    triangles = [ (circles[tri[3*k]], circles[tri[3*k+1]], circles[tri[3*k+2]], bool(flags[k]))
+                  for k in range(len(flags)) ]
+    nV, nE, nF = sizes
+    gc = Complex(circles[:nV], circles[nV:nV+nE], circles[nV+nE:], triangles,
+                 list(outside), geometry, bc, None)
+    return SurfaceComplex(gc)
+
+# The queue on which the workers of pack_many() report the jobs they start.
+_started = None
+
+def _start_worker(queue):
+    """Initialises a worker process of pack_many()."""
+    global _started
+    _started = queue
+
+def _pack_job(job, index=None):
+    """Packs and lays out one encoded closed graph for pack_many().
+    Any exception is caught and returned as the error. In a worker of
+    pack_many() the index of the job, the time and the process id are
+    put on the queue _started first."""
+    if _started != None:
+        _started.put((index, time(), os.getpid()))
+    code, timeout, backend = job
+
+    def check(it):
+        if timeout != None and time() - recorder.start > timeout:
+            raise RuntimeError, "Timed out after %s seconds." % timeout
+    recorder = telemetry.Recorder(check)
+
+    try:
+        sc = decode(code)
+        sc.packing_accelerated(backend, recorder)
+        sc.layout()
+        circles = sc.Vcircles + sc.Ecircles + sc.Fcircles
+        radius = array('d', [ sc.radius[c] for c in circles ])
+        centre = [ sc.centre[c] for c in circles ]
+        error = None
+    except Exception:
+        radius, centre = None, None
+        error = traceback.format_exc()
+    summary = recorder.summary()
+    del summary['history']
+    return radius, centre, error, summary
+
+def pack_many(graphs, workers=None, timeout=None, backend='numpy', poll=0.05):
+    """Packs and lays out a list of closed graphs using a pool of processes.
+
+    INPUT:
+
+    - A list of ClosedGraph
+    - The number of worker processes. The default is the number of CPUs
+      and with 1 the graphs are packed in this process.
+    - The time allowed for the packing of each graph, in seconds
+    - The backend for SurfaceComplex.packing_accelerated
+    - The interval, in seconds, at which the workers are checked
+
+    OUTPUT: A list of Packed, in the same order as graphs
+
+    The graphs are sent to the workers by encode(). For each graph the
+    result has the radius and centre of each circle, as dictionaries
+    keyed by the circles of the graph. If the packing fails or takes too
+    long then these are None and error is the traceback. In either case
+    summary is the summary of the telemetry.Recorder without the history.
+
+    The packing checks the time at each iteration. With more than one
+    worker each job reports to this process when it starts, and every
+    poll seconds this process checks the jobs which have started. If a
+    job has taken more than timeout seconds since it started, including
+    the layout, or the worker running it has died, for instance because
+    it was killed for lack of memory, then the pool is terminated and
+    the remaining graphs are packed in a new pool. The summary of that
+    job is then None.
+
+    EXAMPLES:
+
+    >>> gs = [ spider.RibbonGraph.polygon(n).closure() for n in range(3,7) ]
+    >>> result = pack_many(gs, workers=2)
+    >>> [ x.error for x in result ]
+    [None, None, None, None]
+    >>> s = SurfaceComplex(gs[0]); s.packing_accelerated()
+    >>> max( abs(result[0].radius[c]-s.radius[c]) for c in s.radius ) < 0.00001
+    True
+
+    The subdivision of a closed graph with Neumann boundary conditions
+    can't be packed (see multigrid()).
+
+    >>> h, inc = gs[2].subdivision()
+    >>> result = pack_many([h], workers=1, timeout=1)
+    >>> result[0].radius, result[0].error.splitlines()[-1]
+    (None, 'RuntimeError: Timed out after 1 seconds.')
+    >>> result = pack_many([h, gs[0]], workers=2, timeout=1)
+    >>> [ x.radius == None for x in result ]
+    [True, False]
+
+    """
+    jobs = [ (encode(gc), timeout, backend) for gc in graphs ]
+    if workers == 1:
+        output = map(_pack_job, jobs)
+    else:
+        output = [None] * len(jobs)
+        todo = range(len(jobs))
+        while todo:
+            # The reports are sent at once, so they are not lost if a worker dies.
+            queue = SimpleQueue()
+            pool = multiprocessing.Pool(workers, _start_worker, (queue,))
+            pending = dict( (i, pool.apply_async(_pack_job, (jobs[i], i))) for i in todo )
+            todo = []
+            started = dict()
+            failed = None
+            try:
+                while pending and failed == None:
+                    while not queue.empty():
+                        i, t, pid = queue.get()
+                        started[i] = (t, pid)
+                    alive = set( p.pid for p in pool._pool if p.is_alive() )
+                    for i in sorted(pending):
+                        if pending[i].ready():
+                            output[i] = pending.pop(i).get()
+                        elif i in started:
+                            t, pid = started[i]
+                            if not pid in alive:
+                                failed = i, "RuntimeError: The worker process died."
+                            elif timeout != None and time() - t > timeout:
+                                failed = i, "RuntimeError: Timed out after %s seconds." % timeout
+                            if failed != None:
+                                break
+                    else:
+                        if pending:
+                            sleep(poll)
+                if failed != None:
+                    i, error = failed
+                    output[i] = (None, None, error, None)
+                    del pending[i]
+                    for j in sorted(pending):
+                        if pending[j].ready():
+                            output[j] = pending[j].get()
+                        else:
+                            todo.append(j)
+            finally:
+                if failed != None:
+                    pool.terminate()
+                else:
+                    pool.close()
+                pool.join()
+
+    result = []
+    for gc, (radius, centre, error, summary) in zip(graphs, output):
+        if error == None:
+            circles = gc.Vcircles + gc.Ecircles + gc.Fcircles
+            radius = dict(zip(circles, radius))
+            centre = dict(zip(circles, centre))
+        result.append(Packed(radius, centre, error, summary))
+    return result
+
 # This is to run the tests in the examples.
 # http://docs.python.org/library/doctest.html
 if __name__ == "__main__":
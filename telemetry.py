@@ -0,0 +1,99 @@
+#*****************************************************************************
+#       Copyright (C) 2013 Bruce Westbury Bruce.Westbury@warwick.ac.uk
+#
+#  Distributed under the terms of the GNU General Public License (GPL)
+#                  http://www.gnu.org/licenses/
+#*****************************************************************************
+
+"""
+Recording the progress of the circle packing iterations.
+
+A Recorder is passed to one of the packing methods of a SurfaceComplex.
+At the end of each iteration the packing method calls the recorder with
+an Iteration. This records:
+
+- count: the iteration number
+- error: the L2 norm of the angle sum errors
+- factor: the acceleration factor (or the damping factor in Newton's method)
+- angles, update, extrapolation: the wall time in seconds for each phase
+- outside: the number of circles whose angle sum is out of tolerance
+
+EXAMPLES:
+
+>>> r = Recorder()
+>>> r(Iteration(1, 0.5, None, 0.01, 0.01, 0.0, 3))
+>>> r(Iteration(2, 0.01, 0.02, 0.01, 0.01, 0.0, 1))
+>>> r.finish('example', True)
+>>> r.summary()['iterations']
+2
+
+"""
+
+import json
+import time
+
+from collections import namedtuple
+
+Iteration = namedtuple('Iteration',['count','error','factor','angles','update',\
+                                    'extrapolation','outside'])
+
+class Recorder(object):
+    """Records the iterations of a packing method.
+
+    INPUT: An optional function which is called with each Iteration.
+    This can be used to report progress while a long job is running.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.history = []
+        self.method = None
+        self.converged = None
+        self.start = time.time()
+        self.stop = None
+
+    def __call__(self, it):
+        self.history.append(it)
+        if self.callback != None:
+            self.callback(it)
+
+    def finish(self, method, converged):
+        """This is called by the packing method when it returns."""
+        self.method = method
+        self.converged = converged
+        self.stop = time.time()
+
+    def summary(self):
+        """Summarises the iterations as a dictionary. Each value is a
+        number, a string or a list so this can be written as JSON.
+        """
+        h = self.history
+        stop = self.stop if self.stop != None else time.time()
+        return {
+            'method': self.method,
+            'converged': self.converged,
+            'iterations': len(h),
+            'error': h[-1].error if h else None,
+            'outside': h[-1].outside if h else None,
+            'time': stop - self.start,
+            'angles': sum( x.angles for x in h ),
+            'update': sum( x.update for x in h ),
+            'extrapolation': sum( x.extrapolation for x in h ),
+            'history': [ x._asdict() for x in h ]
+            }
+
+    def dump(self, name=None):
+        """Writes the summary as JSON. If no file name is given then the
+        JSON is returned as a string.
+        """
+        if name == None:
+            return json.dumps(self.summary())
+        output = open(name, 'w')
+        json.dump(self.summary(), output)
+        output.close()
+
+# This is to run the tests in the examples.
+# http://docs.python.org/library/doctest.html
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()